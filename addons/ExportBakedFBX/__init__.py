@@ -15,6 +15,8 @@
 ３．FBXが出力される。
     出力過程で作業状態に変更が加わってしまうので、最後にリバートが行われる。
 	そのため、セーブ済みのファイルで無いと実行できないようにしている
+	Bake On Copy をONにした場合は、Armatureとアクションの一時的な複製に対してベイクし、
+	出力後に複製を削除するので、リバートは行われない。
 
 注意
 ・出力対象のアニメーションは、NLAトラックのみ。
@@ -25,6 +27,27 @@
 ・名前に "[DONT_BAKE]" が含まれるボーンはベイク対象外となる。
   （ベイク処理を行わずにそのままFBX出力される）
 ・オブジェクトのVisibilityなど、そもそもBlenderではベイクできないものもある。
+・Bake Workers を2以上にすると、保存済みファイルを開いたバックグラウンドのBlenderを
+  その数だけ起動して、アクションごとのサンプリングを並列に行う。
+・Restrict Sampling をONにすると、各ボーンに影響するF-Curveのキー範囲の外にあるフレームは
+  評価せずに、直前のフレームの姿勢を使用する。影響元を判断できないボーンがある場合は全フレームを評価する。
+・Skip Static Channels をONにすると、値が変化しないチャンネルはキーを1つだけにし、
+  全アクションで初期姿勢のままのチャンネルはキーを打たない。
+・FBX出力は、ベイク済みのアニメーションを1フレームずつ評価し直して書き出す。
+  Skip Mesh Deform On Export をONにすると、その間だけメッシュのモディファイアを無効にする。
+  FBX出力の内部関数を差し替える試験的な機能なので、デフォルトはOFF。評価し直し自体は無くならない。
+・Reduce Keys をONにすると、BEZIER補間のまま全フレームで許容誤差内に収まる範囲でキーを間引く。
+  間引かれるのはBlenderのアクションのキーのみで、FBX出力は全フレームをサンプリングし直すので、
+  FBXのサイズは変わらない。
+・Bake Cache をONにすると、.blendファイルの隣の "<ファイル名>.bakecache" フォルダに
+  アクションごとのサンプリング結果を保存し、変更の無いアクションはサンプリングせずに再利用する。
+・Profile をONにすると、出力の各段階の処理時間・件数をコンソールに出力する。
+  Profile Memory もONにすると、tracemallocによるPythonのピークメモリも出力する。
+  tracemallocの計測中は処理が遅くなるので、処理時間はOFFにした別の実行で計測すること。
+  Write Trace をONにすると、FBXの隣に "<ファイル名>.trace.json" を書き出す
+  （chrome://tracing や Perfetto で開ける）。
+・複数の.blendファイルを一括で出力する場合は、batch_export.py をコマンドラインから実行する。
+    blender -b --python addons/ExportBakedFBX/batch_export.py -- -o 出力フォルダ -j 並列数 "*.blend"
 """
 
 
@@ -46,11 +69,25 @@ bl_info = {
 
 if "bpy" in locals():
 	import imp
+	imp.reload(bake_profile)
+	imp.reload(driver_expr)
 	imp.reload(common_arma)
+	imp.reload(key_reduce)
+	imp.reload(bake_parallel)
+	imp.reload(bake_cache)
+	imp.reload(bake_temp)
+	imp.reload(fbx_patch)
 	imp.reload(bake_proc)
 	imp.reload(opSet_base)
 	imp.reload(opSet_export)
+from . import bake_profile
+from . import driver_expr
 from . import common_arma
+from . import key_reduce
+from . import bake_parallel
+from . import bake_cache
+from . import bake_temp
+from . import fbx_patch
 from . import bake_proc
 from . import opSet_base
 from . import opSet_export
@@ -0,0 +1,191 @@
+#
+# サンプリングしたアクションごとのTransform情報を、ディスク上にキャッシュするモジュール。
+#
+# キャッシュのキーは、アクションのF-Curveの内容と、Armatureのオブジェクトの姿勢・初期姿勢・
+# IKの設定・Constraint・Driverの内容から計算したハッシュ値。
+# 前回の出力から変更の無いアクションは、サンプリングせずに読み込む。
+# キャッシュは.blendファイルの隣のフォルダに置き、合計サイズの上限を超えた場合は
+# 最後に使用した日時が古いものから削除する。
+#
+# Constraintのターゲットとなる他のオブジェクトのアニメーション等、Armatureの外にある状態は
+# キーに含まれないので、それらを変更した場合は強制的に再ベイクすること。
+#
+
+import bpy
+import os
+import hashlib
+import numpy as np
+
+from .common_arma import *
+
+
+# キャッシュ形式のバージョン。サンプリング結果が変わる変更をした場合は上げること
+CACHE_VERSION = 1
+
+# キャッシュファイルの拡張子
+CACHE_EXT = ".npy"
+
+
+#-------------------------------------------------------
+
+# .blendファイルに対応するキャッシュフォルダ
+def cacheDirFor(blendPath):
+	directory, fileName = os.path.split(blendPath)
+	return os.path.join(directory, os.path.splitext(fileName)[0] + ".bakecache")
+
+# アクションのTransform情報のキャッシュ本体
+class BakeCache:
+	def __init__(self, dirPath, maxBytes):
+		self.dirPath = dirPath
+		self.maxBytes = maxBytes
+
+	def path(self, key):
+		return os.path.join(self.dirPath, key + CACHE_EXT)
+
+	def has(self, key):
+		return os.path.exists(self.path(key))
+
+	# キャッシュを読み込む。無い場合・壊れている場合はNone
+	def load(self, key):
+		path = self.path(key)
+		try:
+			ret = np.load(path)
+		except (OSError, ValueError):
+			return None
+		os.utime(path)		# 最終使用日時を更新
+		return ret
+
+	# キャッシュを書き込む。書き込み途中のファイルが読まれないように、一時ファイルを経由する
+	def save(self, key, transCache):
+		os.makedirs(self.dirPath, exist_ok=True)
+		path = self.path(key)
+		tmpPath = path + ".tmp"
+		with open(tmpPath, "wb") as f: np.save(f, np.asarray(transCache))
+		os.replace(tmpPath, path)
+
+	# 合計サイズが上限以下になるまで、最終使用日時が古いものから削除する
+	def evict(self):
+		if not os.path.isdir(self.dirPath): return 0
+		entries = []
+		for name in os.listdir(self.dirPath):
+			if not name.endswith(CACHE_EXT): continue
+			path = os.path.join(self.dirPath, name)
+			st = os.stat(path)
+			entries.append((st.st_mtime, st.st_size, path))
+		entries.sort()
+		total = sum(i[1] for i in entries)
+		removed = 0
+		for mtime, size, path in entries:
+			if total <= self.maxBytes: break
+			os.remove(path)
+			total -= size
+			removed += 1
+		return removed
+
+
+#-------------------------------------------------------
+
+# Armatureのうち、サンプリング結果に影響するもののハッシュ値
+def rigHash(armature, deformBoneKeys, forceRefresh):
+	h = hashlib.sha1()
+	_update(h, CACHE_VERSION, deformBoneKeys, forceRefresh)
+
+	# Armatureオブジェクトの姿勢。ワールド空間で評価するConstraintの結果が変わる
+	_update(h, armature.parent.name if armature.parent else None, armature.parent_type, armature.parent_bone)
+	h.update(np.array(armature.matrix_world, dtype=np.float32).tobytes())
+
+	# 初期姿勢
+	h.update(getMatrixArray(armature.data.bones, "matrix_local").tobytes())
+	for bone in armature.data.bones:
+		_update(h,
+			bone.name, bone.parent.name if bone.parent else None, bone.use_connect,
+			bone.use_inherit_rotation, bone.inherit_scale, bone.use_local_location )
+
+	# ポーズ位置（REST_POSITIONでは初期姿勢のまま）と、IKソルバーの設定
+	pose = armature.pose
+	_update(h,
+		armature.data.pose_position, pose.ik_solver,
+		_rnaValues(pose.ik_param) if pose.ik_param is not None else None )
+
+	# IKの設定・Constraintと、Driverから参照されうるカスタムプロパティ
+	for bone in pose.bones:
+		_update(h, bone.name, bone.rotation_mode, _idProps(bone), _ikValues(bone))
+		for cns in bone.constraints: _update(h, _rnaValues(cns))
+
+	# Driver
+	for animData in (armature.animation_data, armature.data.animation_data):
+		if animData is None: continue
+		for fcu in animData.drivers:
+			_hashFCurve(h, fcu)
+			drv = fcu.driver
+			_update(h, drv.type, drv.expression, drv.use_self)
+			for var in drv.variables:
+				_update(h, var.type, var.name)
+				for tgt in var.targets: _update(h, _rnaValues(tgt))
+	return h.hexdigest()
+
+# アクションのキャッシュのキー
+def actionKey(action, rigKey):
+	h = hashlib.sha1()
+	_update(h, rigKey)
+	for fcu in action.fcurves: _hashFCurve(h, fcu)
+	return h.hexdigest()
+
+# F-Curveの内容をハッシュに加える
+def _hashFCurve(h, fcu):
+	pnts = fcu.keyframe_points
+	_update(h, fcu.data_path, fcu.array_index, fcu.extrapolation, fcu.mute, len(pnts))
+	for prop in ("co", "handle_left", "handle_right"):
+		buf = np.empty(len(pnts)*2, dtype=np.float32)
+		pnts.foreach_get(prop, buf)
+		h.update(buf.tobytes())
+	for prop in ("interpolation", "easing"):
+		buf = np.empty(len(pnts), dtype=np.int32)
+		pnts.foreach_get(prop, buf)
+		h.update(buf.tobytes())
+	for prop in ("back", "amplitude", "period"):
+		buf = np.empty(len(pnts), dtype=np.float32)
+		pnts.foreach_get(prop, buf)
+		h.update(buf.tobytes())
+	for mod in fcu.modifiers: _update(h, _rnaValues(mod))
+
+def _update(h, *vals):
+	h.update(repr(vals).encode("utf-8"))
+
+# RNAの全プロパティの値を、比較可能な文字列にする。
+# 読み取り専用の値（Constraintの残差等の評価結果）は含めない
+def _rnaValues(struct, depth=0):
+	ret = []
+	for prop in struct.bl_rna.properties:
+		key = prop.identifier
+		if key == "rna_type": continue
+		if prop.is_readonly and prop.type not in ('POINTER', 'COLLECTION'): continue
+		val = getattr(struct, key, None)
+		if prop.type == 'POINTER':
+			val = val.name_full if isinstance(val, bpy.types.ID) else None
+		elif prop.type == 'COLLECTION':
+			val = [_rnaValues(i, depth+1) for i in val] if depth < 2 else len(val)
+		elif getattr(prop, "is_array", False):
+			val = repr(val[:])
+		ret.append((key, val))
+	return repr(ret)
+
+# ポーズボーンのIKの設定（ik_stretch, lock_ik_x, use_ik_limit_x, ik_min_x 等）の値
+def _ikValues(bone):
+	ret = []
+	for prop in bone.bl_rna.properties:
+		key = prop.identifier
+		if key.startswith(("ik_", "lock_ik_", "use_ik_")):
+			val = getattr(bone, key)
+			ret.append((key, val[:] if getattr(prop, "is_array", False) else val))
+	return repr(ret)
+
+# カスタムプロパティの値
+def _idProps(struct):
+	ret = []
+	for k in struct.keys():
+		val = struct[k]
+		if hasattr(val, "to_dict"): val = val.to_dict()
+		elif hasattr(val, "to_list"): val = val.to_list()
+		ret.append((k, val))
+	return repr(ret)
@@ -0,0 +1,182 @@
+#
+# アクションのサンプリングを、複数のバックグラウンドBlenderプロセスで並列に行うモジュール。
+#
+# 保存済みの.blendファイルを各ワーカープロセスで開き直し、担当するアクションだけを
+# サンプリングして、ボーンごとのローカル行列をfloat32配列(.npy)として一時フォルダに書き出す。
+# 親プロセスはそれをアクションごとにメモリマップして、キーフレームの書き込みに使用する。
+#
+
+import bpy
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+
+from .common_arma import *
+
+
+#-------------------------------------------------------
+
+# 親プロセス側の処理。
+# actionsをworkerCount個のワーカーに分けてサンプリングし、結果を一時フォルダに置いたまま
+# WorkerSamplesとして返す。ワーカーが失敗した場合はRuntimeErrorを投げる。
+# keyRangesは各アクションのActionKeyRange。省略した場合はここで計算する。
+# timeoutは全ワーカーの終了を待つ秒数。超えた場合は残りのワーカーを終了させて失敗とする。Noneか0の場合は無制限
+def sampleActions(actions, boneCount, workerCount, forceRefresh, restrictSampling=False, keyRanges=None, timeout=None):
+	from . import bake_proc
+
+	# フレーム数が大きいものから順に、合計フレーム数が最も小さいワーカーに割り当てる
+	if keyRanges is None: keyRanges = [bake_proc.ActionKeyRange(i) for i in actions]
+	frameCounts = [i.frameCount() for i in keyRanges]
+	workerCount = min(workerCount, len(actions))
+	shards = [[] for i in range(workerCount)]
+	loads = [0] * workerCount
+	for i in sorted(range(len(actions)), key=lambda i: -frameCounts[i]):
+		w = loads.index(min(loads))
+		shards[w].append(i)
+		loads[w] += frameCounts[i]
+
+	outDir = tempfile.mkdtemp(prefix="bakebfbx_")
+	samples = WorkerSamples(outDir, [
+		os.path.join(outDir, "action_{}.npy".format(i)) for i in range(len(actions))
+	], [i.name for i in actions], frameCounts, boneCount)
+	procs = []
+	try:
+		# 全ワーカーを起動して、終了を待つ
+		for w, shard in enumerate(shards):
+			jobPath = os.path.join(outDir, "worker_{}.json".format(w))
+			with open(jobPath, "w", encoding="utf-8") as f:
+				json.dump({
+					"forceRefresh": forceRefresh,
+					"restrictSampling": restrictSampling,
+					"actions": [[actions[i].name, samples.paths[i]] for i in shard],
+				}, f)
+			logPath = os.path.join(outDir, "worker_{}.log".format(w))
+			log = open(logPath, "w")
+			procs.append((
+				subprocess.Popen(
+					_workerCommand(jobPath),
+					stdout=log, stderr=subprocess.STDOUT ),
+				log, logPath ))
+		print("[ExportFBX] Sampling {} actions with {} workers".format(len(actions), len(procs)))
+
+		deadline = time.monotonic() + timeout if timeout else None
+		failed = []
+		for proc, log, logPath in procs:
+			try:
+				proc.wait(None if deadline is None else max(deadline - time.monotonic(), 0))
+			except subprocess.TimeoutExpired:
+				_killWorkers(procs)
+				raise RuntimeError("Bake worker timed out after {:g}s. Log: {}".format(timeout, logPath))
+			log.close()
+			if proc.returncode != 0: failed.append(logPath)
+		if failed:
+			for logPath in failed:
+				with open(logPath) as f: print(f.read())
+			raise RuntimeError("Bake worker failed ({} of {})".format(len(failed), len(procs)))
+
+		# 作業状態に変更を加える前に、全アクションの結果が揃っていることを確認しておく
+		for i in range(len(actions)): samples.check(i)
+		return samples
+
+	except:
+		# 中断された場合も、ワーカーを残さないようにする
+		_killWorkers(procs)
+		samples.close()
+		raise
+
+# まだ実行中のワーカーを終了させ、ログファイルを閉じる
+def _killWorkers(procs):
+	for proc, log, logPath in procs:
+		if proc.poll() is None:
+			proc.kill()
+			proc.wait()
+		log.close()
+
+# ワーカーがサンプリングした結果。
+# 全アクション分をメモリに読み込まず、アクションごとにメモリマップして読み出す。
+# メモリマップしたファイルは、開いている間はWindowsでは削除できないので、closeでまとめて閉じる。
+class WorkerSamples:
+	def __init__(self, outDir, paths, names, frameCounts, boneCount):
+		self.outDir = outDir
+		self.paths = paths
+		self.names = names
+		self.frameCounts = frameCounts
+		self.boneCount = boneCount
+		self.__mmaps = []
+
+	# idx番目のアクションの結果が、正しい形で出力されているか確認する。中身は読み込まない。
+	# フレーム数は親プロセス側のActionKeyRangeと比べ、保存済みファイルとの食い違いを検出する
+	def check(self, idx):
+		if not os.path.exists(self.paths[idx]):
+			raise RuntimeError("Bake worker did not output action: " + self.names[idx])
+		with open(self.paths[idx], "rb") as f:
+			if np.lib.format.read_magic(f) == (1, 0): shape, _, _ = np.lib.format.read_array_header_1_0(f)
+			else: shape, _, _ = np.lib.format.read_array_header_2_0(f)
+		if tuple(shape) != (self.frameCounts[idx], self.boneCount, 4, 4):
+			raise RuntimeError("Bake worker output mismatch: {} (expected {} frames, got {})".format(
+				self.names[idx], self.frameCounts[idx], shape[0] if shape else 0 ))
+
+	# idx番目のアクションの (フレーム数, ボーン数, 4, 4) のfloat32配列。
+	# close後は使用できない
+	def load(self, idx):
+		self.check(idx)
+		transCache = np.load(self.paths[idx], mmap_mode="r")
+		self.__mmaps.append(transCache)
+		return transCache
+
+	# 開いているメモリマップを閉じて、一時フォルダを削除する
+	def close(self):
+		for i in self.__mmaps:
+			if getattr(i, "_mmap", None) is not None: i._mmap.close()
+		self.__mmaps = []
+		shutil.rmtree(self.outDir, ignore_errors=True)
+
+# ワーカープロセスを起動するコマンドライン
+def _workerCommand(jobPath):
+	addonDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	expr = "import sys; sys.path.insert(0, {!r}); import {}.bake_parallel as m; m.workerMain()".format(
+		addonDir, __package__ )
+	cmd = [bpy.app.binary_path, "-b", bpy.data.filepath]
+	if bpy.context.preferences.filepaths.use_scripts_auto_execute:
+		cmd.append("--enable-autoexec")
+	cmd += ["--python-exit-code", "1", "--python-expr", expr, "--", jobPath]
+	return cmd
+
+
+#-------------------------------------------------------
+
+# ワーカープロセス側の処理。
+# コマンドライン引数の "--" 以降に、担当するアクション名と出力先を記したジョブファイルを受け取る。
+# アクションは名前で探すので、親プロセス側で一時的な複製に対してベイクしている場合でも、
+# 保存済みファイル内の同名の元アクションをサンプリングする。
+def workerMain():
+	from . import bake_proc
+
+	jobPath = sys.argv[sys.argv.index("--")+1]
+	with open(jobPath, encoding="utf-8") as f: job = json.load(f)
+	forceRefresh = job["forceRefresh"]
+
+	armature = tgtArmature(ConsoleReporter())
+	if armature is None: raise RuntimeError("There is no armature to bake")
+	deformBoneKeys = bake_proc.getDeformBoneKeys(armature)
+	influences = None
+	if job["restrictSampling"]: influences = getBoneInfluences(armature, deformBoneKeys)
+
+	bake_proc.beginBakeState(armature)
+	sampler = BoneMtxSampler(armature, deformBoneKeys)
+	for name, outPath in job["actions"]:
+		action = bpy.data.actions[name]
+		bake_proc.cleanArmaturePose(armature, action)
+		transCache = bake_proc.sampleAction(sampler, action, forceRefresh, influences)
+		np.save(outPath, transCache)
+		print("[ExportFBX] Sampled action: {}, frames: {}".format(action.name, len(transCache)))
+
+# オペレータの代わりに、報告をコンソールへ出力するもの
+class ConsoleReporter:
+	def report(self, type, message):
+		print("[ExportFBX] {}: {}".format(", ".join(type), message))
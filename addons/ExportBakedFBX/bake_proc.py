@@ -1,9 +1,20 @@
 
 import bpy
+from mathutils import *
 import math
 import os
+import shutil
+import tempfile
+import contextlib
+import numpy as np
 
 from .common_arma import *
+from . import bake_parallel
+from . import bake_cache
+from . import bake_temp
+from . import fbx_patch
+from . import bake_profile
+from . import key_reduce
 
 from bpy.props import (
 		BoolProperty,
@@ -18,145 +29,545 @@ from bpy.props import (
 # ベイク対象から外すボーンの名前に追加する文字列
 DONT_BAKE_KEYWORD = "[DONT_BAKE]"
 
-# ベイク処理本体
-def bakeAnim( operator ):
-	# 対象Armatureを取得
-	tgt_armature = tgtArmature(operator)
-	if tgt_armature is None: return False
+# ベイクするチャンネルのプロパティ名と要素数
+BAKE_CHANNELS = (("location", 3), ("rotation_quaternion", 4), ("scale", 3))
 
-	# オリジナルArmatureのモードおよび、NLAトラックのミュート状態を記憶しておく
-	bpy.context.view_layer.objects.active = tgt_armature
+# 初期姿勢での、位置・回転(四元数)・スケールの各チャンネルの値
+REST_VALUES = np.array((0,0,0, 1,0,0,0, 1,1,1), dtype=np.float32)
+
+# キーを間引かない場合に、値が変化しないとみなす誤差
+STATIC_EPSILON = 0.000001
+
+# ベイク処理の設定
+class BakeSettings:
+	def __init__(self,
+		workerCount=1, workerTimeout=3600, refreshMode='AUTO',
+		reduceKeys=False, reduceTol=(0.0001, 0.0001, 0.0001),
+		useCache=False, cacheDir=None, cacheSizeMB=1024, forceRebake=False,
+		bakeOnCopy=False, skipStatic=False, restrictSampling=False, suspendMeshModifiers=False,
+		profile=False, writeTrace=False, traceMemory=False,
+	):
+		self.workerCount = workerCount		# サンプリングを行うワーカープロセス数。1の場合は並列化しない
+		self.workerTimeout = workerTimeout	# ワーカープロセスの終了を待つ秒数。0の場合は無制限
+		self.refreshMode = refreshMode		# ボーンの強制再更新を行うか。'AUTO': 必要な場合のみ、'ALWAYS': 常に行う
+		self.reduceKeys = reduceKeys		# キーを間引くか否か
+		self.reduceTol = reduceTol			# キーを間引く際の、位置・回転(四元数)・スケールの許容誤差
+		self.useCache = useCache			# サンプリング結果をディスクにキャッシュするか否か
+		self.cacheDir = cacheDir			# キャッシュフォルダ。Noneの場合は.blendファイルの隣
+		self.cacheSizeMB = cacheSizeMB		# キャッシュの合計サイズの上限(MB)
+		self.forceRebake = forceRebake		# キャッシュを使用せずに、全アクションをサンプリングし直すか否か
+		self.bakeOnCopy = bakeOnCopy		# 一時的な複製に対してベイクし、出力後にリバートしないか否か
+		self.skipStatic = skipStatic		# 値が変化しないチャンネルのキーを1つにし、初期姿勢のままのチャンネルはキーを打たないか否か
+		self.restrictSampling = restrictSampling	# ボーンに影響するキーの範囲外のフレームのサンプリングを省略するか否か
+		self.suspendMeshModifiers = suspendMeshModifiers	# FBX出力のアニメーション書き出し中に、メッシュのモディファイアを無効にするか否か（試験的）
+		self.profile = profile				# 各段階の処理時間を計測して、コンソールに出力するか否か
+		self.writeTrace = writeTrace		# 計測結果を、FBXの隣にChromeのトレース形式のJSONで書き出すか否か
+		self.traceMemory = traceMemory		# 計測時にtracemallocでピークメモリも計測するか否か。処理時間は遅くなる
+
+
+# ベイクする必要のあるボーン名を収集
+def getDeformBoneKeys(armature):
+	deformBoneKeys = []
+	for key in armature.data.bones.keys():
+		if armature.data.bones[key].use_deform : 
+			deformBoneKeys.append(key)
+	return deformBoneKeys
+
+# ベイク対象の全アクションを列挙
+def getBakeActions():
+	#return [ a for a in bpy.data.actions if bool(a) & a.use_fake_user ]
+	return [ a for a in bpy.data.actions if bool(a) ]
+
+# ベイク前に、オリジナルArmatureのモードおよび、NLAトラックのミュート状態を記憶しておく。
+# 戻り値は (元のモード, 元のNLAトラックのミュート状態リスト)
+def beginBakeState(armature):
+	bpy.context.view_layer.objects.active = armature
 	old_mode = bpy.context.object.mode
+	if old_mode != 'OBJECT': bpy.ops.object.mode_set(mode='OBJECT')
+
+	# 目標Armatureのみを選択
+	for obj in bpy.context.view_layer.objects: obj.select_set(obj == armature)
 	bpy.ops.object.mode_set(mode='POSE')
 	old_tracks_mute = []
-	for track in tgt_armature.animation_data.nla_tracks:
+	for track in armature.animation_data.nla_tracks:
 		old_tracks_mute.append(track.mute)
 		track.mute = True
+	return old_mode, old_tracks_mute
 
-	# ベイクする必要のあるボーン名を収集
-	deformBoneKeys = []
-	for key in tgt_armature.data.bones.keys():
-		if tgt_armature.data.bones[key].use_deform : 
-			deformBoneKeys.append(key)
+# アニメーションの再生のために、Armatureの状態をクリーンにする。
+# beginBakeStateで目標Armatureのみを選択し、ポーズモードにした状態で呼ぶこと
+def cleanArmaturePose(armature, action):
+	animData = armature.animation_data
+	animData.action = action
 
-	# アニメーションの再生のために、Armatureの状態をクリーンにする
-	def cleanArmaturePose(action):
-		# 目標Armatureのみを選択
-		bpy.context.view_layer.objects.active = tgt_armature
+	# Blender 4.4以降は、アクションのスロットも割り当てないと再生されない。
+	# NLAストリップ等で使用済みのスロットは自動で割り当てられないので、ここで割り当てる
+	if action is not None and hasattr(animData, "action_slot") and animData.action_slot is None:
+		slots = list(animData.action_suitable_slots)
+		if slots: animData.action_slot = slots[0]
+
+	# キーのないボーンのTransformをデフォルト状態にしておく
+	clearPoseTransforms(armature)
+
+# アクションのキーの範囲。
+# 全F-Curveのキーの座標をforeach_getで一括で読み込み、NumPyで集計する。
+# ベイクの各段階で使用するので、アクションごとに一度だけ計算して使い回すこと
+class ActionKeyRange:
+	def __init__(self, action):
+		self.action = action
+		fcurves = list(action.fcurves)
+		keyCnts = np.array([len(i.keyframe_points) for i in fcurves], dtype=np.int64)
+		offsets = np.zeros(len(fcurves)+1, dtype=np.int64)
+		np.cumsum(keyCnts, out=offsets[1:])
+		co = np.empty(offsets[-1]*2, dtype=np.float32)
+		for fcu, begin, end in zip(fcurves, offsets[:-1], offsets[1:]):
+			fcu.keyframe_points.foreach_get("co", co[begin*2:end*2])
+		x = co[0::2]
+
+		# 全体の範囲。キーの無いアクションは、フレーム数が0になるようにする
+		if len(x) != 0:
+			self.firstFrame = int(np.ceil(x.min()))
+			self.lastFrame  = int(np.ceil(x.max()))
+		else:
+			self.firstFrame =  9999999
+			self.lastFrame  = -9999999
+
+		# ボーンごとの、"pose.bones[...]" 以下のF-Curveのキーの範囲。
+		# 範囲外で値が一定とみなせない場合は無限大にする
+		self.boneRanges = {}
+		for fcu, begin, end in zip(fcurves, offsets[:-1], offsets[1:]):
+			name = poseBoneNameOf(fcu.data_path)
+			if name is None: continue
+			if fcu.modifiers or fcu.extrapolation != 'CONSTANT':
+				lo, hi = -math.inf, math.inf
+			elif begin == end:
+				continue
+			else:
+				lo, hi = float(x[begin:end].min()), float(x[begin:end].max())
+			if name in self.boneRanges:
+				lo = min(lo, self.boneRanges[name][0])
+				hi = max(hi, self.boneRanges[name][1])
+			self.boneRanges[name] = (lo, hi)
+
+	# フレーム数
+	def frameCount(self):
+		return max(self.lastFrame-self.firstFrame+1, 0)
+
+# ベイク時に、フレームごとにforceRefreshBonesによる強制再更新を行う必要があるか否か
+def isForceRefreshNeeded(armature, settings):
+	if settings.refreshMode == 'ALWAYS': return True
+	reason = findLaggingDependency(armature)
+	if reason is None: return False
+	print("[ExportFBX] Force refresh bones: " + reason)
+	return True
+
+# アクションのうち、サンプリングが必要なフレームを求める。
+# influencesはgetBoneInfluencesの結果。ボーンに影響するF-Curveのキーの範囲外では、
+# F-Curveの値は一定なので、どのボーンの範囲にも含まれないフレームでは全ボーンの姿勢が変化しない。
+# 戻り値は firstFrame～lastFrame の各フレームをサンプリングするか否かの真偽値配列
+def getSampleFrameMask(keyRange, influences):
+	firstFrame, lastFrame = keyRange.firstFrame, keyRange.lastFrame
+	frameNum = keyRange.frameCount()
+	mask = np.zeros(frameNum, dtype=bool)
+	for influence in influences.values():
+		if influence is None:
+			mask[:] = True
+			break
+		for name in influence:
+			if name not in keyRange.boneRanges: continue
+			lo, hi = keyRange.boneRanges[name]
+			begin = firstFrame if lo == -math.inf else math.floor(lo)
+			end = lastFrame if hi == math.inf else math.ceil(hi)
+			mask[max(begin-firstFrame, 0):max(end-firstFrame+1, 0)] = True
+
+	# 全ボーンが変化しない場合も、1フレームはサンプリングする
+	if frameNum != 0 and not mask.any(): mask[0] = True
+	return mask
+
+# アクションの全フレームにわたって、Transform情報を収集する。
+# cleanArmaturePoseでアクションを設定した状態で呼ぶこと。
+# samplerは対象ボーンを指定したBoneMtxSampler。
+# forceRefreshがFalseの場合は、強制再更新を行わない。
+# influencesを指定した場合は、姿勢が変化しないフレームのサンプリングを省略する。
+# keyRangeを省略した場合は、ここでActionKeyRangeを計算する。
+# outを指定した場合は、新たに確保せずにそこへ書き込む。
+# 戻り値は (フレーム数, ボーン数, 4, 4) のfloat32配列
+def sampleAction(sampler, action, forceRefresh=True, influences=None, keyRange=None, out=None):
+	if keyRange is None: keyRange = ActionKeyRange(action)
+	firstFrame, lastFrame = keyRange.firstFrame, keyRange.lastFrame
+	frameNum = keyRange.frameCount()
+	transCache = out
+	if transCache is None: transCache = np.empty((frameNum, len(sampler.boneIdx), 4, 4), dtype=np.float32)
+	mask = None
+	if influences is not None: mask = getSampleFrameMask(keyRange, influences)
+	for frameIdx, i in enumerate(range(firstFrame, lastFrame+1)):
+		if mask is not None and not mask[frameIdx]: continue
+		with bake_profile.timer("frame_set"):
+			bpy.context.scene.frame_set(i)
+		if forceRefresh:
+			with bake_profile.timer("forceRefreshBones"):
+				forceRefreshBones(sampler.armature)
+		with bake_profile.timer("BoneMtxSampler.sample"):
+			transCache[frameIdx] = sampler.sample()
+
+	# サンプリングを省略したフレームは、直前（先頭の場合は直後）にサンプリングしたフレームと同じ姿勢
+	if mask is not None and not mask.all():
+		srcIdx = np.where(mask, np.arange(frameNum), 0)
+		np.maximum.accumulate(srcIdx, out=srcIdx)
+		srcIdx[:np.argmax(mask)] = np.argmax(mask)
+		transCache[:] = transCache[srcIdx]
+		print("[ExportFBX] Action: {}, sampled {} of {} frames".format(action.name, int(mask.sum()), frameNum))
+	return transCache
+
+# 書き込みを始める前に、全アクションのTransform情報を保持しておくもの。
+# アクションごとのフレーム数から (合計フレーム数, ボーン数, 4, 4) のfloat32配列を一時ファイル上に
+# メモリマップで確保し、アクションごとにその一部を割り当てる。
+# 書き込み済みの部分はOSがメモリから追い出せるので、メモリ使用量がアクション数×フレーム数に比例しない
+class SampleBuffer:
+	def __init__(self, frameCounts, boneCount):
+		self.offsets = np.zeros(len(frameCounts)+1, dtype=np.int64)
+		np.cumsum(frameCounts, out=self.offsets[1:])
+		self.boneCount = boneCount
+		self.dirPath = tempfile.mkdtemp(prefix="bakebfbx_")
+		self.__buf = None
+		if self.offsets[-1] != 0:
+			self.__buf = np.memmap(
+				os.path.join(self.dirPath, "samples.dat"), dtype=np.float32, mode="w+",
+				shape=(int(self.offsets[-1]), boneCount, 4, 4) )
+
+	# idx番目のアクションの (フレーム数, ボーン数, 4, 4) の領域。close後は使用できない
+	def get(self, idx):
+		if self.__buf is None: return np.empty((0, self.boneCount, 4, 4), dtype=np.float32)
+		return self.__buf[self.offsets[idx]:self.offsets[idx+1]]
+
+	# メモリマップを閉じて、一時フォルダを削除する
+	def close(self):
+		buf = self.__buf
+		self.__buf = None
+		if buf is not None and getattr(buf, "_mmap", None) is not None:
+			try:
+				buf._mmap.close()
+			except BufferError:
+				pass		# 参照が残っている場合は、解放時に閉じられる
+		shutil.rmtree(self.dirPath, ignore_errors=True)
+
+# サンプリングしたローカル行列を、位置・回転(四元数)・スケールに分解する。
+# 戻り値は (フレーム数, ボーン数, 3), (フレーム数, ボーン数, 4), (フレーム数, ボーン数, 3) のfloat32配列
+def decomposeTransCache(transCache):
+	locs, rots, scls = decomposeMatrices(transCache)
+	return locs.astype(np.float32), rots.astype(np.float32), scls.astype(np.float32)
+
+# F-Curveにキーフレームをまとめて書き込む。
+# keyframe_points.addで追加したキーは、補間がBEZIER・ハンドルがAUTO_CLAMPEDになっているので、
+# 座標のみをforeach_setで一括設定し、最後にupdateでハンドルを再計算する。
+# 既存のキーを上書きする場合や、補間にBEZIER以外を指定した場合は、補間・ハンドルもforeach_setで設定する。
+def writeFCurve(action, dataPath, index, frames, vals, interpolation='BEZIER'):
+	fc = action.fcurves.find(dataPath, index=index)
+	if fc is None:
+		fc = action.fcurves.new(dataPath, index=index)
+#	fc.auto_smoothing = 'CONT_ACCEL'
+	pnts = fc.keyframe_points
+	oldCnt = len(pnts)
+	pnts.add(len(frames))
+
+	# 既存のキーがある場合は、その先頭から上書きする
+	co = np.zeros((len(pnts), 2), dtype=np.float32)
+	if oldCnt != 0:
+		pnts.foreach_get("co", co.reshape(-1))
+		cnt = min(oldCnt, len(frames))
+		setKeyframeEnums(pnts, "interpolation", 'BEZIER', cnt)
+		setKeyframeEnums(pnts, "handle_left_type", 'AUTO_CLAMPED', cnt)
+		setKeyframeEnums(pnts, "handle_right_type", 'AUTO_CLAMPED', cnt)
+	co[:len(frames), 0] = frames
+	co[:len(frames), 1] = vals
+	pnts.foreach_set("co", co.reshape(-1))
+	if interpolation != 'BEZIER':
+		setKeyframeEnums(pnts, "interpolation", interpolation, len(frames))
+	fc.update()
+	return fc
+
+# キーフレームの列挙型プロパティを、先頭からcount個だけforeach_setで一括設定する
+def setKeyframeEnums(pnts, prop, value, count):
+	buf = np.empty(len(pnts), dtype=np.int32)
+	pnts.foreach_get(prop, buf)
+	buf[:count] = bpy.types.Keyframe.bl_rna.properties[prop].enum_items[value].value
+	pnts.foreach_set(prop, buf)
+
+# 間引いたキーを、BEZIER補間で1つのF-Curveに書き込む。
+# 自動ハンドルでの補間は直線補間とは異なるので、Blenderが計算したハンドルを読み込んで全フレームの値を求め、
+# 許容誤差を超えたフレームにキーを追加して書き直す。全フレームにキーがあれば誤差は無いので、必ず収束する。
+# keepは各フレームにキーを残すか否かの真偽値配列。戻り値は書き込んだキー数
+def writeReducedFCurve(action, dataPath, index, frames, vals, keep, tol):
+	keep = keep.copy()
+	while True:
+		fc = writeFCurve(action, dataPath, index, frames[keep], vals[keep])
+		pnts = fc.keyframe_points
+		co, handleLeft, handleRight = [np.empty((len(pnts), 2), dtype=np.float32) for _ in range(3)]
+		pnts.foreach_get("co", co.reshape(-1))
+		pnts.foreach_get("handle_left", handleLeft.reshape(-1))
+		pnts.foreach_get("handle_right", handleRight.reshape(-1))
+		isOver = np.abs(key_reduce.bezierValues(co, handleLeft, handleRight, frames) - vals) > tol
+		isOver &= ~keep
+		if not isOver.any(): return int(keep.sum())
+		keep |= isOver
+		action.fcurves.remove(fc)
+
+# サンプリングしたTransform情報を、アクションのキーとして書き込む。
+# 戻り値は (間引き前のキー数, 書き込んだキー数, 初期姿勢のままのためキーを打たなかったチャンネル)。
+# 最後のものは (ボーン数, 10) の真偽値配列で、skipStaticがOFFの場合はNone
+def writeBakedAction(action, deformBoneKeys, transCache, settings, keyRange=None):
+	if keyRange is None: keyRange = ActionKeyRange(action)
+	firstFrame, lastFrame = keyRange.firstFrame, keyRange.lastFrame
+
+	# 既存のキーを全削除する
+	fcCache = []
+	for fcu in action.fcurves:
+		if not DONT_BAKE_KEYWORD in fcu.data_path: fcCache.append(fcu)		# ベイク対象外オブジェクトは除く
+	for fcu in fcCache: action.fcurves.remove(fcu)
+
+	# Deformボーンについて、全フレームにTransform情報をベイク
+	frames = np.arange(firstFrame, lastFrame+1, dtype=np.float32)
+	locs, rots, scls = decomposeTransCache(transCache)
+	chVals = np.concatenate((locs, rots, scls), axis=2)		# (フレーム数, ボーン数, 10)
+
+	# 間引く場合は、直線補間で許容誤差内に収まるキーを候補にする。
+	# 書き込み時に、BEZIER補間でも許容誤差内に収まるようにキーを追加する
+	keep = None
+	tol = np.full(10, STATIC_EPSILON)
+	if settings.reduceKeys:
+		tol = np.repeat(settings.reduceTol, (3, 4, 3))
+		keep = key_reduce.reduceKeys(
+			chVals.reshape(len(frames), -1),
+			np.tile(tol, len(deformBoneKeys)) ).reshape(chVals.shape)
+
+	# 値が変化しないチャンネルはキーを1つだけにし、さらに初期姿勢のままの場合はキーを打たない
+	isStatic = None
+	isRest = None
+	if settings.skipStatic:
+		isStatic = np.zeros(chVals.shape[1:], dtype=bool)
+		isRest = np.zeros(chVals.shape[1:], dtype=bool)
+		if len(frames) != 0:
+			isStatic = np.abs(chVals - chVals[:1]).max(axis=0) <= tol
+			isRest = np.abs(chVals - REST_VALUES).max(axis=0) <= tol
+
+	writtenCnt = 0
+	for boneIdx, boneName in enumerate(deformBoneKeys):
+		ch = 0
+		for path, num in BAKE_CHANNELS:
+			for i in range(num):
+				dataPath = 'pose.bones["'+boneName+'"].'+path
+				vals = chVals[:,boneIdx,ch]
+				if isRest is not None and isRest[boneIdx,ch]:
+					ch += 1
+					continue
+				if isStatic is not None and isStatic[boneIdx,ch]:
+					writeFCurve(action, dataPath, i, frames[:1], vals[:1])
+					writtenCnt += 1
+				elif keep is not None:
+					writtenCnt += writeReducedFCurve(action, dataPath, i, frames, vals, keep[:,boneIdx,ch], tol[ch])
+				else:
+					writeFCurve(action, dataPath, i, frames, vals)
+					writtenCnt += len(frames)
+				ch += 1
+
+	keyCnt = chVals.size
+	print("Action: {}, First frame: {}, Second frame: {}, Keys: {} -> {}".format(
+		action.name, firstFrame, lastFrame, keyCnt, writtenCnt ))
+	return keyCnt, writtenCnt, isRest
+
+# 指定したチャンネルに、初期姿勢のキーをアクションの先頭フレームに1つだけ打つ。
+# isRestは (ボーン数, 10) の真偽値配列。戻り値は書き込んだキー数
+def writeRestKeys(action, deformBoneKeys, isRest, keyRange=None):
+	if keyRange is None: keyRange = ActionKeyRange(action)
+	frames = np.array((keyRange.firstFrame,), dtype=np.float32)
+	for boneIdx, c in zip(*np.nonzero(isRest)):
+		ch = c
+		for path, num in BAKE_CHANNELS:
+			if ch < num: break
+			ch -= num
+		writeFCurve(
+			action, 'pose.bones["'+deformBoneKeys[boneIdx]+'"].'+path, int(ch),
+			frames, REST_VALUES[c:c+1] )
+	return int(isRest.sum())
+
+# 開いているファイルが保存済みで、未保存の変更が無いか
+def isFileSaved():
+	return bool(bpy.data.filepath) and not bpy.data.is_dirty
+
+# ベイク処理本体。
+# armature・actionsを省略した場合は、ファイル内のArmatureと全アクションを対象にする。
+# isSavedは、保存済みファイルの内容が作業状態と一致しているか。省略した場合はbpy.data.is_dirtyで判断する
+def bakeAnim( operator, settings=None, armature=None, actions=None, isSaved=None ):
+	if settings is None: settings = BakeSettings()
+	if isSaved is None: isSaved = isFileSaved()
+
+	# 対象Armatureを取得
+	tgt_armature = armature or tgtArmature(operator)
+	if tgt_armature is None: return False
+
+	with bake_profile.phase("analyze"):
+		deformBoneKeys = getDeformBoneKeys(tgt_armature)
+		if actions is None: actions = getBakeActions()
+
+		# キーの範囲は、サンプリングと書き込みの両方で使用するので、最初に一度だけ計算しておく
+		keyRanges = [ActionKeyRange(i) for i in actions]
+		forceRefresh = isForceRefreshNeeded(tgt_armature, settings)
+
+		# サンプリングを省略するフレームを判断するための、ボーンごとの影響元
+		influences = None
+		if settings.restrictSampling:
+			influences = getBoneInfluences(tgt_armature, deformBoneKeys)
+			print("[ExportFBX] Restrict sampling: {} of {} bones analyzable".format(
+				sum(1 for i in influences.values() if i is not None), len(influences) ))
+
+	# キャッシュ済みのアクションを調べる。
+	# キーにはConstraint・Driverの内容が含まれるので、作業状態に変更を加える前に計算しておく
+	cache = None
+	actionKeys = [None] * len(actions)
+	isCached = [False] * len(actions)
+	if settings.useCache:
+		with bake_profile.phase("cacheCheck"):
+			cache = bake_cache.BakeCache(
+				settings.cacheDir or bake_cache.cacheDirFor(bpy.data.filepath),
+				settings.cacheSizeMB * 1024 * 1024 )
+			rigKey = bake_cache.rigHash(tgt_armature, deformBoneKeys, forceRefresh)
+			actionKeys = [bake_cache.actionKey(i, rigKey) for i in actions]
+			if not settings.forceRebake:
+				isCached = [cache.has(i) for i in actionKeys]
+		print("[ExportFBX] Bake cache: {} of {} actions cached".format(sum(isCached), len(actions)))
+
+	# 並列ベイクの場合は、作業状態に変更を加える前に、
+	# 保存済みファイルを開いたワーカープロセスでサンプリングしておく。
+	# 未保存の変更がある場合は、ワーカーが古い内容をサンプリングしてしまうので、このプロセスでサンプリングする
+	workerSamples = None
+	workerIdxs = {}
+	uncachedIdxs = [i for i in range(len(actions)) if not isCached[i]]
+	if 1 < settings.workerCount and 1 < len(uncachedIdxs) and not isSaved:
+		operator.report({'WARNING'}, "File has unsaved changes. Sampling without bake workers")
+	elif 1 < settings.workerCount and 1 < len(uncachedIdxs):
+		try:
+			with bake_profile.phase("workers", actions=len(uncachedIdxs)):
+				workerSamples = bake_parallel.sampleActions(
+					[actions[i] for i in uncachedIdxs], len(deformBoneKeys), settings.workerCount, forceRefresh,
+					settings.restrictSampling, [keyRanges[i] for i in uncachedIdxs], settings.workerTimeout )
+		except RuntimeError as e:
+			operator.report({'ERROR'}, str(e))
+			return False
+		workerIdxs = {j:i for i,j in enumerate(uncachedIdxs)}
+
+	# オリジナルArmatureのモードおよび、NLAトラックのミュート状態を記憶しておく
+	old_mode, old_tracks_mute = beginBakeState(tgt_armature)
+
+	# 全アクションのTransform情報を収集してから、キーの書き込みを行う。
+	# ACTION ConstraintやDriverがベイク対象の他のアクションを参照している場合があり、
+	# 書き込みで元のキーを消したアクションの影響を受けないように、書き込み前に全てサンプリングしておく。
+	# ワーカー以外の結果はSampleBufferに置き、Matrixのリスト等でメモリに保持しない
+	sampler = BoneMtxSampler(tgt_armature, deformBoneKeys)
+	localIdxs = [i for i in range(len(actions)) if i not in workerIdxs]
+	samples = SampleBuffer([keyRanges[i].frameCount() for i in localIdxs], len(deformBoneKeys))
+	sampleIdxs = {j:i for i,j in enumerate(localIdxs)}
+	sampledFrames = 0
+	cachedFrames = 0
+	keyCnt = 0
+	writtenCnt = 0
+	restMasks = []
+	try:
+		for action_idx in localIdxs:
+			action = actions[action_idx]
+			with bake_profile.phase("action", name=action.name, frames=keyRanges[action_idx].frameCount()):
+				transCache = samples.get(sampleIdxs[action_idx])
+				if isCached[action_idx]:
+					with bake_profile.phase("cacheLoad"):
+						loaded = cache.load(actionKeys[action_idx])
+					if loaded is not None and loaded.shape == transCache.shape:
+						transCache[:] = loaded
+						cachedFrames += len(transCache)
+						continue
+				cleanArmaturePose(tgt_armature, action)
+				with bake_profile.phase("sample"):
+					sampleAction(sampler, action, forceRefresh, influences, keyRanges[action_idx], transCache)
+				sampledFrames += len(transCache)
+				if cache is not None:
+					with bake_profile.phase("cacheSave"):
+						cache.save(actionKeys[action_idx], transCache)
+
+		for action_idx, action in enumerate(actions):
+			if action_idx in workerIdxs:
+				with bake_profile.phase("workerLoad"):
+					transCache = workerSamples.load(workerIdxs[action_idx])
+				sampledFrames += len(transCache)
+				if cache is not None:
+					with bake_profile.phase("cacheSave"):
+						cache.save(actionKeys[action_idx], transCache)
+			else:
+				transCache = samples.get(sampleIdxs[action_idx])
+			with bake_profile.phase("write", name=action.name):
+				cnts = writeBakedAction(action, deformBoneKeys, transCache, settings, keyRanges[action_idx])
+			keyCnt += cnts[0]
+			writtenCnt += cnts[1]
+			if cnts[2] is not None: restMasks.append((action_idx, cnts[2]))
+			del transCache
+	finally:
+		samples.close()
+		if workerSamples is not None: workerSamples.close()
+		if cache is not None: cache.evict()
+
+	# 初期姿勢のままのためキーを打たなかったチャンネルでも、他のアクションでキーを打っている場合は、
+	# 出力時にアクションを切り替えると直前のアクションの姿勢が残ってしまうので、初期姿勢のキーを1つ打つ
+	if restMasks:
+		with bake_profile.phase("restKeys"):
+			isKeyed = np.logical_or.reduce([~i for _, i in restMasks])
+			for action_idx, isRest in restMasks:
+				writtenCnt += writeRestKeys(
+					actions[action_idx], deformBoneKeys, isRest & isKeyed, keyRanges[action_idx] )
+
+	# 強制再更新の有無ごとのサンプリングフレーム数
+	print("[ExportFBX] Sampled frames: fast path {}, slow path {}, cached {}".format(
+		0 if forceRefresh else sampledFrames,
+		sampledFrames if forceRefresh else 0,
+		cachedFrames ))
+	if settings.reduceKeys or settings.skipStatic:
+		print("[ExportFBX] Reduced keys: {} -> {} ({:.1f}%)".format(
+			keyCnt, writtenCnt, 100 * writtenCnt / max(keyCnt, 1) ))
+	bake_profile.count("actions", len(actions))
+	bake_profile.count("frames sampled", sampledFrames)
+	bake_profile.count("frames cached", cachedFrames)
+	bake_profile.count("keys baked", keyCnt)
+	bake_profile.count("keys written", writtenCnt)
+
+	with bake_profile.phase("cleanup"):
+		# 表示アクションを非選択にする
+		cleanArmaturePose(tgt_armature, None)
+
+		# Constraintsを全削除
+		for bone in tgt_armature.pose.bones:
+			if not DONT_BAKE_KEYWORD in bone.name:				# ベイク対象外オブジェクトは除く
+				cstrCache = [i for i in bone.constraints]
+				for i in cstrCache: bone.constraints.remove(i)
+
+		# Driverを全削除
+		drvCache = [i for i in tgt_armature.animation_data.drivers]
+		for i in drvCache: tgt_armature.animation_data.drivers.remove(i)
+
+		# 全ボーンの回転モードを四元数に変更
+		for bone in tgt_armature.pose.bones: bone.rotation_mode = "QUATERNION"
+		
+		# Deformボーン以外を削除する。
+		# 削除対象は編集モードに入る前に決めておき、編集モードでは1回の走査でまとめて削除する
+		removeNames = set(
+			i.name for i in tgt_armature.data.bones
+			if not i.use_deform and not DONT_BAKE_KEYWORD in i.name )		# ベイク対象外オブジェクトは除く
+		bpy.ops.object.mode_set(mode='EDIT')
+		editBones = tgt_armature.data.edit_bones
+		for i in [i for i in editBones if i.name in removeNames]: editBones.remove(i)
 		bpy.ops.object.mode_set(mode='OBJECT')
-		bpy.ops.object.select_all(action='DESELECT')
+		bake_profile.count("bones removed", len(removeNames))
+
+		# オリジナルArmatureのモードおよびNLAトラックのミュート状態を復元する
 		bpy.context.view_layer.objects.active = tgt_armature
-		tgt_armature.select_set( True )
-		tgt_armature.animation_data.action = action
-		bpy.ops.object.mode_set(mode='POSE')
-
-		# キーのないボーンのTransformをデフォルト状態にしておく
-		bpy.ops.pose.select_all(action='SELECT')
-		bpy.ops.pose.transforms_clear()
-
-	# アクションのキーフレーム長を計算
-	def getActionFrameLength(action):
-		firstFrame =  9999999
-		lastFrame  = -9999999
-		for fcu in action.fcurves:
-			for keyframe in fcu.keyframe_points:
-				x, y = keyframe.co
-				k = math.ceil(x)
-				if k < firstFrame : firstFrame = k
-				if k > lastFrame  : lastFrame  = k
-		return firstFrame, lastFrame
-
-	# 全アクションを列挙
-	#actions = [ a for a in bpy.data.actions if bool(a) & a.use_fake_user ]
-	actions = [ a for a in bpy.data.actions if bool(a) ]
-	transCaches = []
-	for action in actions:
-		cleanArmaturePose(action)
-		firstFrame, lastFrame  = getActionFrameLength(action)
-
-		# アクションの全フレームにわたって、Transform情報を収集する
-		transCache = []
-		for i in range(firstFrame, lastFrame+1):
-			bpy.context.scene.frame_set(i)
-			forceRefreshBones(tgt_armature)
-			transCache_1bone = [getBoneMtx(tgt_armature,j) for j in deformBoneKeys]
-			transCache.append(transCache_1bone)
-		transCaches.append(transCache)
-
-	for action_idx, action in enumerate(actions):
-		cleanArmaturePose(action)
-		firstFrame, lastFrame  = getActionFrameLength(action)
-
-		# 既存のキーを全削除する
-		fcCache = []
-		for fcu in action.fcurves:
-			if not DONT_BAKE_KEYWORD in fcu.data_path: fcCache.append(fcu)		# ベイク対象外オブジェクトは除く
-		for fcu in fcCache: action.fcurves.remove(fcu)
-
-		# Deformボーンについて、全フレームにTransform情報をベイク
-		def makeFC(boneName, path, idx):
-			ret = action.fcurves.find('pose.bones["'+boneName+'"].'+path, index=idx)
-			if ret is None:
-				ret = action.fcurves.new('pose.bones["'+boneName+'"].'+path, index=idx)
-#			ret.auto_smoothing = 'CONT_ACCEL'
-			ret.keyframe_points.add(lastFrame-firstFrame+1)
-			return ret
-		def makeFCs(boneName, path, len):
-			return [makeFC(boneName, path, i) for i in range(len)]
-		def setKeyFramePoints(fcs, frameIdx, frameT, vals):
-			for idx, fc in enumerate(fcs):
-				pnt = fc.keyframe_points[frameIdx]
-				pnt.co = frameT, vals[idx]
-				pnt.interpolation = 'BEZIER'
-				pnt.handle_left_type = 'AUTO_CLAMPED'
-				pnt.handle_right_type = 'AUTO_CLAMPED'
-		for boneIdx, boneName in enumerate(deformBoneKeys):
-			fc_l = makeFCs(boneName ,"location", 3)
-			fc_r = makeFCs(boneName ,"rotation_quaternion", 4)
-			fc_s = makeFCs(boneName ,"scale", 3)
-			for frameIdx, frameT in enumerate(range(firstFrame, lastFrame+1)):
-				mtx = transCaches[action_idx][frameIdx][boneIdx]
-				t = mtx.to_translation()
-				r = mtx.to_quaternion()
-				s = mtx.to_scale()
-				setKeyFramePoints(fc_l, frameIdx, frameT, [t.x, t.y, t.z])
-				setKeyFramePoints(fc_r, frameIdx, frameT, [r.w, r.x, r.y, r.z])
-				setKeyFramePoints(fc_s, frameIdx, frameT, [s.x, s.y, s.z])
-			for fc in fc_l: fc.update()
-			for fc in fc_r: fc.update()
-			for fc in fc_s: fc.update()
-
-		print("Action: {}, First frame: {}, Second frame: {}".format(action.name, firstFrame, lastFrame))
-
-	# 表示アクションを非選択にする
-	cleanArmaturePose(None)
-
-	# Constraintsを全削除
-	for bone in tgt_armature.pose.bones:
-		if not DONT_BAKE_KEYWORD in bone.name:				# ベイク対象外オブジェクトは除く
-			cstrCache = [i for i in bone.constraints]
-			for i in cstrCache: bone.constraints.remove(i)
-
-	# Driverを全削除
-	drvCache = [i for i in tgt_armature.animation_data.drivers]
-	for i in drvCache: tgt_armature.animation_data.drivers.remove(i)
-
-	# 全ボーンの回転モードを四元数に変更
-	for bone in tgt_armature.pose.bones: bone.rotation_mode = "QUATERNION"
-	
-	# Deformボーン以外を削除する
-	bpy.ops.object.mode_set(mode='EDIT')
-	for key in tgt_armature.data.bones.keys():
-		if not tgt_armature.data.edit_bones[key].use_deform \
-			and not DONT_BAKE_KEYWORD in tgt_armature.data.bones[key].name: 		# ベイク対象外オブジェクトは除く
-			tgt_armature.data.edit_bones.remove(tgt_armature.data.edit_bones[key])
-	bpy.ops.object.mode_set(mode='OBJECT')
-
-	# オリジナルArmatureのモードおよびNLAトラックのミュート状態を復元する
-	bpy.context.view_layer.objects.active = tgt_armature
-	bpy.ops.object.mode_set(mode=old_mode)
-	for i,track in enumerate(tgt_armature.animation_data.nla_tracks):
-		track.mute = old_tracks_mute[i]
+		bpy.ops.object.mode_set(mode=old_mode)
+		for i,track in enumerate(tgt_armature.animation_data.nla_tracks):
+			track.mute = old_tracks_mute[i]
 		
 #	#すべてのボーンの姿勢を初期状態にする
 #	bpy.ops.object.mode_set(mode='POSE')
@@ -166,19 +577,18 @@ def bakeAnim( operator ):
 	return True
 
 # FBX出力する処理
-def exportFBX(operator, file_name: StringProperty, anim_type: EnumProperty):
+def exportFBX(operator, file_name: StringProperty, anim_type: EnumProperty, armature=None, settings=None):
+	if settings is None: settings = BakeSettings()
 	
 	# 出力アニメーションが全NLAの場合、NLAトラックを全アクティブにする。
-	# どうせリバートするので、これは元の状態に復元する必要はない
+	# どうせリバートするか、一時的な複製に対して行うので、これは元の状態に復元する必要はない
 	if anim_type == 'AllNLA':
-		tgt_armature = tgtArmature(operator)
+		tgt_armature = armature or tgtArmature(operator)
 		for track in tgt_armature.animation_data.nla_tracks:
 			if track.name.startswith('[Action Stash]'): continue
 			track.mute = False
 
-	mdl_filepath = bpy.data.filepath
-	mdl_directory = os.path.dirname( mdl_filepath )
-	fbx_filepath = os.path.join( mdl_directory, file_name )
+	fbx_filepath = fbxFilePath( file_name )
 	
 	use_nla: bool = False
 	if (anim_type == 'ActiveNLA') or (anim_type == 'AllNLA'):
@@ -186,7 +596,11 @@ def exportFBX(operator, file_name: StringProperty, anim_type: EnumProperty):
 	elif anim_type == 'AllActions':
 		use_nla = False
 	
-	bpy.ops.export_scene.fbx(
+	# ベイク済みのアクションを、FBX出力がもう一度1フレームずつ評価し直すので、
+	# 指定した場合はその間だけメッシュの変形を評価しないようにしておく。
+	# FBX出力の内部関数を差し替えるので、試験的な機能としてデフォルトはOFF
+	patch = fbx_patch.suspendMeshModifiers() if settings.suspendMeshModifiers else contextlib.nullcontext()
+	with patch: bpy.ops.export_scene.fbx(
 		filepath=fbx_filepath,
 		check_existing=False,
 		filter_glob="*.fbx",
@@ -225,15 +639,76 @@ def exportFBX(operator, file_name: StringProperty, anim_type: EnumProperty):
 		axis_up='Y'
 	)
 
+# 出力先FBXファイルのパス。相対パスの場合は.blendファイルのフォルダからの相対
+def fbxFilePath(file_name):
+	mdl_filepath = bpy.data.filepath
+	mdl_directory = os.path.dirname( mdl_filepath )
+	return os.path.join( mdl_directory, file_name )
+
+# 計測結果のトレースを書き出すパス。FBXファイルの隣に置く
+def traceFilePath(file_name):
+	return os.path.splitext(fbxFilePath(file_name))[0] + ".trace.json"
+
 # 出力処理本体
-def export(operator, context, file_name: StringProperty, anim_type: EnumProperty):
-	print("[ExportFBX] Begin")
-	if not bakeAnim(operator): return False
+def export(operator, context, file_name: StringProperty, anim_type: EnumProperty, settings=None):
+	if settings is None: settings = BakeSettings()
+	with bake_profile.profiling(
+		settings.profile or settings.writeTrace,
+		traceFilePath(file_name) if settings.writeTrace else None,
+		settings.traceMemory,
+	):
+		if settings.bakeOnCopy:
+			return exportOnCopy(operator, context, file_name, anim_type, settings)
+
+		print("[ExportFBX] Begin")
+		with bake_profile.phase("bake"):
+			if not bakeAnim(operator, settings): return False
+
+		with bake_profile.phase("exportFBX"):
+			exportFBX(operator, file_name, anim_type, settings=settings)
+		print("[ExportFBX] Complete")
+
+		# 色々ぶっ壊れるのでリバートする
+		with bake_profile.phase("revert"):
+			bpy.ops.wm.revert_mainfile()
+		print("[ExportFBX] Reverted")
+		return True
+
+# 一時的な複製に対してベイク・出力を行う処理本体。
+# 元のArmatureやアクションには変更を加えないので、リバートを行わない
+def exportOnCopy(operator, context, file_name: StringProperty, anim_type: EnumProperty, settings):
+	print("[ExportFBX] Begin (bake on copy)")
+	tgt_armature = tgtArmature(operator)
+	if tgt_armature is None: return False
 
-	exportFBX(operator, file_name, anim_type)
-	print("[ExportFBX] Complete")
+	# 作業状態を記憶しておく
+	scene = context.scene
+	old_frame = scene.frame_current
+	old_active = context.view_layer.objects.active
+	old_mode = old_active.mode if old_active else 'OBJECT'
+	old_selected = [i for i in context.view_layer.objects if i.select_get()]
+	if old_mode != 'OBJECT': bpy.ops.object.mode_set(mode='OBJECT')
 
-	# 色々ぶっ壊れるのでリバートする
-	bpy.ops.wm.revert_mainfile()
-	print("[ExportFBX] Reverted")
+	# 複製を作るとファイルが変更状態になるので、保存済みかどうかはその前に調べておく
+	isSaved = isFileSaved()
+	tmpCopy = bake_temp.TempBakeCopy(tgt_armature, getBakeActions())
+	try:
+		with bake_profile.phase("copy"):
+			copy = tmpCopy.begin()
+		with bake_profile.phase("bake"):
+			if not bakeAnim(operator, settings, copy, tmpCopy.copyActions, isSaved): return False
+		with bake_profile.phase("exportFBX"):
+			exportFBX(operator, file_name, anim_type, copy, settings)
+		print("[ExportFBX] Complete")
+	finally:
+		# 作業状態を復元する
+		with bake_profile.phase("restore"):
+			if context.object and context.object.mode != 'OBJECT':
+				bpy.ops.object.mode_set(mode='OBJECT')
+			tmpCopy.end()
+			scene.frame_set(old_frame)
+			for i in context.view_layer.objects: i.select_set(i in old_selected)
+			context.view_layer.objects.active = old_active
+			if old_active and old_mode != 'OBJECT': bpy.ops.object.mode_set(mode=old_mode)
+		print("[ExportFBX] Removed temporary copies")
 	return True
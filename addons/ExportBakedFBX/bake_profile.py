@@ -0,0 +1,144 @@
+#
+# ベイク・FBX出力の各段階の処理時間を計測するモジュール。
+#
+# profilingのwith文の間、phaseで囲んだ区間の処理時間を入れ子で記録し、countで件数を集計する。
+# フレームごとの処理など回数の多いものは、timerで合計時間だけを集計する。
+# 終了時に段階ごとの合計時間・件数をコンソールに出力し、
+# 指定した場合はChromeのトレース形式(chrome://tracing や Perfetto で開ける)のJSONも書き出す。
+# traceMemoryを指定した場合は、tracemallocによるピークメモリも計測する。
+# tracemallocはPythonのメモリ確保ごとに記録を行うので処理全体が遅くなり、その間の処理時間は参考値になる。
+# 処理時間とピークメモリは、別々の実行で計測すること。
+# tracemallocで計測できるのはPythonとNumPyが確保したメモリのみで、Blender内部のものは含まれない。
+# 計測していない間は、phase・count・timerは何もしない。
+#
+
+import os
+import json
+import time
+import tracemalloc
+import contextlib
+
+
+#-------------------------------------------------------
+
+# 計測結果
+class Profiler:
+	def __init__(self, traceMemory=False):
+		self.traceMemory = traceMemory	# tracemallocでピークメモリを計測したか否か
+		self.events = []		# Chromeトレース形式のイベント一覧
+		self.totals = {}		# {段階のパス: (合計秒数, 回数)}
+		self.counters = {}		# {名前: 件数}
+		self.timers = {}		# {名前: (合計秒数, 回数)}
+		self.peakMemory = None	# ピークメモリ(byte)。計測していない場合はNone
+		self.__stack = []
+		self.__beginTime = time.perf_counter()
+
+	@contextlib.contextmanager
+	def phase(self, name, /, **args):
+		self.__stack.append(name)
+		path = "/".join(self.__stack)
+		self.totals.setdefault(path, (0.0, 0))		# 開始順に並べるため、先に登録しておく
+		beginTime = time.perf_counter()
+		try:
+			yield
+		finally:
+			endTime = time.perf_counter()
+			self.__stack.pop()
+			total, cnt = self.totals.get(path, (0.0, 0))
+			self.totals[path] = (total + endTime - beginTime, cnt + 1)
+			self.events.append({
+				"name": name, "cat": "bake", "ph": "X", "pid": os.getpid(), "tid": 0,
+				"ts": (beginTime - self.__beginTime) * 1000000,
+				"dur": (endTime - beginTime) * 1000000,
+				"args": args,
+			})
+
+	def count(self, name, n=1):
+		self.counters[name] = self.counters.get(name, 0) + n
+
+	@contextlib.contextmanager
+	def timer(self, name):
+		beginTime = time.perf_counter()
+		try:
+			yield
+		finally:
+			total, cnt = self.timers.get(name, (0.0, 0))
+			self.timers[name] = (total + time.perf_counter() - beginTime, cnt + 1)
+
+	# 集計結果をコンソールに出力する
+	def printSummary(self):
+		if self.traceMemory:
+			print("[ExportFBX] Profile (timings measured with tracemalloc on, slower than normal):")
+		else:
+			print("[ExportFBX] Profile:")
+		for path, (total, cnt) in self.totals.items():
+			depth = path.count("/")
+			print("  {}{:<{}} {:9.3f}s{}".format(
+				"  " * depth, path.rsplit("/", 1)[-1], 32 - depth*2, total,
+				"" if cnt == 1 else " ({} times)".format(cnt) ))
+		for name, (total, cnt) in sorted(self.timers.items()):
+			print("  {:<32} {:9.3f}s ({} times)".format(name, total, cnt))
+		for name, n in sorted(self.counters.items()):
+			print("  {:<32} {:>10}".format(name, n))
+		if self.peakMemory is not None:
+			print("  {:<32} {:9.1f}MB".format("peak memory (Python)", self.peakMemory / (1024*1024)))
+
+	# Chromeのトレース形式のJSONを書き出す
+	def writeTrace(self, path):
+		with open(path, "w", encoding="utf-8") as f:
+			json.dump({
+				"traceEvents": sorted(self.events, key=lambda i: i["ts"]),
+				"displayTimeUnit": "ms",
+				"otherData": {
+					"counters": self.counters,
+					"timers": {k: {"seconds": v[0], "count": v[1]} for k, v in self.timers.items()},
+					"traceMemory": self.traceMemory,
+					"peakMemory": self.peakMemory,
+				},
+			}, f)
+
+# 計測していない間に使用する、何もしないもの
+class _NullProfiler:
+	def phase(self, name, /, **args): return contextlib.nullcontext()
+	def count(self, name, n=1): pass
+	def timer(self, name): return contextlib.nullcontext()
+
+# 計測中のProfiler
+_current = _NullProfiler()
+
+
+#-------------------------------------------------------
+
+# with文の間の処理を計測する。
+# enabledがFalseの場合は何もしない。tracePathを指定した場合は、終了時にトレースを書き出す。
+# traceMemoryがTrueの場合は、tracemallocでピークメモリも計測する
+@contextlib.contextmanager
+def profiling(enabled=True, tracePath=None, traceMemory=False):
+	global _current
+	if not enabled or isinstance(_current, Profiler):
+		yield _current
+		return
+
+	profiler = Profiler(traceMemory)
+	isTracing = tracemalloc.is_tracing()
+	if traceMemory:
+		if not isTracing: tracemalloc.start()
+		elif hasattr(tracemalloc, "reset_peak"): tracemalloc.reset_peak()
+	_current = profiler
+	try:
+		with profiler.phase("total"):
+			yield profiler
+	finally:
+		_current = _NullProfiler()
+		if traceMemory:
+			profiler.peakMemory = tracemalloc.get_traced_memory()[1]
+			if not isTracing: tracemalloc.stop()
+		profiler.printSummary()
+		if tracePath is not None:
+			profiler.writeTrace(tracePath)
+			print("[ExportFBX] Trace: " + tracePath)
+
+# 計測中のProfilerに対する操作
+def phase(name, /, **args): return _current.phase(name, **args)
+def count(name, n=1): _current.count(name, n)
+def timer(name): return _current.timer(name)
@@ -0,0 +1,102 @@
+#
+# 作業状態を壊さずにベイク・出力するために、Armatureとアクションの一時的な複製を作るモジュール。
+#
+# 複製したArmatureを元のArmatureと差し替え（コレクション・親子関係・モディファイア・
+# Constraint・Driverからの参照を全て複製側へ付け替える）、名前も入れ替えておくことで、
+# FBXには元と同じ名前で出力される。出力後は参照と名前を元に戻し、複製だけを削除するので、
+# revert_mainfileによるファイルの再読み込みが不要になる。
+#
+
+import bpy
+
+
+# 一時的に元のデータに付ける名前の接尾辞
+ORIGINAL_SUFFIX = ".bakebfbx_orig"
+
+# IDの名前の最大バイト数(UTF-8)。これを超える部分は切り詰められる
+MAX_NAME_BYTES = 63
+
+# 元のアクションに一時的に追加する、解決できないパスのF-Curve。
+# FBX出力の All Actions は、全パスを解決できるアクションのみを出力するので、
+# これを追加しておくことで元のアクションが出力されないようにする。
+EXCLUDE_DATA_PATH = '["bakebfbx_exclude"]'
+
+
+#-------------------------------------------------------
+
+# Armatureとアクションの一時的な複製
+class TempBakeCopy:
+	def __init__(self, armature, actions):
+		self.orig = armature
+		self.origActions = list(actions)
+		self.copy = None
+		self.copyActions = []
+		self.origNames = {}			# {名前を変更した元のID: 元の名前}
+		self.excludedActions = []	# 除外用のF-Curveを追加した元のアクション
+
+	# 複製を作成して、元のArmatureと差し替える
+	def begin(self):
+		orig = self.orig
+
+		# アクションを複製
+		self.copyActions = [i.copy() for i in self.origActions]
+		actionMap = dict(zip(self.origActions, self.copyActions))
+
+		# Armatureを複製し、アニメーションは複製したアクションを参照させる
+		copy = orig.copy()
+		copy.data = orig.data.copy()
+		self.copy = copy
+		animData = copy.animation_data
+		if animData.action in actionMap: animData.action = actionMap[animData.action]
+		for track in animData.nla_tracks:
+			for strip in track.strips:
+				if strip.action in actionMap: strip.action = actionMap[strip.action]
+
+		# 元のArmatureへの参照を、全て複製側へ付け替える。
+		# 複製自身のDriver・Constraintからの参照も、これで複製側を指すようになる
+		orig.user_remap(copy)
+
+		# 名前を入れ替える。元の名前は接尾辞から復元せずに、記録したものに戻す
+		for src, dst in [(orig, copy), (orig.data, copy.data)] + list(actionMap.items()):
+			name = src.name
+			self.origNames[src] = name
+			src.name = _tempName(name)
+			dst.name = name
+
+		# 元のアクションがFBXに出力されないようにする
+		for action in self.origActions:
+			if action.fcurves.find(EXCLUDE_DATA_PATH) is not None: continue
+			action.fcurves.new(EXCLUDE_DATA_PATH)
+			self.excludedActions.append(action)
+
+		return copy
+
+	# 参照と名前を元に戻し、複製を削除する
+	def end(self):
+		if self.copy is None: return
+		orig = self.orig
+		copy = self.copy
+		copyData = copy.data
+
+		try:
+			for action in self.excludedActions:
+				fcu = action.fcurves.find(EXCLUDE_DATA_PATH)
+				if fcu is not None: action.fcurves.remove(fcu)
+			self.excludedActions = []
+
+			copy.user_remap(orig)
+			bpy.data.objects.remove(copy)
+			bpy.data.armatures.remove(copyData)
+			for action in self.copyActions: bpy.data.actions.remove(action)
+			self.copy = None
+			self.copyActions = []
+		finally:
+			# 複製の削除に失敗しても、元のデータの名前は必ず戻す
+			for src, name in self.origNames.items(): src.name = name
+			self.origNames = {}
+
+# 一時的に元のデータに付ける名前。
+# 長い名前では接尾辞が切り詰められて元の名前と同じになりうるので、元の名前の側を切り詰める
+def _tempName(name):
+	maxBytes = MAX_NAME_BYTES - len(ORIGINAL_SUFFIX.encode("utf-8"))
+	return name.encode("utf-8")[:maxBytes].decode("utf-8", "ignore") + ORIGINAL_SUFFIX
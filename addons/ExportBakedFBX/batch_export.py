@@ -0,0 +1,243 @@
+#
+# 複数の.blendファイルを、コマンドラインから一括でベイク・FBX出力するモジュール。
+#
+#	blender -b --python addons/ExportBakedFBX/batch_export.py -- [オプション] 入力ファイル...
+#	python addons/ExportBakedFBX/batch_export.py --blender [Blenderのパス] [オプション] 入力ファイル...
+#
+# 入力ファイルにはワイルドカード（**を含む）を指定できる。
+# 親プロセスはファイルごとのジョブをキューに積み、--jobs個のバックグラウンドBlenderプロセスで
+# 並列に処理する。失敗・タイムアウトしたジョブは--retries回まで再実行し、
+# ファイルごとの処理時間と結果を出力フォルダのbatch_report.jsonにまとめる。
+# 子プロセスは.blendファイルを開き直して、bakeAnimとexportFBXを行うだけなので、
+# 作業状態のリバートは行わない（保存もしないので、元のファイルは変更されない）。
+#
+# 親プロセスはbpyに依存しないので、Blender外のPythonからも実行できる。
+#
+
+import os
+import sys
+import glob
+import json
+import time
+import signal
+import argparse
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# 集計結果を書き出すファイル名
+REPORT_FILE_NAME = "batch_report.json"
+
+
+#-------------------------------------------------------
+
+# 親プロセス側の処理。戻り値はプロセスの終了コード
+def main(argv=None):
+	args = _parseArgs(argv)
+	blendPaths = _expandInputs(args.inputs)
+	if not blendPaths:
+		print("[BatchExport] No .blend files found")
+		return 1
+
+	# 出力先を決める。別フォルダの同名ファイルは出力が衝突するので、事前に弾いておく
+	outDir = os.path.abspath(args.output_dir)
+	os.makedirs(outDir, exist_ok=True)
+	jobs = []
+	fbxPaths = set()
+	for blendPath in blendPaths:
+		name = os.path.splitext(os.path.basename(blendPath))[0]
+		fbxPath = os.path.join(outDir, name + ".fbx")
+		if fbxPath in fbxPaths:
+			print("[BatchExport] Duplicate output name: " + fbxPath)
+			return 1
+		fbxPaths.add(fbxPath)
+		jobs.append({
+			"blend": blendPath,
+			"fbx": fbxPath,
+			"log": os.path.join(outDir, name + ".log"),
+			"animType": args.anim_type,
+			"autoexec": args.enable_autoexec,
+			"settings": {
+				"workerCount": args.bake_workers,
+				"workerTimeout": args.bake_worker_timeout,
+				"refreshMode": args.refresh_mode,
+				"reduceKeys": args.reduce_keys,
+				"useCache": args.cache,
+				"forceRebake": args.force_rebake,
+				"profile": args.profile,
+				"writeTrace": args.profile,
+				"traceMemory": args.profile_memory,
+			},
+		})
+
+	blender = args.blender or _defaultBlender()
+	print("[BatchExport] {} files, {} jobs in parallel".format(len(jobs), args.jobs))
+
+	# ジョブキューを、jobs個のスレッドから子プロセスを起動して消化する
+	lock = threading.Lock()
+	def runJob(job):
+		result = _runWithRetry(blender, job, args.retries, args.timeout)
+		with lock:
+			print("[BatchExport] {}: {} ({:.1f}s, {} attempts)".format(
+				result["status"], job["blend"], result["seconds"], result["attempts"] ))
+		return result
+
+	beginTime = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+		results = list(executor.map(runJob, jobs))
+	totalSeconds = time.perf_counter() - beginTime
+
+	# 集計結果を書き出す
+	failedCnt = sum(1 for i in results if i["status"] != "OK")
+	report = {
+		"blender": blender,
+		"outputDir": outDir,
+		"jobs": args.jobs,
+		"totalSeconds": totalSeconds,
+		"succeeded": len(results) - failedCnt,
+		"failed": failedCnt,
+		"files": results,
+	}
+	reportPath = args.report or os.path.join(outDir, REPORT_FILE_NAME)
+	with open(reportPath, "w", encoding="utf-8") as f:
+		json.dump(report, f, indent="\t")
+
+	print("[BatchExport] Complete: {} succeeded, {} failed, {:.1f}s. Report: {}".format(
+		report["succeeded"], failedCnt, totalSeconds, reportPath ))
+	return 0 if failedCnt == 0 else 1
+
+def _parseArgs(argv):
+	if argv is None:
+		# Blenderから実行された場合は、"--" 以降が自分宛ての引数
+		argv = sys.argv[sys.argv.index("--")+1:] if "--" in sys.argv else sys.argv[1:]
+	parser = argparse.ArgumentParser(
+		prog="batch_export",
+		description="Bake and export FBX from many .blend files with background Blender processes" )
+	parser.add_argument("inputs", nargs="+", help=".blend files or glob patterns")
+	parser.add_argument("-o", "--output-dir", required=True, help="output folder of FBX files, logs and report")
+	parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of parallel Blender processes")
+	parser.add_argument("--retries", type=int, default=1, help="number of retries of a failed file")
+	parser.add_argument("--timeout", type=float, default=None, help="timeout seconds per attempt")
+	parser.add_argument("--blender", default=None, help="path of the Blender executable")
+	parser.add_argument("--report", default=None, help="path of the summary JSON (default: <output-dir>/" + REPORT_FILE_NAME + ")")
+	parser.add_argument("--enable-autoexec", action="store_true", help="allow Python drivers in the .blend files to run")
+	parser.add_argument("--anim-type", default="ActiveNLA", choices=("ActiveNLA", "AllNLA", "AllActions"))
+	parser.add_argument("--bake-workers", type=int, default=1, help="sampling workers per file")
+	parser.add_argument("--bake-worker-timeout", type=float, default=3600, help="seconds to wait for the sampling workers (0: no limit)")
+	parser.add_argument("--refresh-mode", default="AUTO", choices=("AUTO", "ALWAYS"))
+	parser.add_argument("--reduce-keys", action="store_true")
+	parser.add_argument("--cache", action="store_true", help="use the bake cache next to each .blend file")
+	parser.add_argument("--force-rebake", action="store_true")
+	parser.add_argument("--profile", action="store_true", help="print phase timings and write a trace JSON next to each FBX")
+	parser.add_argument("--profile-memory", action="store_true", help="with --profile, also measure peak Python memory (slows down the timings)")
+	return parser.parse_args(argv)
+
+# 入力ファイル指定を展開する。順序を保ったまま、重複を除く
+def _expandInputs(inputs):
+	ret = []
+	for pattern in inputs:
+		paths = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+		for path in paths:
+			path = os.path.abspath(path)
+			if not path.endswith(".blend"): continue
+			if not os.path.isfile(path):
+				print("[BatchExport] File not found: " + path)
+				continue
+			if path not in ret: ret.append(path)
+	return ret
+
+# Blenderから実行された場合はそのBlenderを、そうでなければPATH上のものを使用する
+def _defaultBlender():
+	try:
+		import bpy
+		return bpy.app.binary_path
+	except ImportError:
+		return "blender"
+
+# 1ファイル分のジョブを、失敗した場合はretries回まで再実行する
+def _runWithRetry(blender, job, retries, timeout):
+	result = {"blend": job["blend"], "fbx": job["fbx"], "log": job["log"], "attempts": 0}
+	beginTime = time.perf_counter()
+	for attempt in range(retries + 1):
+		result["attempts"] = attempt + 1
+		status = _runChild(blender, job, attempt, timeout)
+		if status == "OK": break
+	result["status"] = status
+	result["seconds"] = time.perf_counter() - beginTime
+	if status == "OK": result["fbxBytes"] = os.path.getsize(job["fbx"])
+	return result
+
+# 子プロセスを1回実行する。戻り値は "OK" / "FAILED" / "TIMEOUT"
+def _runChild(blender, job, attempt, timeout):
+	addonDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	expr = "import sys; sys.path.insert(0, {!r}); from {} import batch_export; batch_export.childMain()".format(
+		addonDir, os.path.basename(os.path.dirname(os.path.abspath(__file__))) )
+	cmd = [blender, "-b", "--factory-startup"]
+	if job["autoexec"]: cmd.append("--enable-autoexec")
+	cmd += [job["blend"], "--python-exit-code", "1", "--python-expr", expr, "--", json.dumps(job)]
+
+	# 前回の出力が残っていると成否を判断できないので、消しておく
+	if os.path.exists(job["fbx"]): os.remove(job["fbx"])
+	with open(job["log"], "w" if attempt == 0 else "a") as log:
+		log.write("---- attempt {} ----\n".format(attempt + 1))
+		log.flush()
+		# 子プロセスが起動したベイクワーカーもまとめて終了できるように、別のプロセスグループで起動する
+		if os.name == "nt":
+			proc = subprocess.Popen(
+				cmd, stdout=log, stderr=subprocess.STDOUT, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP )
+		else:
+			proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+		try:
+			proc.wait(timeout)
+		except subprocess.TimeoutExpired:
+			_killProcessGroup(proc)
+			log.write("\n[BatchExport] Timeout\n")
+			return "TIMEOUT"
+		except:
+			_killProcessGroup(proc)
+			raise
+	if proc.returncode != 0 or not os.path.exists(job["fbx"]): return "FAILED"
+	return "OK"
+
+# 子プロセスと、そこから起動されたベイクワーカーを終了させる
+def _killProcessGroup(proc):
+	if os.name == "nt":
+		subprocess.run(
+			["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+			stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL )
+	else:
+		try:
+			os.killpg(proc.pid, signal.SIGKILL)
+		except ProcessLookupError:
+			pass
+	if proc.poll() is None: proc.kill()
+	proc.wait()
+
+
+#-------------------------------------------------------
+
+# 子プロセス側の処理。
+# コマンドライン引数の "--" 以降に、JSON文字列でジョブを受け取る
+def childMain():
+	from . import bake_proc
+	from . import bake_profile
+	from .bake_parallel import ConsoleReporter
+
+	job = json.loads(sys.argv[sys.argv.index("--")+1])
+	settings = bake_proc.BakeSettings(**job["settings"])
+	reporter = ConsoleReporter()
+
+	print("[BatchExport] Begin: " + job["blend"])
+	with bake_profile.profiling(
+		settings.profile, bake_proc.traceFilePath(job["fbx"]) if settings.writeTrace else None, settings.traceMemory ):
+		with bake_profile.phase("bake"):
+			if not bake_proc.bakeAnim(reporter, settings):
+				raise RuntimeError("Bake failed: " + job["blend"])
+		with bake_profile.phase("exportFBX"):
+			bake_proc.exportFBX(reporter, job["fbx"], job["animType"], settings=settings)
+	print("[BatchExport] Complete: " + job["fbx"])
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -2,6 +2,10 @@
 import bpy
 import math
 import os
+import re
+import numpy as np
+
+from .driver_expr import usesFrame
 
 
 # ボーンの状態を更新する。
@@ -15,25 +19,406 @@ def forceRefreshBones(armature):
 	for i in armature.data.bones: i.select = False
 	bpy.context.view_layer.update()
 
-# ボーンのL2Wマトリクスを取得する。
+# forceRefreshBonesによる強制再更新が必要なDriver/Constraintを探す。
+# 姿勢の反映が1フレーム遅延するのは、Armature自身（もしくはArmatureに依存するオブジェクト）の
+# 評価済み行列を読み取るものなので、そのようなものが無ければ強制再更新は不要。
+# 判断できないもの（任意の処理を行えるスクリプトのDriver等）は、必要とみなす。
+# 戻り値は必要な理由の文字列。不要な場合はNone
+def findLaggingDependency(armature):
+	for animData, owner in (
+		(armature.animation_data, armature.name),
+		(armature.data.animation_data, armature.data.name),
+	):
+		if animData is None: continue
+		for fcu in animData.drivers:
+			drv = fcu.driver
+			name = "Driver {}: {}[{}]".format(owner, fcu.data_path, fcu.array_index)
+			if drv.type == 'SCRIPTED' and (drv.use_self or not drv.is_simple_expression):
+				return name + " (scripted expression)"
+			for var in drv.variables:
+				for tgt in var.targets:
+					if not _dependsOn(tgt.id, armature): continue
+					if var.type in ('TRANSFORMS', 'LOC_DIFF', 'ROTATION_DIFF'):
+						return name + " (reads transforms)"
+					if var.type == 'SINGLE_PROP' and "matrix" in tgt.data_path:
+						return name + " (reads matrix)"
+
+	# 他のオブジェクトを経由してArmature自身に依存するConstraint
+	for bone in armature.pose.bones:
+		for cns in bone.constraints:
+			for tgt in constraintTargets(cns):
+				if tgt != armature and _dependsOn(tgt, armature):
+					return "Constraint {}: {}".format(bone.name, cns.name)
+	return None
+
+# IDが、parentやConstraint、Driverを経由してArmatureに依存しているか否か
+def _dependsOn(id, armature, visited=None):
+	if id is None: return False
+	if id == armature or id == armature.data: return True
+	if not isinstance(id, bpy.types.Object): return False
+	if visited is None: visited = set()
+	if id.name in visited: return False
+	visited.add(id.name)
+
+	if _dependsOn(id.parent, armature, visited): return True
+	for cns in id.constraints:
+		for tgt in constraintTargets(cns):
+			if _dependsOn(tgt, armature, visited): return True
+	if id.animation_data:
+		for fcu in id.animation_data.drivers:
+			for var in fcu.driver.variables:
+				for tgt in var.targets:
+					if _dependsOn(tgt.id, armature, visited): return True
+	return False
+
+# Constraintのターゲットオブジェクト一覧
+def constraintTargets(cns):
+	ret = []
+	if getattr(cns, "target", None) is not None: ret.append(cns.target)
+	if getattr(cns, "pole_target", None) is not None: ret.append(cns.pole_target)
+	for i in getattr(cns, "targets", ()):
+		if i.target is not None: ret.append(i.target)
+	return ret
+
+# ボーンごとの、表示中のボーンレイヤー（Blender 4.0以降はボーンコレクション）に属しているか否かの配列。
+# ボーンコレクションに1つも属していないボーンは表示される。
+# ただしBlender 5.0以降は、ソロ表示のボーンコレクションがある場合は表示されない
+def _isInVisibleBoneGroup(arma):
+	n = len(arma.bones)
+	if hasattr(arma, "layers"):
+		buf = np.empty(n*32, dtype=bool)
+		arma.bones.foreach_get("layers", buf)
+		return (buf.reshape(n, 32) & np.array(arma.layers[:], dtype=bool)).any(axis=1)
+
+	# 親コレクションの非表示やソロ表示も考慮した表示状態は、4.1以降のみ
+	colls = getattr(arma, "collections_all", arma.collections)
+	visible = {i.name for i in colls if getattr(i, "is_visible_effectively", i.is_visible)}
+	isNoneVisible = bpy.app.version < (5, 0, 0) or not any(getattr(i, "is_solo", False) for i in colls)
+	return np.array([
+		any(c.name in visible for c in i.collections) if len(i.collections) != 0 else isNoneVisible
+		for i in arma.bones ], dtype=bool)
+
+# ポーズボーンのTransformを、全ボーンを選択してpose.transforms_clearを実行したのと同じ状態にする。
+# オペレータを使用せず、foreach_get/foreach_setでまとめて設定する。
+# pose.select_allで選択されるのは表示中の選択可能なボーンのみなので、それ以外のボーンは
+# 元から選択されていたもの以外は変更しない。
+# ロックされた要素は変更せず、回転は現在の回転モードのものだけを初期化する。
+def clearPoseTransforms(armature):
+	pose = armature.pose
+	arma = armature.data
+	n = len(pose.bones)
+	if n == 0: return
+
+	def get(coll, prop, width, dtype):
+		buf = np.empty(len(coll)*width, dtype=dtype)
+		coll.foreach_get(prop, buf)
+		return buf.reshape(len(coll), width) if width != 1 else buf
+	def put(prop, vals, dtype=np.float32):
+		pose.bones.foreach_set(prop, np.ascontiguousarray(vals, dtype=dtype).reshape(-1))
+
+	# 選択されるボーン。
+	# 非表示・選択状態は、Blender 5.0以降はポーズボーン側、それより前はボーン側にある
+	dataIdx = {j:i for i,j in enumerate(arma.bones.keys())}
+	poseToData = np.array([dataIdx[i.name] for i in pose.bones], dtype=np.int64)
+	poseProps = pose.bones[0].bl_rna.properties.keys()
+	isHidden = get(pose.bones, "hide", 1, bool) if "hide" in poseProps else get(arma.bones, "hide", 1, bool)[poseToData]
+	isSelected = get(pose.bones, "select", 1, bool) if "select" in poseProps else get(arma.bones, "select", 1, bool)[poseToData]
+	isVisible = ~isHidden \
+		& _isInVisibleBoneGroup(arma)[poseToData] \
+		& (~get(arma.bones, "hide_select", 1, bool)[poseToData] | isSelected)
+
+	lockLoc = get(pose.bones, "lock_location", 3, bool)
+	lockRot = get(pose.bones, "lock_rotation", 3, bool)
+	lockW = get(pose.bones, "lock_rotation_w", 1, bool)
+	lock4D = get(pose.bones, "lock_rotations_4d", 1, bool)
+	lockScl = get(pose.bones, "lock_scale", 3, bool)
+	modes = np.array([i.rotation_mode for i in pose.bones])
+	isQuat = modes == 'QUATERNION'
+	isAxisAngle = modes == 'AXIS_ANGLE'
+	isEuler = ~isQuat & ~isAxisAngle
+
+	# 位置・スケール
+	loc = get(pose.bones, "location", 3, np.float32)
+	loc[isVisible[:,None] & ~lockLoc] = 0
+	put("location", loc)
+	scl = get(pose.bones, "scale", 3, np.float32)
+	scl[isVisible[:,None] & ~lockScl] = 1
+	put("scale", scl)
+
+	# 回転。ロックが無いものは、そのまま初期化する
+	quat = get(pose.bones, "rotation_quaternion", 4, np.float32)
+	axisAngle = get(pose.bones, "rotation_axis_angle", 4, np.float32)
+	euler = get(pose.bones, "rotation_euler", 3, np.float32)
+	isLocked = lockRot.any(axis=1) | lockW
+	isFree = isVisible & ~isLocked
+	quat[isFree & isQuat] = (1, 0, 0, 0)
+	axisAngle[isFree & isAxisAngle] = (0, 0, 1, 0)
+	euler[isFree & isEuler] = 0
+
+	# 4要素を個別にロックしているものは、ロックされていない要素だけを初期化する
+	is4D = isVisible & isLocked & lock4D
+	lock4 = np.concatenate((lockW[:,None], lockRot), axis=1)
+	sel = is4D[:,None] & isQuat[:,None] & ~lock4
+	quat[sel] = np.broadcast_to(np.array((1, 0, 0, 0), dtype=np.float32), quat.shape)[sel]
+	axisAngle[is4D[:,None] & isAxisAngle[:,None] & ~lock4] = 0
+	axis = axisAngle[:, 1:]
+	isZeroAxis = is4D & isAxisAngle & (axis[:,0] == axis[:,1]) & (axis[:,1] == axis[:,2])
+	axisAngle[isZeroAxis, 2] = 1
+	euler[is4D[:,None] & isEuler[:,None] & ~lockRot] = 0
+
+	# それ以外のロックは、オイラー角に変換してロックされていない軸を0にする（ほぼ使われないので1つずつ行う）
+	for i in np.flatnonzero(isVisible & isLocked & ~lock4D):
+		quat[i], axisAngle[i], euler[i] = _clearLockedRotation(
+			modes[i], quat[i], axisAngle[i], euler[i], lockRot[i] )
+
+	put("rotation_quaternion", quat)
+	put("rotation_axis_angle", axisAngle)
+	put("rotation_euler", euler)
+
+	# B-Boneのロール・カーブ・イーズ・スケール
+	for prop, width, val in (
+		("bbone_rollin", 1, 0), ("bbone_rollout", 1, 0),
+		("bbone_curveinx", 1, 0), ("bbone_curveinz", 1, 0),
+		("bbone_curveoutx", 1, 0), ("bbone_curveoutz", 1, 0),
+		("bbone_easein", 1, 0), ("bbone_easeout", 1, 0),
+		("bbone_scalein", 3, 1), ("bbone_scaleout", 3, 1),
+	):
+		vals = get(pose.bones, prop, width, np.float32)
+		vals[isVisible] = val
+		put(prop, vals)
+
+# 一部の軸の回転がロックされたボーンの回転を、オイラー角の形で初期化する。
+# Blenderのpchan_clear_rotと同じ計算を行う。戻り値は (四元数, 軸角度, オイラー角)
+def _clearLockedRotation(mode, quat, axisAngle, euler, lockRot):
+	from mathutils import Euler, Quaternion
+	quat = quat.copy()
+	axisAngle = axisAngle.copy()
+	euler = euler.copy()
+	if mode == 'QUATERNION':
+		qlen = Quaternion(quat).magnitude
+		quat1 = Quaternion(quat).normalized() if qlen != 0 else Quaternion((0, 0, 0, 0))
+		oldEuler = quat1.to_euler('XYZ')
+	elif mode == 'AXIS_ANGLE':
+		oldEuler = Quaternion(axisAngle[1:], axisAngle[0]).to_euler('XYZ')
+	else:
+		oldEuler = euler.copy()
+	newEuler = [oldEuler[i] if lockRot[i] else 0.0 for i in range(3)]
+
+	if mode == 'QUATERNION':
+		q = Euler(newEuler, 'XYZ').to_quaternion() * qlen
+		# 回転の蓄積が正しくなるように、wの符号を元の四元数に合わせる
+		if (quat1.w < 0 and q.w > 0) or (quat1.w > 0 and q.w < 0): q = -q
+		quat[:] = q
+	elif mode == 'AXIS_ANGLE':
+		axis, angle = Euler(newEuler, 'XYZ').to_quaternion().to_axis_angle()
+		axisAngle[:] = (angle,) + tuple(axis)
+	else:
+		euler[:] = newEuler
+	return quat, axisAngle, euler
+
+# data_pathから、対象のポーズボーン名を取り出すための正規表現
+_POSE_BONE_PATH = re.compile(r'^pose\.bones\["((?:[^"\\]|\\.)*)"\]')
+
+# "pose.bones[...]" で始まるdata_pathの、ボーン名。それ以外の場合はNone
+def poseBoneNameOf(dataPath):
+	m = _POSE_BONE_PATH.match(dataPath)
+	if m is None: return None
+	return re.sub(r'\\(.)', r'\1', m.group(1))
+
+# ボーンごとに、その姿勢に影響しうるボーンを調べる。
+# 親ボーン・Constraintのサブターゲット・IKチェーン・Driverの参照先をたどり、
+# それらのボーンのF-Curve（"pose.bones[...]" 以下）だけが姿勢に影響するとみなせるものを求める。
+# 他のオブジェクトやボーン以外のプロパティを参照するものなど、判断できない場合はNoneとする。
+# 戻り値は {ボーン名: 影響するボーン名のset もしくは None}
+def getBoneInfluences(armature, boneNames):
+	pose = armature.pose
+
+	# ボーンごとの、直接影響するボーン名のset。判断できない場合はNone
+	direct = {i.name: {i.name} for i in pose.bones}
+	def addDeps(name, deps):
+		if direct[name] is None: return
+		if deps is None: direct[name] = None
+		else: direct[name] |= deps
+
+	for bone in pose.bones:
+		if bone.parent is not None: addDeps(bone.name, {bone.parent.name})
+		for cns in bone.constraints:
+			deps = _constraintBoneDeps(cns, armature)
+			addDeps(bone.name, deps)
+
+			# IKは、チェーン上の親ボーンの姿勢も変更する
+			if cns.type in ('IK', 'SPLINE_IK'):
+				chain = bone.parent
+				for i in range(cns.chain_count - 1 if cns.chain_count else len(pose.bones)):
+					if chain is None: break
+					addDeps(chain.name, None if deps is None else deps | {bone.name})
+					chain = chain.parent
+
+	# Driverは、駆動するプロパティのボーンに影響する。
+	# オブジェクトのボーン以外のプロパティはボーンのローカル行列に影響しないが、
+	# Armatureデータのボーン以外のプロパティ(pose_position等)は全ボーンに影響しうる
+	for animData, boneNameOf in (
+		(armature.animation_data, poseBoneNameOf),
+		(armature.data.animation_data, _dataBoneNameOf),
+	):
+		if animData is None: continue
+		for fcu in animData.drivers:
+			name = boneNameOf(fcu.data_path)
+			if name is None:
+				if boneNameOf == _dataBoneNameOf: return {i: None for i in boneNames}
+				continue
+			if name in direct: addDeps(name, _driverBoneDeps(fcu.driver, armature))
+
+	# 影響を推移的にたどる
+	ret = {}
+	for name in boneNames:
+		influences = set()
+		stack = [name]
+		while stack:
+			cur = stack.pop()
+			if cur in influences: continue
+			if cur not in direct or direct[cur] is None:
+				influences = None
+				break
+			influences.add(cur)
+			stack += direct[cur]
+		ret[name] = influences
+	return ret
+
+# "bones[...]" で始まるArmatureデータのdata_pathの、ボーン名。それ以外の場合はNone
+def _dataBoneNameOf(dataPath):
+	if not dataPath.startswith("bones"): return None
+	return poseBoneNameOf("pose." + dataPath)
+
+# Constraintが参照する、同じArmature内のボーン名のset。判断できない場合はNone
+def _constraintBoneDeps(cns, armature):
+	ret = set()
+	tgts = []
+	if hasattr(cns, "target"): tgts.append((cns.target, getattr(cns, "subtarget", "")))
+	if hasattr(cns, "pole_target"): tgts.append((cns.pole_target, cns.pole_subtarget))
+	for i in getattr(cns, "targets", ()): tgts.append((i.target, i.subtarget))
+	if getattr(cns, "space_object", None) is not None: tgts.append((cns.space_object, cns.space_subtarget))
+	for tgt, subtarget in tgts:
+		if tgt is None: continue
+		if tgt != armature or not subtarget: return None
+		ret.add(subtarget)
+	return ret
+
+# Driverが参照する、同じArmature内のボーン名のset。判断できない場合はNone。
+# 現在のフレーム番号を参照する式は、キーの範囲外でも値が変化するので判断できないものとする
+def _driverBoneDeps(drv, armature):
+	if drv.type == 'SCRIPTED':
+		if drv.use_self or not drv.is_simple_expression: return None
+		if usesFrame(drv.expression, [i.name for i in drv.variables]): return None
+	ret = set()
+	for var in drv.variables:
+		for tgt in var.targets:
+			if tgt.id != armature: return None
+			if var.type == 'SINGLE_PROP':
+				name = poseBoneNameOf(tgt.data_path)
+			else:
+				name = tgt.bone_target or None
+			if name is None: return None
+			ret.add(name)
+	return ret
+
+# ボーンのローカル行列（親ボーンおよび初期位置からの相対行列）をまとめて取得するもの。
 # そのままだと初期位置や親ボーンなども含めた行列しか取れず、
 # 直接回転などを取得できないため、これを使用する。
-def getBoneMtx(amt, boneName):
-	pBone = amt.pose.bones[boneName]
-	dBone = amt.data.bones[boneName]
-	pMtx = pBone.matrix.copy()
-	dMtx = dBone.matrix_local.copy()
-
-	if pBone.parent is not None:
-		pMtxP = pBone.parent.matrix.copy()
-		dMtxP = dBone.parent.matrix_local.copy()
-		pMtxP.invert()
-		dMtxP.invert()
-		pMtx = pMtxP @ pMtx
-		dMtx = dMtxP @ dMtx
-
-	dMtx.invert()
-	return dMtx @ pMtx
+# 初期位置(matrix_local)はベイク中に変化しないので、その逆行列は最初に一度だけ計算しておき、
+# フレームごとには全ポーズボーンの行列を一括で読み込んで、まとめて行列積を計算する。
+class BoneMtxSampler:
+	def __init__(self, armature, boneNames):
+		self.armature = armature
+		poseNames = [i.name for i in armature.pose.bones]
+		poseIdx = {j:i for i,j in enumerate(poseNames)}
+		self.boneIdx = np.array([poseIdx[i] for i in boneNames], dtype=np.int64)
+		self.parentIdx = np.array([
+			-1 if armature.pose.bones[i].parent is None else poseIdx[armature.pose.bones[i].parent.name]
+			for i in boneNames ], dtype=np.int64)
+		self.__poseBuf = np.empty(len(poseNames)*16, dtype=np.float32)
+
+		# 親ボーンからの相対的な初期位置の逆行列
+		rest = getMatrixArray(armature.data.bones, "matrix_local").astype(np.float64)
+		restIdx = np.array([poseIdx[i.name] for i in armature.data.bones], dtype=np.int64)
+		restByPose = np.empty_like(rest)
+		restByPose[restIdx] = rest
+		restRel = self.__relative(restByPose)
+		self.invRestRel = np.linalg.inv(restRel)
+
+	# 現在の姿勢での、全対象ボーンのローカル行列を (ボーン数, 4, 4) のfloat32配列で得る
+	def sample(self):
+		self.armature.pose.bones.foreach_get("matrix", self.__poseBuf)
+		pose = _columnMajorToMatrices(self.__poseBuf).astype(np.float64)
+		poseRel = self.__relative(pose)
+		return np.einsum("nij,njk->nik", self.invRestRel, poseRel).astype(np.float32)
+
+	# 全ボーンの行列から、対象ボーンの親ボーンからの相対行列を計算する
+	def __relative(self, mtxs):
+		ret = mtxs[self.boneIdx]
+		hasParent = self.parentIdx != -1
+		parentInv = np.linalg.inv(mtxs[self.parentIdx[hasParent]])
+		ret[hasParent] = np.einsum("nij,njk->nik", parentInv, ret[hasParent])
+		return ret
+
+# コレクションの全要素の4x4行列プロパティを、(要素数, 4, 4) のfloat32配列として一括で取得する
+def getMatrixArray(collection, prop):
+	buf = np.empty(len(collection)*16, dtype=np.float32)
+	collection.foreach_get(prop, buf)
+	return _columnMajorToMatrices(buf)
+
+# foreach_getで得た行列の配列を、行優先の (要素数, 4, 4) 配列にする。
+# Blenderの行列は列優先で格納されているので、転置が必要
+def _columnMajorToMatrices(buf):
+	return buf.reshape(-1, 4, 4).transpose(0, 2, 1).copy()
+
+# 行列の配列 (..., 4, 4) を、位置 (...,3)・回転の四元数 (...,4) [w,x,y,z]・スケール (...,3) に分解する。
+# mathutilsの Matrix.to_translation / to_quaternion / to_scale と同じ計算を、まとめて行う。
+def decomposeMatrices(mtxs):
+	mtxs = np.asarray(mtxs, dtype=np.float64)
+	loc = mtxs[..., :3, 3]
+	mat3 = mtxs[..., :3, :3]
+	scl = np.linalg.norm(mat3, axis=-2)
+
+	# 各軸（列）を正規化し、m[...,i,j] がi列目j行目になるように転置しておく
+	m = np.swapaxes(mat3 / np.where(scl == 0, 1, scl)[..., None, :], -1, -2)
+	m00 = m[...,0,0]; m11 = m[...,1,1]; m22 = m[...,2,2]
+	trace = m00 + m11 + m22
+
+	# 対角成分の大きさによって、精度の良い計算式を選ぶ
+	q = np.zeros(mtxs.shape[:-2] + (4,), dtype=np.float64)
+	cases = (
+		( trace > 0,
+		  1.0 + trace,
+		  (0, 1, 2, 3),
+		  lambda s: (m[...,1,2]-m[...,2,1], m[...,2,0]-m[...,0,2], m[...,0,1]-m[...,1,0]) ),
+		( (m00 > m11) & (m00 > m22),
+		  1.0 + m00 - m11 - m22,
+		  (1, 0, 2, 3),
+		  lambda s: (m[...,1,2]-m[...,2,1], m[...,1,0]+m[...,0,1], m[...,2,0]+m[...,0,2]) ),
+		( m11 > m22,
+		  1.0 + m11 - m00 - m22,
+		  (2, 0, 1, 3),
+		  lambda s: (m[...,2,0]-m[...,0,2], m[...,1,0]+m[...,0,1], m[...,2,1]+m[...,1,2]) ),
+		( np.ones_like(trace, dtype=bool),
+		  1.0 + m22 - m00 - m11,
+		  (3, 0, 1, 2),
+		  lambda s: (m[...,0,1]-m[...,1,0], m[...,2,0]+m[...,0,2], m[...,2,1]+m[...,1,2]) ),
+	)
+	done = np.zeros(trace.shape, dtype=bool)
+	for cond, t, order, others in cases:
+		sel = cond & ~done
+		done |= sel
+		s = 2.0 * np.sqrt(np.maximum(t, 0))
+		inv = 1.0 / np.where(s == 0, 1, s)
+		vals = (0.25 * s,) + tuple(i * inv for i in others(s))
+		for i, v in zip(order, vals): q[..., i] = np.where(sel, v, q[..., i])
+
+	# trace > 0 以外の場合は、wが負にならないようにする
+	flip = (trace <= 0) & (q[...,0] < 0)
+	q[flip] *= -1
+	q /= np.linalg.norm(q, axis=-1, keepdims=True)
+	return loc, q, scl
 
 # 対象Armatureを取得する。1Armatureにだけ対応している。
 # （そもそも複数ArmatureはUnityで再生できない）
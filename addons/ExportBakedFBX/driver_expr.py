@@ -0,0 +1,30 @@
+#
+# Driverの式を解析するモジュール。
+#
+# Simple Expression の式は、変数・定数・組み込み関数の他に、現在のフレーム番号 frame を参照できる。
+# frameを参照する式はF-Curveのキーの範囲外でも値が変化するので、キーの範囲から影響を判断できない。
+# bpyに依存しないので、Blender外でも単体でimportして使用できる。
+#
+
+import ast
+
+
+# 式の中で、現在のフレーム番号を表す名前
+FRAME_NAME = "frame"
+
+
+#-------------------------------------------------------
+
+# 式が現在のフレーム番号を参照しているか否か。
+#	expression	: Driverの式
+#	varNames	: Driverの変数名のリスト。frameと同名の変数がある場合は、そちらが参照される
+# 式を解析できない場合は、参照しているものとして扱う
+def usesFrame(expression, varNames=()):
+	if FRAME_NAME in varNames: return False
+	try:
+		tree = ast.parse(expression, mode="eval")
+	except (SyntaxError, ValueError):
+		return True
+	return any(
+		isinstance(i, ast.Name) and i.id == FRAME_NAME
+		for i in ast.walk(tree) )
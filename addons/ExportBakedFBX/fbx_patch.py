@@ -0,0 +1,78 @@
+#
+# 組み込みのFBX出力（io_scene_fbx）の、アニメーション出力部分を高速化するモジュール。
+#
+# FBX出力はアニメーションを書き出す際に、シーンを1フレームずつ評価し直して行列を読み取る。
+# このときメッシュのモディファイア（Armatureによる変形等）も毎フレーム評価されるが、
+# アニメーションとして読み取るのはオブジェクトとボーンの行列・シェイプキーの値だけなので、
+# その間だけメッシュのモディファイアを無効にしておく。
+# メッシュの出力はアニメーションより前に終わっているので、出力内容は変わらない。
+# FBX出力による1フレームずつの評価し直し自体は残っており、その1フレームあたりの処理を軽くするだけ。
+# FBX出力の内部関数を差し替え、ユーザーのモディファイアの表示状態も一時的に変更するので、
+# BakeSettings.suspendMeshModifiers を指定した場合のみ使用する（デフォルトはOFF）。
+# 組み込みのFBX出力の構成が変わって差し替えられない場合は、何もせずにそのまま出力する。
+#
+
+import bpy
+import time
+import contextlib
+
+from .common_arma import constraintTargets
+from . import bake_profile
+
+
+#-------------------------------------------------------
+
+# with文の間に行われたFBX出力で、アニメーションの書き出し中だけメッシュのモディファイアを無効にする
+@contextlib.contextmanager
+def suspendMeshModifiers():
+	try:
+		from io_scene_fbx import export_fbx_bin
+	except ImportError:
+		export_fbx_bin = None
+	if not hasattr(export_fbx_bin, "fbx_animations"):
+		print("[ExportFBX] FBX exporter animation writer not found, mesh modifiers are not suspended")
+		yield
+		return
+
+	orig = export_fbx_bin.fbx_animations
+	def patched(*args, **kwargs):
+		mods = _suspendableModifiers()
+		for i in mods: i.show_viewport = False
+		beginTime = time.perf_counter()
+		try:
+			with bake_profile.phase("fbxAnimations", suspendedModifiers=len(mods)):
+				return orig(*args, **kwargs)
+		finally:
+			for i in mods: i.show_viewport = True
+			print("[ExportFBX] Animation export: {:.2f}s ({} mesh modifiers suspended)".format(
+				time.perf_counter() - beginTime, len(mods) ))
+
+	export_fbx_bin.fbx_animations = patched
+	try:
+		yield
+	finally:
+		export_fbx_bin.fbx_animations = orig
+
+# 無効にしても他のオブジェクトの行列に影響しない、有効なメッシュのモディファイア一覧。
+# 頂点ペアレントやConstraint・Driverのターゲットになっているメッシュは、
+# 変形後の形状から行列が決まる可能性があるので除外する
+def _suspendableModifiers():
+	referenced = set()
+	for obj in bpy.data.objects:
+		if obj.parent is not None: referenced.add(obj.parent.name)
+		cnsList = list(obj.constraints)
+		if obj.pose is not None:
+			for bone in obj.pose.bones: cnsList += bone.constraints
+		for cns in cnsList:
+			for tgt in constraintTargets(cns): referenced.add(tgt.name)
+		if obj.animation_data is not None:
+			for fcu in obj.animation_data.drivers:
+				for var in fcu.driver.variables:
+					for tgt in var.targets:
+						if tgt.id is not None: referenced.add(tgt.id.name)
+
+	ret = []
+	for obj in bpy.data.objects:
+		if obj.type != 'MESH' or obj.name in referenced: continue
+		ret += [i for i in obj.modifiers if i.show_viewport]
+	return ret
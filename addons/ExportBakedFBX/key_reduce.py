@@ -0,0 +1,101 @@
+#
+# ベイクしたキーフレームを間引くモジュール。
+#
+# キー間を直線補間したときに、元の全フレームの値との誤差がチャンネルごとの許容誤差以内に
+# 収まる範囲で、キーを取り除く。
+# 起点のキーから見て、途中の全フレームの許容範囲を通る傾きの範囲（扇形）を保持しながら
+# 1フレームずつ進めていくので、処理はフレーム数に比例する。全チャンネルを同時に処理する。
+# 残したキーはBEZIER補間で書き込むので、Blenderが計算したハンドルでの値をbezierValuesで求め、
+# 許容誤差を超えるフレームにキーを追加し直す（bake_proc側で行う）。
+# 間引くのはBlenderのアクションのキーのみ。FBX出力は全フレームをサンプリングし直すので、
+# FBXのサイズは変わらない。
+# bpyに依存しないので、Blender外でも単体でimportして使用できる。
+#
+
+import numpy as np
+
+
+# ベジェ曲線のパラメータを、二分法で求める際の反復回数
+BEZIER_SOLVE_ITERATIONS = 40
+
+
+#-------------------------------------------------------
+
+# 間引き後に残すキーを求める。
+#	vals	: (フレーム数, チャンネル数) 全フレームの値
+#	tol		: (チャンネル数,) もしくはスカラー。チャンネルごとの許容誤差
+# 戻り値は、残すキーを表す (フレーム数, チャンネル数) の真偽値配列。
+# 先頭と末尾のフレームは常に残す。
+def reduceKeys(vals, tol):
+	vals = np.asarray(vals, dtype=np.float64)
+	frameNum, chNum = vals.shape
+	tol = np.broadcast_to(np.asarray(tol, dtype=np.float64), (chNum,))
+	keep = np.zeros((frameNum, chNum), dtype=bool)
+	if frameNum == 0: return keep
+	keep[0] = True
+	keep[-1] = True
+
+	# チャンネルごとの、起点のフレーム番号と、そこから引ける直線の傾きの範囲
+	start = np.zeros(chNum, dtype=np.int64)
+	lo = np.full(chNum, -np.inf)
+	hi = np.full(chNum, np.inf)
+	ch = np.arange(chNum)
+	for j in range(1, frameNum):
+		y = vals[j]
+		startVal = vals[start, ch]
+		slope = (y - startVal) / (j - start)
+
+		# 途中のフレームの許容範囲を通らなくなったチャンネルは、1つ前のフレームを起点にする
+		isOver = (slope < lo) | (hi < slope)
+		keep[j-1, isOver] = True
+		start[isOver] = j - 1
+		lo[isOver] = -np.inf
+		hi[isOver] = np.inf
+
+		# このフレームの許容範囲で、傾きの範囲を狭める
+		startVal = vals[start, ch]
+		dx = j - start
+		lo = np.maximum(lo, (y - tol - startVal) / dx)
+		hi = np.minimum(hi, (y + tol - startVal) / dx)
+
+	return keep
+
+# 残したキーを直線補間したときの、全フレームでの最大誤差をチャンネルごとに求める（確認用）
+def reducedError(vals, keep):
+	vals = np.asarray(vals, dtype=np.float64)
+	frames = np.arange(len(vals))
+	err = np.zeros(vals.shape[1])
+	for c in range(vals.shape[1]):
+		k = np.flatnonzero(keep[:, c])
+		err[c] = np.abs(np.interp(frames, k, vals[k, c]) - vals[:, c]).max(initial=0)
+	return err
+
+# F-Curveのキー座標とハンドル座標から、BEZIER補間の値を求める。
+#	co, handleLeft, handleRight	: (キー数, 2) キーとその左右のハンドルの座標
+#	frames						: 値を求めるフレームの配列
+# キーの範囲外は、外挿がCONSTANTの場合と同じく端のキーの値にする。
+# ハンドルのX座標がキーの範囲内に収まっている（Blenderが補正済みの）ものとして、
+# 各区間のX座標の3次式を二分法で解いてから、Y座標を求める
+def bezierValues(co, handleLeft, handleRight, frames):
+	co = np.asarray(co, dtype=np.float64)
+	frames = np.asarray(frames, dtype=np.float64)
+	if len(co) == 1: return np.full(len(frames), co[0, 1])
+	seg = np.clip(np.searchsorted(co[:, 0], frames, side="right") - 1, 0, len(co) - 2)
+	p0 = co[seg]
+	p1 = np.asarray(handleRight, dtype=np.float64)[seg]
+	p2 = np.asarray(handleLeft, dtype=np.float64)[seg + 1]
+	p3 = co[seg + 1]
+	x = np.clip(frames, p0[:, 0], p3[:, 0])
+
+	def bezier(t, i):
+		u = 1 - t
+		return u*u*u*p0[:, i] + 3*u*u*t*p1[:, i] + 3*u*t*t*p2[:, i] + t*t*t*p3[:, i]
+
+	lo = np.zeros(len(frames))
+	hi = np.ones(len(frames))
+	for _ in range(BEZIER_SOLVE_ITERATIONS):
+		t = (lo + hi) / 2
+		isLess = bezier(t, 0) < x
+		lo = np.where(isLess, t, lo)
+		hi = np.where(isLess, hi, t)
+	return bezier((lo + hi) / 2, 1)
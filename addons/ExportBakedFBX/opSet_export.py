@@ -61,7 +61,24 @@ class OperatorSet(OperatorSet_Base):
 			if not self.filepath.endswith(".fbx") :
 				self.report({'WARNING'},'The extension must be .fbx')
 				return {'CANCELLED'}
-			if bake_proc.export( self, context, self.filepath, param.export_anim_type ):
+			settings = bake_proc.BakeSettings(
+				workerCount = param.bake_worker_count,
+				workerTimeout = param.bake_worker_timeout,
+				refreshMode = param.bone_refresh_mode,
+				reduceKeys = param.reduce_keys,
+				reduceTol = (param.reduce_tol_location, param.reduce_tol_rotation, param.reduce_tol_scale),
+				useCache = param.use_bake_cache,
+				cacheSizeMB = param.bake_cache_size,
+				forceRebake = param.force_rebake,
+				bakeOnCopy = param.bake_on_copy,
+				skipStatic = param.skip_static_channels,
+				restrictSampling = param.restrict_sampling,
+				suspendMeshModifiers = param.suspend_mesh_modifiers,
+				profile = param.profile_export,
+				writeTrace = param.write_trace,
+				traceMemory = param.profile_memory,
+			)
+			if bake_proc.export( self, context, self.filepath, param.export_anim_type, settings ):
 				return {'FINISHED'}
 			"""
 			self.report(
@@ -85,6 +102,34 @@ class OperatorSet(OperatorSet_Base):
 
 			col = layout.column()
 			col.prop(param, "export_anim_type")
+			col.prop(param, "bake_on_copy")
+			col.prop(param, "bake_worker_count")
+			sub = col.column()
+			sub.enabled = 1 < param.bake_worker_count
+			sub.prop(param, "bake_worker_timeout")
+			col.prop(param, "bone_refresh_mode")
+			col.prop(param, "restrict_sampling")
+			col.prop(param, "skip_static_channels")
+			col.prop(param, "suspend_mesh_modifiers")
+
+			col.prop(param, "reduce_keys")
+			sub = col.column()
+			sub.enabled = param.reduce_keys
+			sub.prop(param, "reduce_tol_location")
+			sub.prop(param, "reduce_tol_rotation")
+			sub.prop(param, "reduce_tol_scale")
+
+			col.prop(param, "use_bake_cache")
+			sub = col.column()
+			sub.enabled = param.use_bake_cache
+			sub.prop(param, "bake_cache_size")
+			sub.prop(param, "force_rebake")
+
+			col.prop(param, "profile_export")
+			col.prop(param, "write_trace")
+			sub = col.column()
+			sub.enabled = param.profile_export or param.write_trace
+			sub.prop(param, "profile_memory")
 
 
 	def __init__(self, props):
@@ -109,6 +154,136 @@ class OperatorSet(OperatorSet_Base):
 		props.export_anim_type: prm_anim_type
 		props.__annotations__["export_anim_type"] = prm_anim_type
 
+		prm_bake_on_copy = BoolProperty(
+			name="Bake On Copy",
+			description="Bake temporary copies of the armature and actions instead of reverting the file after export",
+			default=False,
+		)
+		props.bake_on_copy: prm_bake_on_copy
+		props.__annotations__["bake_on_copy"] = prm_bake_on_copy
+
+		prm_worker_count = IntProperty(
+			name="Bake Workers",
+			description="Number of background Blender processes sampling actions in parallel (1: sample in this process)",
+			default=1,
+			min=1,
+			max=64,
+		)
+		props.bake_worker_count: prm_worker_count
+		props.__annotations__["bake_worker_count"] = prm_worker_count
+
+		prm_worker_timeout = IntProperty(
+			name="Worker Timeout (s)",
+			description="Seconds to wait for the bake workers before killing them and failing the export (0: no limit)",
+			default=3600,
+			min=0,
+		)
+		props.bake_worker_timeout: prm_worker_timeout
+		props.__annotations__["bake_worker_timeout"] = prm_worker_timeout
+
+		prm_refresh_mode = EnumProperty(
+			name="Bone Refresh",
+			description="When to force the extra bone update needed by one-frame-lagging drivers/constraints",
+			items=[
+				('AUTO', "Auto", "Only when the rig has drivers/constraints reading its evaluated matrices"),
+				('ALWAYS', "Always", "On every sampled frame"),
+			],
+			default='AUTO'
+		)
+		props.bone_refresh_mode: prm_refresh_mode
+		props.__annotations__["bone_refresh_mode"] = prm_refresh_mode
+
+		prm_restrict_sampling = BoolProperty(
+			name="Restrict Sampling",
+			description="Skip evaluating frames outside the key ranges of the F-Curves influencing each bone",
+			default=False,
+		)
+		props.restrict_sampling: prm_restrict_sampling
+		props.__annotations__["restrict_sampling"] = prm_restrict_sampling
+
+		prm_skip_static = BoolProperty(
+			name="Skip Static Channels",
+			description="Write a single key for channels that never change, and no curve for channels staying at rest",
+			default=False,
+		)
+		props.skip_static_channels: prm_skip_static
+		props.__annotations__["skip_static_channels"] = prm_skip_static
+
+		prm_suspend_mods = BoolProperty(
+			name="Skip Mesh Deform On Export",
+			description="Experimental. Temporarily disable mesh modifiers while the FBX exporter re-evaluates the baked animation frame by frame. Patches the exporter's internals",
+			default=False,
+		)
+		props.suspend_mesh_modifiers: prm_suspend_mods
+		props.__annotations__["suspend_mesh_modifiers"] = prm_suspend_mods
+
+		prm_reduce_keys = BoolProperty(
+			name="Reduce Keys",
+			description="Remove baked keys while the Bezier curves stay within the tolerances at every frame. Only the baked actions get smaller: the FBX exporter re-samples every frame, so the FBX file size does not change",
+			default=False,
+		)
+		props.reduce_keys: prm_reduce_keys
+		props.__annotations__["reduce_keys"] = prm_reduce_keys
+
+		for name, label in (("location", "Location"), ("rotation", "Rotation"), ("scale", "Scale")):
+			prm_tol = FloatProperty(
+				name=label+" Tolerance",
+				description="Maximum error allowed when reducing "+name+" keys",
+				default=0.0001,
+				min=0.0,
+				precision=5,
+			)
+			props.__annotations__["reduce_tol_"+name] = prm_tol
+
+		prm_use_cache = BoolProperty(
+			name="Bake Cache",
+			description="Reuse sampled transforms of unchanged actions from a cache folder next to the .blend file",
+			default=False,
+		)
+		props.use_bake_cache: prm_use_cache
+		props.__annotations__["use_bake_cache"] = prm_use_cache
+
+		prm_cache_size = IntProperty(
+			name="Cache Size (MB)",
+			description="Maximum total size of the bake cache. Least recently used entries are removed first",
+			default=1024,
+			min=1,
+		)
+		props.bake_cache_size: prm_cache_size
+		props.__annotations__["bake_cache_size"] = prm_cache_size
+
+		prm_force_rebake = BoolProperty(
+			name="Force Full Rebake",
+			description="Ignore cached transforms and sample every action again",
+			default=False,
+		)
+		props.force_rebake: prm_force_rebake
+		props.__annotations__["force_rebake"] = prm_force_rebake
+
+		prm_profile = BoolProperty(
+			name="Profile",
+			description="Print the time of each export phase and counters to the console",
+			default=False,
+		)
+		props.profile_export: prm_profile
+		props.__annotations__["profile_export"] = prm_profile
+
+		prm_write_trace = BoolProperty(
+			name="Write Trace",
+			description="Write the profile as a Chrome trace JSON (.trace.json) next to the FBX file",
+			default=False,
+		)
+		props.write_trace: prm_write_trace
+		props.__annotations__["write_trace"] = prm_write_trace
+
+		prm_profile_memory = BoolProperty(
+			name="Profile Memory",
+			description="Also measure peak Python memory with tracemalloc. This slows down the export, so measure timings in a separate run",
+			default=False,
+		)
+		props.profile_memory: prm_profile_memory
+		props.__annotations__["profile_memory"] = prm_profile_memory
+
 
 	# プラグインをインストールしたときの処理
 	def register(self):
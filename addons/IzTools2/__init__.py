@@ -26,6 +26,10 @@ bl_info = {
 
 if "bpy" in locals():
 	import imp
+	imp.reload(uv_array)
+	imp.reload(uv_raster)
+	imp.reload(uv_audit)
+	imp.reload(draw_cache)
 	imp.reload(common_uv)
 	imp.reload(opSet_base)
 	imp.reload(opSet_pose_keying_all)
@@ -36,8 +40,13 @@ if "bpy" in locals():
 	imp.reload(opSet_uv_straight_relax)
 	imp.reload(opSet_uv_island_preview)
 	imp.reload(opSet_uv_edge_sync)
+	imp.reload(opSet_uv_padding_audit)
 	imp.reload(opSet_img_paint_brush)
 	imp.reload(opSet_view3d_viewsel_flat)
+from . import uv_array
+from . import uv_raster
+from . import uv_audit
+from . import draw_cache
 from . import common_uv
 from . import opSet_base
 from . import opSet_pose_keying_all
@@ -48,6 +57,7 @@ from . import opSet_uv_align
 from . import opSet_uv_straight_relax
 from . import opSet_uv_island_preview
 from . import opSet_uv_edge_sync
+from . import opSet_uv_padding_audit
 from . import opSet_img_paint_brush
 from . import opSet_view3d_viewsel_flat
 
@@ -95,6 +105,7 @@ opSet_Insts = [
 	opSet_uv_straight_relax.OperatorSet(PR_IzTools),
 	opSet_uv_island_preview.OperatorSet(PR_IzTools),
 	opSet_uv_edge_sync.OperatorSet(PR_IzTools),
+	opSet_uv_padding_audit.OperatorSet(PR_IzTools),
 	opSet_img_paint_brush.OperatorSet(PR_IzTools),
 	opSet_view3d_viewsel_flat.OperatorSet(PR_IzTools),
 ]
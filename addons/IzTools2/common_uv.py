@@ -3,6 +3,10 @@ import bpy
 import bmesh
 from mathutils import *
 import math
+import numpy as np
+
+from .uv_array import *
+from . import draw_cache
 
 
 # 現在PixelCenterFit状態か否かを取得する
@@ -62,6 +66,151 @@ def getSelectedUVVerts(bMeshes):
 
 	return result
 
+# 編集中オブジェクトとBMeshリストから、UVスナップショットを得る。
+# Mesh側へ編集内容を反映したうえで、foreach_getで全Loopの情報を一括で取得する。
+# Meshへの反映はDepsgraphの更新を引き起こすが、編集ではないので描画キャッシュには無視させる。
+# bmがNoneの要素は、ObjectモードのMeshとしてそのまま読み取る。
+# 描画中にMeshを書き換えるとクラッシュするので、描画ハンドラからはgetBMeshUVSnapshotを使用すること。
+# 戻り値は (スナップショット, 対象となった(obj,bm)のリスト)
+def getUVSnapshot(bmList):
+	parts = []
+	tgtList = []
+	for obj, bm in bmList:
+		me = obj.data
+		if bm is not None:
+			if bm.loops.layers.uv.active is None: continue
+
+			# EditモードのBMeshの内容をMeshへ書き出す。
+			# Editモード中のMeshからはUVなどの属性を読み取れないので、書き出した内容を一時的に複製して読み取る
+			obj.update_from_editmode()
+			draw_cache.markSelfUpdate(getIDKeys(obj))
+			me = me.copy()
+		try:
+			uvLayer = me.uv_layers.active
+			if uvLayer is None: continue
+
+			parts.append(getMeshUVArrays(me, uvLayer))
+			tgtList.append((obj, bm))
+		finally:
+			if me is not obj.data: bpy.data.meshes.remove(me)
+
+	return UVSnapshot.concat(parts), tgtList
+
+# 描画ハンドラ用の、Meshへの書き出しを行わずにBMeshから直接UVスナップショットを得る処理。
+# 1Loopずつ読み取るのでgetUVSnapshotより遅いため、更新があった場合にのみ呼ぶこと。
+# 戻り値は getUVSnapshot と同じ
+def getBMeshUVSnapshot(bmList):
+	parts = []
+	tgtList = []
+	for obj, bm in bmList:
+		if bm.loops.layers.uv.active is None: continue
+
+		# 移動などの編集とかち合うと、bMeshのreadonly参照を行うだけで
+		# bMesh自体が破壊されるという不具合が起きる（多分バグ?）ので
+		# ここでは毎回bMesh丸ごとコピーしたものを参照するようにする。
+		bmCopy = bm.copy()
+		try:
+			parts.append(getBMeshUVArrays(bmCopy))
+		finally:
+			bmCopy.free()
+		tgtList.append((obj, bm))
+
+	return UVSnapshot.concat(parts), tgtList
+
+# BMeshのアクティブUVレイヤーから、UVスナップショットの1オブジェクト分の配列を得る。
+# 頂点・エッジ番号を振りなおすので、編集中のBMeshではなくそのコピーを渡すこと。
+# BMeshには一括で読み取る手段が無いので1Loopずつ読むが、中間のリストを作らずに配列へ直接読み込む。
+# 戻り値は getMeshUVArrays と同じ
+def getBMeshUVArrays(bm):
+	uvLayer = bm.loops.layers.uv.active
+	bm.verts.index_update()
+	bm.edges.index_update()
+
+	faceTotal = np.fromiter((len(face.loops) for face in bm.faces), dtype=np.int32, count=len(bm.faces))
+	faceStart = (np.cumsum(faceTotal) - faceTotal).astype(np.int32)
+	loopCnt = int(faceTotal.sum())
+	loops = [loop for face in bm.faces for loop in face.loops]
+	loopUVs = [loop[uvLayer] for loop in loops]
+	uv = np.fromiter((c for luv in loopUVs for c in luv.uv), dtype=np.float32, count=loopCnt*2)
+	select = np.fromiter((luv.select for luv in loopUVs), dtype=bool, count=loopCnt)
+	loopVert = np.fromiter((loop.vert.index for loop in loops), dtype=np.int32, count=loopCnt)
+	loopEdge = np.fromiter((loop.edge.index for loop in loops), dtype=np.int32, count=loopCnt)
+	edgeSharp = np.fromiter((not edge.smooth for edge in bm.edges), dtype=bool, count=len(bm.edges))
+	vertCo = np.fromiter((c for vert in bm.verts for c in vert.co), dtype=np.float32, count=len(bm.verts)*3)
+
+	return (uv, select, loopVert, loopEdge, edgeSharp, faceStart, faceTotal, vertCo)
+
+# オブジェクトと、そのMeshの描画キャッシュ用のIDキー
+def getIDKeys(obj):
+	return (("OBJECT", obj.name), ("MESH", obj.data.name))
+
+# Depsgraphの更新通知から、更新されたIDの描画キャッシュ用のIDキーを列挙する
+def getUpdatedIDKeys(depsgraph):
+	return [(i.id.original.id_type, i.id.original.name) for i in depsgraph.updates]
+
+# Meshと指定UVレイヤーから、UVスナップショットの1オブジェクト分の配列を得る。
+# 戻り値は UVSnapshot.concat に渡す (uv, select, loopVert, loopEdge, edgeSharp, faceStart, faceTotal, vertCo)
+def getMeshUVArrays(me, uvLayer):
+	loopCnt = len(me.loops)
+	edgeCnt = len(me.edges)
+	faceCnt = len(me.polygons)
+	vertCnt = len(me.vertices)
+
+	uv = np.empty(loopCnt*2, dtype=np.float32)
+	select = np.empty(loopCnt, dtype=bool)
+	loopVert = np.empty(loopCnt, dtype=np.int32)
+	loopEdge = np.empty(loopCnt, dtype=np.int32)
+	edgeSharp = np.empty(edgeCnt, dtype=bool)
+	faceStart = np.empty(faceCnt, dtype=np.int32)
+	faceTotal = np.empty(faceCnt, dtype=np.int32)
+	vertCo = np.empty(vertCnt*3, dtype=np.float32)
+	uvLayer.data.foreach_get("uv", uv)
+	uvLayer.data.foreach_get("select", select)
+	me.loops.foreach_get("vertex_index", loopVert)
+	me.loops.foreach_get("edge_index", loopEdge)
+	me.edges.foreach_get("use_edge_sharp", edgeSharp)
+	me.polygons.foreach_get("loop_start", faceStart)
+	me.polygons.foreach_get("loop_total", faceTotal)
+	me.vertices.foreach_get("co", vertCo)
+
+	return (uv, select, loopVert, loopEdge, edgeSharp, faceStart, faceTotal, vertCo)
+
+# UVスナップショットの指定Loop番号のUV座標を、Mesh・BMeshへ書き戻す。
+# loopIdxsを省略した場合は全Loopを書き戻す。取得時点から値が変わっていないLoopは書き戻さない。
+# ObjectモードのMesh（bmがNone）へは、foreach_setで一括で書き込む。
+# EditモードのBMeshへは一括で書き込む手段が無いので、値が変わったLoopにのみ1Loopずつ書き込む。
+def applyUVSnapshot(snap, tgtList, loopIdxs=None):
+	if loopIdxs is None: loopIdxs = np.arange(snap.loopCount)
+	loopIdxs = snap.changedLoops(loopIdxs)
+
+	loopObj = snap.loopObj()[loopIdxs]
+	loopInFace = snap.loopInFace()
+	for objIdx, (obj, bm) in enumerate(tgtList):
+		mask = loopObj == objIdx
+		if not mask.any(): continue
+		tgtIdxs = loopIdxs[mask]
+
+		if bm is None:
+			# 取得時点のUV座標に、書き戻すLoopの値を反映したものを書き込む
+			loopOfs = snap.objLoopOfs[objIdx]
+			uv = snap.baseUV[loopOfs:snap.objLoopOfs[objIdx+1]].astype(np.float32)
+			uv[tgtIdxs - loopOfs] = snap.uv[tgtIdxs]
+			obj.data.uv_layers.active.data.foreach_set("uv", uv.reshape(-1))
+			obj.data.update()
+		else:
+			# 面番号とその中の順番から、書き戻し先のLoopを特定する
+			uv_layer = bm.loops.layers.uv.active
+			bm.faces.ensure_lookup_table()
+			faces = bm.faces
+			for f, k, uv in zip(
+				(snap.loopFace[tgtIdxs] - snap.objFaceOfs[objIdx]).tolist(),
+				loopInFace[tgtIdxs].tolist(),
+				snap.uv[tgtIdxs].tolist() ):
+				faces[f].loops[k][uv_layer].uv = uv
+			bmesh.update_edit_mesh(obj.data)
+
+		draw_cache.markEdited(getIDKeys(obj))
+
 # UV頂点リストから、座標の最小値、最大値、サイズ、中央値を求める
 def getMinMaxUV(uvs):
 	minUV = Vector((math.inf, math.inf))
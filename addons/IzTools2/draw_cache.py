@@ -0,0 +1,76 @@
+#
+# 描画ハンドラで使用する、描画用データのキャッシュを管理するモジュール。
+#
+# Depsgraphの更新通知から前回描画以降に更新されたIDを記録しておき、
+# 更新のあったオブジェクトの分だけ作り直す。
+# アドオン自身が引き起こした更新（編集モードの内容をMeshへ書き出したもの等）は、編集とはみなさない。
+# IDは (ID種別, 名前) の組で識別する。
+# bpyに依存しないので、Blender外でも単体でimportして使用できる。
+#
+
+import weakref
+
+
+# 生成済みのキャッシュ一覧
+_caches = weakref.WeakSet()
+
+
+#-------------------------------------------------------
+
+# アドオン自身が更新したIDを記録する。
+# 次のDepsgraph更新通知では、これらのIDの更新を無視する
+def markSelfUpdate(idKeys):
+	for cache in _caches: cache._addSelfUpdate(idKeys)
+
+# アドオンがUV等を書き換えたIDを記録する。
+# markSelfUpdateで記録したものでも、次のDepsgraph更新通知で更新されたものとして扱う
+def markEdited(idKeys):
+	for cache in _caches: cache._removeSelfUpdate(idKeys)
+
+
+# 描画用データのキャッシュ本体
+class DrawCache:
+
+	def __init__(self):
+		self.__entries = {}			# {キー: (パラメータキー, 値)}
+		self.__dirtyIDs = set()		# 前回描画以降に更新があったID
+		self.__selfIDs = set()		# アドオン自身が更新したID
+		self.buildCount = 0			# 作り直した回数
+		_caches.add(self)
+
+	# キーに対応する値を得る。
+	# キャッシュが無い場合・パラメータキーが変わった場合・idKeysのいずれかが更新された場合は、
+	# buildを呼んで作り直す
+	def fetch(self, key, paramKey, idKeys, build):
+		cached = self.__entries.get(key)
+		if cached is None or cached[0] != paramKey or self.isDirty(idKeys):
+			self.buildCount += 1
+			cached = (paramKey, build())
+			self.__entries[key] = cached
+		return cached[1]
+
+	# idKeysのいずれかが、前回描画以降に更新されたか否か
+	def isDirty(self, idKeys):
+		return any(i in self.__dirtyIDs for i in idKeys)
+
+	# 描画1回分の終了処理。usedKeys以外のキャッシュを破棄し、更新の記録をクリアする
+	def endDraw(self, usedKeys=None):
+		if usedKeys is not None:
+			usedKeys = set(usedKeys)
+			self.__entries = {k: v for k, v in self.__entries.items() if k in usedKeys}
+		self.__dirtyIDs.clear()
+
+	# キャッシュを全破棄する
+	def clear(self):
+		self.__entries = {}
+		self.__dirtyIDs.clear()
+		self.__selfIDs.clear()
+
+	# Depsgraphの更新通知1回分の、更新されたIDを記録する。
+	# アドオン自身が更新したIDは除外し、その記録はこの通知で使い切る
+	def onDepsgraphUpdate(self, idKeys):
+		self.__dirtyIDs.update(i for i in idKeys if i not in self.__selfIDs)
+		self.__selfIDs.clear()
+
+	def _addSelfUpdate(self, idKeys): self.__selfIDs.update(idKeys)
+	def _removeSelfUpdate(self, idKeys): self.__selfIDs.difference_update(idKeys)
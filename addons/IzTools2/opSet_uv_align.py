@@ -60,27 +60,22 @@ class OperatorSet(OperatorSet_Base):
 			return {'FINISHED'}
 
 		def proc(self, param):
-			bmList = getEditingBMeshList()
-			uvVerts = getSelectedUVVerts( [bm for _,bm in bmList] )
+			snap, tgtList = getUVSnapshot( getEditingBMeshList() )
+			selLoops = snap.selectedLoops()
 
 			# PixelCenterFitか否か
 			isPCFit = isPixelCenterFit(bpy.context)
 			imgSize = getTexSizeOfImageEditor(bpy.context)
 
-			# UV座標のみの処理用配列を生成
-			uvLst = [i.uv.copy() for i,_ in uvVerts]
-
-			# 画像読み込み済みの場合は、UVをピクセル座標に変換しておく
-			if imgSize:
-				uvLst = [Vector((i.x*imgSize.x, i.y*imgSize.y)) for i in uvLst]
-
-			# 重複を除いたUV座標リスト
-			dctUVs = []
-			for i in uvLst:
-				if (not i in dctUVs): dctUVs.append(i.copy())
+			# 重複を除いたUV座標リストと、元UVからそのインデックスへのマップ
+			dctArr, src2dctMap = dedupUVs(snap.uv[selLoops])
 
 			# 対象頂点が1以下の場合は何もしない
-			if len(dctUVs) <= 1: return
+			if len(dctArr) <= 1: return
+
+			# 画像読み込み済みの場合は、UVをピクセル座標に変換しておく
+			if imgSize: dctArr = dctArr * (imgSize.x, imgSize.y)
+			dctUVs = [Vector(i) for i in dctArr.tolist()]
 
 			# 整列方向の自動算出の場合は、方向を決定する
 			procDir = self.dir
@@ -89,18 +84,18 @@ class OperatorSet(OperatorSet_Base):
 
 			# 斜め整列の場合は斜めに座標変換しておく
 			if (procDir=="/" or procDir=="\\"):
-				uvLst  = [Vector((i.x+i.y, i.y-i.x)) for i in uvLst]
 				dctUVs = [Vector((i.x+i.y, i.y-i.x)) for i in dctUVs]
 
 			# 整列方向に沿って、dctUVsをソートする
 			procDirX = procDir=="-" or procDir=="/"
-			if procDirX	: dctUVs.sort(key=lambda i: i.x)
-			else		: dctUVs.sort(key=lambda i: i.y)
+			if procDirX	: order = sorted(range(len(dctUVs)), key=lambda i: dctUVs[i].x)
+			else		: order = sorted(range(len(dctUVs)), key=lambda i: dctUVs[i].y)
+			dctUVs = [dctUVs[i] for i in order]
 
-			# 元UVリストから、dctUVsのインデックスへのマップを構築
-			src2dctMap = []
-			for i in uvLst:
-				src2dctMap.append( next(idx for idx,j in enumerate(dctUVs) if (j==i)) )
+			# マップもソート後のインデックスに付け替える
+			rank = np.empty(len(order), dtype=np.int64)
+			rank[order] = np.arange(len(order))
+			src2dctMap = rank[src2dctMap]
 
 			# ここで中央を計算しておく
 			center = getMinMaxUV(dctUVs)[3]
@@ -148,19 +143,15 @@ class OperatorSet(OperatorSet_Base):
 					i.y = y1
 					
 			# 元のUVに反映
-			for idx,i in enumerate(uvVerts):
-				uv = dctUVs[src2dctMap[idx]].copy()
-				if imgSize:
-					uv.x /= imgSize.x
-					uv.y /= imgSize.y
-				if isPCFit:
-					uv.x = (math.floor(uv.x*imgSize.x) +0.5) /imgSize.x
-					uv.y = (math.floor(uv.y*imgSize.y) +0.5) /imgSize.y
-				i[0].uv = uv
+			uvs = np.array([(i.x, i.y) for i in dctUVs])[src2dctMap]
+			if imgSize:
+				uvs /= (imgSize.x, imgSize.y)
+			if isPCFit:
+				uvs = (np.floor(uvs*(imgSize.x, imgSize.y)) +0.5) /(imgSize.x, imgSize.y)
+			snap.uv[selLoops] = uvs
 
 			# BMeshを反映
-			for obj,_ in bmList:
-				bmesh.update_edit_mesh(obj.data)
+			applyUVSnapshot(snap, tgtList, selLoops)
 		
 	# UIパネル描画部分
 	class UI_PT_Izt_UV_Align(OperatorSet_Base.Panel_Base):
@@ -10,6 +10,7 @@ import bmesh
 from mathutils import *
 import math
 import time
+import numpy as np
 
 from bpy.types import (
 		Operator,
@@ -37,6 +38,7 @@ from gpu_extras.presets import draw_circle_2d
 
 from .opSet_base import *
 from .common_uv import *
+from . import draw_cache
 
 
 #-------------------------------------------------------
@@ -54,12 +56,21 @@ class OperatorSet(OperatorSet_Base):
 			if context.area.type != 'IMAGE_EDITOR': return {'CANCELLED'}
 
 			# 選択エッジ一覧を取得
-			bmList = getEditingBMeshList()
-			bMeshes = [bm for _,bm in bmList]
-			selUVs = OperatorSet._getSelectedUVs(bMeshes, False)
+			snap, tgtList = getUVSnapshot( getEditingBMeshList() )
+			srcLoops, dstLoops = snap.selectedEdgePairs(False)
 
 			# 選択中エッジに対応する非選択エッジがない場合は、何もしない
-			if len(selUVs) == 0: return {'CANCELLED'}
+			if len(srcLoops) == 0: return {'CANCELLED'}
+
+			# 各エッジ両端のUV座標を列挙しておく
+			nxt = snap.loopNext()
+			selUVs = [
+				(Vector(s0), Vector(s1), Vector(d0), Vector(d1)) for s0,s1,d0,d1 in zip(
+					snap.uv[srcLoops].tolist(),
+					snap.uv[nxt[srcLoops]].tolist(),
+					snap.uv[nxt[dstLoops]].tolist(),
+					snap.uv[dstLoops].tolist() )
+			]
 
 			# 表示画像から解像度を取得しておく
 			imgSize = getTexSizeOfImageEditor(context)
@@ -70,12 +81,7 @@ class OperatorSet(OperatorSet_Base):
 			srcCenter = Vector((0, 0))
 			dstCenter = Vector((0, 0))
 			aglCnt = [0, 0, 0, 0]
-			for (srcUV0, srcUV1, dstUV0, dstUV1, _) in selUVs:
-				sUV0 = srcUV0.uv
-				sUV1 = srcUV1.uv
-				dUV0 = dstUV0.uv
-				dUV1 = dstUV1.uv
-
+			for (sUV0, sUV1, dUV0, dUV1) in selUVs:
 				srcDUV = sUV1 - sUV0
 				dstDUV = dUV1 - dUV0
 				srcDir = srcDUV.normalized()
@@ -154,20 +160,8 @@ class OperatorSet(OperatorSet_Base):
 				))
 
 			# UVの変換テーブルを作成
-			uvConvMap = []
-			def findConvMap( uv ):		# UV変換テーブルからの取得処理
-				for i in uvConvMap:
-					if uv == i[0]: return i
-				return None
-			def addConvMap( src, dst ):	# UV変換テーブルへの追加処理
-				if not findConvMap(src): uvConvMap.append( [src, dst] )
-
-			for (srcUV0, srcUV1, dstUV0, dstUV1, _) in selUVs:
-				sUV0 = srcUV0.uv
-				sUV1 = srcUV1.uv
-				dUV0 = dstUV0.uv
-				dUV1 = dstUV1.uv
-
+			uvConvMap = UVConvMap(context.scene.iz_uv_tool_property.edge_sync_epsilon)
+			for (sUV0, sUV1, dUV0, dUV1) in selUVs:
 				# 中央位置からの差分位置
 				c2s0 = sUV0 - srcCenter
 				c2s1 = sUV1 - srcCenter
@@ -179,24 +173,15 @@ class OperatorSet(OperatorSet_Base):
 				resultUV1 = resultDstCenter + c2d1
 
 				# UV変換テーブルへ追加
-				addConvMap( dUV0, resultUV0 )
-				addConvMap( dUV1, resultUV1 )
+				uvConvMap.add( dUV0, resultUV0 )
+				uvConvMap.add( dUV1, resultUV1 )
 
 			# UV変換テーブルにしたがって、UVを更新
-			convLst = []
-			for bm in bMeshes:
-				uv_layer = bm.loops.layers.uv.active
-				for face in bm.faces:
-					for loop in face.loops:
-						uv = loop[uv_layer]
-
-						a = findConvMap(uv.uv)
-						if a: convLst.append((uv, a[1]))
-			for i in convLst: i[0].uv = i[1]
+			convIdxs, convUVs = uvConvMap.remap(snap.uv)
+			snap.uv[convIdxs] = convUVs
 
 			# BMeshを反映
-			for obj,_ in bmList:
-				bmesh.update_edit_mesh(obj.data)
+			applyUVSnapshot(snap, tgtList, convIdxs)
 			
 			return {'FINISHED'}
 		
@@ -225,6 +210,8 @@ class OperatorSet(OperatorSet_Base):
 
 			row = column.row()
 			row.prop(param, "edge_sync_show_sel_edge")
+			row = column.row()
+			row.prop(param, "edge_sync_epsilon")
 
 			row = column.row()
 			row.operator(OperatorSet.OpImpl.bl_idname, text="Sync")
@@ -238,6 +225,12 @@ class OperatorSet(OperatorSet_Base):
 		cls.__drawHdl = bpy.types.SpaceImageEditor.draw_handler_add(
 			cls.__draw, (), 'WINDOW', 'POST_VIEW' )
 
+		# 描画キャッシュ破棄用のハンドラを登録
+		bpy.app.handlers.depsgraph_update_post.append(_onDepsgraphUpdate)
+		bpy.app.handlers.undo_post.append(_onClearCache)
+		bpy.app.handlers.redo_post.append(_onClearCache)
+		bpy.app.handlers.load_post.append(_onClearCache)
+
 	# プラグインをアンインストールしたときの処理
 	def unregister(self):
 		cls = OperatorSet
@@ -247,6 +240,13 @@ class OperatorSet(OperatorSet_Base):
 			cls.__drawHdl, 'WINDOW' )
 		cls.__drawHdl = None
 
+		# 描画キャッシュ破棄用のハンドラの登録を解除
+		bpy.app.handlers.depsgraph_update_post.remove(_onDepsgraphUpdate)
+		bpy.app.handlers.undo_post.remove(_onClearCache)
+		bpy.app.handlers.redo_post.remove(_onClearCache)
+		bpy.app.handlers.load_post.remove(_onClearCache)
+		cls._clearCache()
+
 		super().unregister()
 
 	# ショートカット登録処理
@@ -275,6 +275,9 @@ class OperatorSet(OperatorSet_Base):
 	# シェーダおよび描画用バッチ
 	__shader = None
 
+	# オブジェクト名ごとの描画用バッチのキャッシュ
+	__batchCache = draw_cache.DrawCache()
+
 	# アニメーション用の、インスタンス開始時刻
 	__beginTCnt = 0
 
@@ -320,16 +323,25 @@ class OperatorSet(OperatorSet_Base):
 			description="Show the selected edge as well",
 			default=False,
 		)
+		prm_epsilon = FloatProperty(
+			name="epsilon",
+			description="UVs closer than this are treated as the same position when syncing",
+			default=0.000001,
+			min=0.0000001, max=0.01,
+			precision=7,
+		)
 		props.edge_sync_color_nml: prm_colorNml
 		props.edge_sync_color_err: prm_colorErr
 		props.edge_sync_color_srp: prm_colorSrp
 		props.edge_sync_alpha: prm_alpha
 		props.edge_sync_show_sel_edge: prm_showSelEdge
+		props.edge_sync_epsilon: prm_epsilon
 		props.__annotations__["edge_sync_color_nml"] = prm_colorNml
 		props.__annotations__["edge_sync_color_err"] = prm_colorErr
 		props.__annotations__["edge_sync_color_srp"] = prm_colorSrp
 		props.__annotations__["edge_sync_alpha"] = prm_alpha
 		props.__annotations__["edge_sync_show_sel_edge"] = prm_showSelEdge
+		props.__annotations__["edge_sync_epsilon"] = prm_epsilon
 
 		# 開始時刻を初期化
 		OperatorSet.__beginTCnt = time.time()
@@ -369,105 +381,94 @@ class OperatorSet(OperatorSet_Base):
 			'''
 			cls.__shader = gpu.types.GPUShader(vertex_shader, fragment_shader)
 
-		bmList = getEditingBMeshList()
-
-		# 移動などの編集とかち合うと、bMeshのreadonly参照を行うだけで
-		# bMesh自体が破壊されるという不具合が起きる（多分バグ?）ので
-		# ここでは毎回bMesh丸ごとコピーしたものを参照するようにする。
-		bmList = [bm.copy() for _,bm in bmList]
-
 		param = context.scene.iz_uv_tool_property
 		isShowSelEdge = param.edge_sync_show_sel_edge
-		selUVs = cls._getSelectedUVs(bmList, isShowSelEdge)
+
+		# レンダリング時のカラー
+		colorNml = tuple(param.edge_sync_color_nml)
+		colorErr = tuple(param.edge_sync_color_err)
+		colorSrp = tuple(param.edge_sync_color_srp)
+		paramKey = (isShowSelEdge, colorNml, colorErr, colorSrp)
+
+		# 更新のあったオブジェクトのみ、バッチを作り直す。
+		# 表示の移動・拡大縮小だけの場合は、キャッシュ済みのバッチをそのまま描画する。
+		batches = []
+		bmList = getEditingBMeshList()
+		for obj, bm in bmList:
+			batch = cls.__batchCache.fetch(
+				obj.name, paramKey, getIDKeys(obj),
+				lambda: cls.__createBatch([(obj, bm)], isShowSelEdge, colorNml, colorErr, colorSrp) )
+			if batch is not None: batches.append(batch)
+		cls.__batchCache.endDraw([obj.name for obj, _ in bmList])
 
 		# 選択中エッジに対応する非選択エッジがない場合は、何もしない
-		if len(selUVs) != 0:
+		if len(batches) == 0: return
 
 # ライン描画だとなぜかブレンドモードが利かない
-#			fb = gpu.state.active_framebuffer_get()
-#			gpu.state.blend_set("ADDITIVE")
-
-			# レンダリング時のカラー
-			colorNml = [i for i in param.edge_sync_color_nml]
-			colorErr = [i for i in param.edge_sync_color_err]
-			colorSrp = [i for i in param.edge_sync_color_srp]
-#			alpha = param.edge_sync_alpha
-
-			cls.__shader.bind()
-#			cls.__shader.uniform_float("alpha", alpha)
-			cls.__shader.uniform_float("alpha", 1.0)
-#			cls.__shader.uniform_float("time", time.time() - cls.__beginTCnt)
-
-			# バッチの生成
-			uvs = []
-			cols = []
-			for (srcUV0, srcUV1, dstUV0, dstUV1, edge) in selUVs:
-				# カラーを確定
-				lenSrc = (srcUV0.uv - srcUV1.uv).length
-				lenDst = (dstUV0.uv - dstUV1.uv).length
-				col = None
-				if abs(lenSrc - lenDst) < 0.00001: col = colorNml
-				elif edge.smooth: col = colorErr
-				else: col = colorSrp
-
-				# 頂点バッファを詰める
-				uvs.append([dstUV0.uv.x, dstUV0.uv.y])
-				uvs.append([dstUV1.uv.x, dstUV1.uv.y])
-				cols.append(col)
-				cols.append(col)
-				if isShowSelEdge:
-					uvs.append([srcUV0.uv.x, srcUV0.uv.y])
-					uvs.append([srcUV1.uv.x, srcUV1.uv.y])
-					cols.append(col)
-					cols.append(col)
-			batch = batch_for_shader(
-				cls.__shader, 'LINES',
-				{
-					"uv": uvs,
-					"col": cols,
-				}
-			)
-
-			bgl.glLineWidth(3)
-			batch.draw(cls.__shader)
-
-		# バグるのを回避するためにコピーしたBMeshを開放
-		for bm in bmList: bm.free()
-
-	# 指定のBMeshリストから、選択中エッジLoopと、同じエッジを参照したLoopの組をリストアップする処理
-	@staticmethod
-	def _getSelectedUVs(bmList, isShowSelEdge):
-		result = []
-		for bm in bmList:
-			uv_layer = bm.loops.layers.uv.active
-
-			# 現在選択中のエッジを得る
-			for edge in bm.edges:
-				isSelect = False
-				selLoop = None
-				srcUV0 = None
-				srcUV1 = None
-				for loop in edge.link_loops:
-					srcUV0 = loop[uv_layer]
-					srcUV1 = loop.link_loop_next[uv_layer]
-					if srcUV0.select and srcUV1.select:
-						isSelect = True
-						selLoop = loop
-						break
-
-				if isSelect:
-					#それぞれのエッジに対して、対応するエッジを抽出する
-					for loop in edge.link_loops:
-						dstUV1 = loop[uv_layer]
-						dstUV0 = loop.link_loop_next[uv_layer]
-
-						# 同じ位置のエッジは除外
-						if srcUV0.uv == dstUV0.uv and srcUV1.uv == dstUV1.uv: continue
-						if srcUV0.uv == dstUV1.uv and srcUV1.uv == dstUV0.uv: continue
-						
-						if isShowSelEdge or not dstUV0.select or not dstUV1.select:
-							result.append( (srcUV0, srcUV1, dstUV0, dstUV1, edge) )
-
-		return result
+#		fb = gpu.state.active_framebuffer_get()
+#		gpu.state.blend_set("ADDITIVE")
+
+		cls.__shader.bind()
+#		cls.__shader.uniform_float("alpha", alpha)
+		cls.__shader.uniform_float("alpha", 1.0)
+#		cls.__shader.uniform_float("time", time.time() - cls.__beginTCnt)
+
+		bgl.glLineWidth(3)
+		for batch in batches: batch.draw(cls.__shader)
+
+	# 指定の(obj,bm)リストから、選択中エッジと対応するエッジを描画するバッチを生成する。
+	# 描画対象が無い場合はNone
+	@classmethod
+	def __createBatch(cls, bmList, isShowSelEdge, colorNml, colorErr, colorSrp):
+		snap, _ = getBMeshUVSnapshot(bmList)
+		srcLoops, dstLoops = snap.selectedEdgePairs(isShowSelEdge)
+		if len(srcLoops) == 0: return None
+
+		nxt = snap.loopNext()
+		sUV0 = snap.uv[srcLoops]
+		sUV1 = snap.uv[nxt[srcLoops]]
+		dUV0 = snap.uv[nxt[dstLoops]]
+		dUV1 = snap.uv[dstLoops]
+
+		# カラーを確定
+		lenSrc = np.linalg.norm(sUV0 - sUV1, axis=1)
+		lenDst = np.linalg.norm(dUV0 - dUV1, axis=1)
+		isSharp = snap.edgeSharp[snap.loopEdge[srcLoops]]
+		col = np.where(
+			(np.abs(lenSrc - lenDst) < 0.00001)[:,None], colorNml,
+			np.where(isSharp[:,None], colorSrp, colorErr) )
+
+		# 頂点バッファを詰める
+		if isShowSelEdge:
+			uvs = np.stack((dUV0, dUV1, sUV0, sUV1), axis=1)
+			cols = np.repeat(col, 4, axis=0)
+		else:
+			uvs = np.stack((dUV0, dUV1), axis=1)
+			cols = np.repeat(col, 2, axis=0)
+		return batch_for_shader(
+			cls.__shader, 'LINES',
+			{
+				"uv": uvs.reshape(-1, 2).astype(np.float32),
+				"col": cols.astype(np.float32),
+			}
+		)
+
+	# 描画キャッシュを全破棄する
+	@classmethod
+	def _clearCache(cls):
+		cls.__batchCache.clear()
+
+	# Depsgraph更新時に、更新のあったIDを記録しておく
+	@classmethod
+	def _onDepsgraphUpdate(cls, depsgraph):
+		cls.__batchCache.onDepsgraphUpdate(getUpdatedIDKeys(depsgraph))
+
 
+# ハンドラから呼ばれる処理。ファイル読み込み後も維持されるように、persistentにしておく
+@bpy.app.handlers.persistent
+def _onDepsgraphUpdate(scene, depsgraph):
+	OperatorSet._onDepsgraphUpdate(depsgraph)
 
+@bpy.app.handlers.persistent
+def _onClearCache(*args):
+	OperatorSet._clearCache()
@@ -9,6 +9,7 @@ import bpy
 import bmesh
 from mathutils import *
 import math
+import numpy as np
 
 from bpy.types import (
 		Operator,
@@ -36,6 +37,8 @@ from gpu_extras.presets import draw_circle_2d
 
 from .opSet_base import *
 from .common_uv import *
+from . import uv_raster
+from . import draw_cache
 
 
 #-------------------------------------------------------
@@ -62,6 +65,26 @@ class OperatorSet(OperatorSet_Base):
 			else:
 				return {'CANCELLED'}
 		
+	# パディング状況をCPU上で計算して報告するオペレータ
+	class OpReport(Operator):
+		bl_idname = "object.izt_island_padding_report_uv"
+		bl_label = "Iz Tools: UV: Island Padding Report"
+
+		def execute(self, context):
+			param = context.scene.iz_uv_tool_property
+			texSize = 2 ** param.island_preview_reso_level
+			radius = uv_raster.mipPaddingRadius(param.island_preview_mip_levels)
+
+			snap, _ = getUVSnapshot( getEditingBMeshList() )
+			report = uv_raster.snapshotPaddingReport(snap, texSize, radius)
+			print("[IslandPadding] {}".format(report))
+			self.report(
+				{'WARNING'} if report["overlapPixels"] else {'INFO'},
+				"islands: {}, overlap pixels: {}, overlap island pairs: {}".format(
+					report["islands"], report["overlapPixels"], len(report["overlapIslands"]) )
+			)
+			return {'FINISHED'}
+
 	# UIパネル描画部分
 	class UI_PT_Izt_UV_Island_Preview(OperatorSet_Base.Panel_Base):
 		bl_space_type = "IMAGE_EDITOR"
@@ -80,6 +103,8 @@ class OperatorSet(OperatorSet_Base):
 
 			row = column.row()
 			row.prop(param, "island_preview_reso_level", slider=True)
+			row = column.row()
+			row.prop(param, "island_preview_mip_levels", slider=True)
 
 			column.separator()
 
@@ -93,6 +118,8 @@ class OperatorSet(OperatorSet_Base):
 				row.operator(OperatorSet.OpImpl.bl_idname, text="Hide", icon="PAUSE")
 			else:
 				row.operator(OperatorSet.OpImpl.bl_idname, text="Show", icon="PLAY")
+			row = column.row()
+			row.operator(OperatorSet.OpReport.bl_idname, text="Report")
 
 	# プラグインをインストールしたときの処理
 	def register(self):
@@ -105,6 +132,12 @@ class OperatorSet(OperatorSet_Base):
 		cls.__hdl_drawImgEdt = bpy.types.SpaceImageEditor.draw_handler_add(
 			cls.__drawImgEdt, (), 'WINDOW', 'POST_VIEW' )
 
+		# 描画キャッシュ破棄用のハンドラを登録
+		bpy.app.handlers.depsgraph_update_post.append(_onDepsgraphUpdate)
+		bpy.app.handlers.undo_post.append(_onClearCache)
+		bpy.app.handlers.redo_post.append(_onClearCache)
+		bpy.app.handlers.load_post.append(_onClearCache)
+
 	# プラグインをアンインストールしたときの処理
 	def unregister(self):
 		cls = OperatorSet
@@ -117,6 +150,13 @@ class OperatorSet(OperatorSet_Base):
 		cls.__hdl_drawOffsc = None
 		cls.__hdl_drawImgEdt = None
 
+		# 描画キャッシュ破棄用のハンドラの登録を解除
+		bpy.app.handlers.depsgraph_update_post.remove(_onDepsgraphUpdate)
+		bpy.app.handlers.undo_post.remove(_onClearCache)
+		bpy.app.handlers.redo_post.remove(_onClearCache)
+		bpy.app.handlers.load_post.remove(_onClearCache)
+		cls._clearCache()
+
 		super().unregister()
 
 
@@ -127,12 +167,23 @@ class OperatorSet(OperatorSet_Base):
 	# 作業用オフスクリーンバッファ
 	__offscreen0 = None
 	__offscreen1 = None
+	__offscreen2 = None
+	__offscreenMask = None
 	
 	# シェーダおよび描画用バッチ
 	__shader_Offsc = None
+	__shader_Dilate = None
+	__batch_Dilate = None
 	__shader_ImgEdt = None
 	__batch_ImgEdt = None
 
+	# オフスクリーンバッファに描画済みの内容のキャッシュキーと、その時のUVスナップショット
+	__renderKey = None
+	__renderSnap = None
+
+	# 前回描画以降に更新のあったIDの記録
+	__drawCache = draw_cache.DrawCache()
+
 
 	def __init__(self, props):
 		super().__init__()
@@ -141,6 +192,7 @@ class OperatorSet(OperatorSet_Base):
 		self._classes = (
 			OperatorSet.UI_PT_Izt_UV_Island_Preview,
 			OperatorSet.OpImpl,
+			OperatorSet.OpReport,
 		)
 
 		# Global保存パラメータを定義
@@ -149,7 +201,14 @@ class OperatorSet(OperatorSet_Base):
 			description="Texture Resolution Level",
 			default=8,
 			min=4,
-			max=12,
+			max=13,
+		)
+		prm_mipLv = IntProperty(
+			name="mip levels",
+			description="Number of mip levels to keep the padding for",
+			default=0,
+			min=0,
+			max=8,
 		)
 		prm_overlayCol = FloatVectorProperty(
 			name="overlay color",
@@ -165,9 +224,11 @@ class OperatorSet(OperatorSet_Base):
             min=0, max=1,
 		)
 		props.island_preview_reso_level: prm_resoLv
+		props.island_preview_mip_levels: prm_mipLv
 		props.island_preview_overlay_color: prm_overlayCol
 		props.island_preview_fill_color_rate: prm_fillColRate
 		props.__annotations__["island_preview_reso_level"] = prm_resoLv
+		props.__annotations__["island_preview_mip_levels"] = prm_mipLv
 		props.__annotations__["island_preview_overlay_color"] = prm_overlayCol
 		props.__annotations__["island_preview_fill_color_rate"] = prm_fillColRate
 
@@ -179,13 +240,10 @@ class OperatorSet(OperatorSet_Base):
 		if cls.__shader_Offsc is None:
 			vertex_shader = '''
 				in vec2 uv;
-				uniform float texSize;
-				uniform vec2 pixelOffset;
 
 				void main()
 				{
-					vec2 pos = uv + pixelOffset / texSize;
-					gl_Position = vec4(pos*2-1, 0.0, 1.0);
+					gl_Position = vec4(uv*2-1, 0.0, 1.0);
 				}
 			'''
 			fragment_shader = '''
@@ -200,75 +258,182 @@ class OperatorSet(OperatorSet_Base):
 			'''
 			cls.__shader_Offsc = gpu.types.GPUShader(vertex_shader, fragment_shader)
 
+			# 1次元のJump Floodingで、マスクを膨張させるシェーダ。
+			# 各ピクセルに、指定方向で最も近いマスク上のピクセルの位置を持たせ、
+			# 自身と ±step 離れたピクセルが持つ位置のうち、最も近いものを引き継ぐ。
+			# stepを半径以下の最大の2の累乗から1まで半分ずつにしていくと、半径以内の最も近い位置が求まる。
+			# X方向の結果をY方向のマスクとして同じことを行うと、半径radiusの正方形範囲の膨張になる。
+			# 位置は r,g に上位・下位8bitずつ、見つかったか否かを b に格納する。
+			vertex_shader = '''
+				in vec2 pos;
+
+				void main()
+				{
+					gl_Position = vec4(pos*2-1, 0.0, 1.0);
+				}
+			'''
+			fragment_shader = '''
+				uniform sampler2D image;
+				uniform int srcMode;	// 0:マスク 1:同じ方向の位置 2:X方向の位置をY方向のマスクとして読む
+				uniform int dstMode;	// 0:位置を書き出す 1:膨張結果の色を書き出す
+				uniform int dirX;
+				uniform int stepLen;
+				uniform int radius;
+				uniform vec4 color;
+
+				out vec4 FragColor;
+
+				const int NONE = -1000000;
+
+				int decodePos(vec4 c) {
+					return c.b > 0.5 ? int(round(c.r*255.0))*256 + int(round(c.g*255.0)) : NONE;
+				}
+				vec4 encodePos(int p) {
+					return p == NONE ? vec4(0,0,0,0) : vec4(float(p/256)/255.0, float(p%256)/255.0, 1, 1);
+				}
+				int fetchPos(ivec2 p) {
+					ivec2 size = textureSize(image, 0);
+					if (any(lessThan(p, ivec2(0))) || any(greaterThanEqual(p, size))) return NONE;
+					vec4 c = texelFetch(image, p, 0);
+					if (srcMode == 0) return c.r > 0.5 ? (dirX != 0 ? p.x : p.y) : NONE;
+					if (srcMode == 1) return decodePos(c);
+					return abs(decodePos(c) - p.x) <= radius ? p.y : NONE;
+				}
+
+				void main()
+				{
+					ivec2 center = ivec2(gl_FragCoord.xy);
+					ivec2 dir = dirX != 0 ? ivec2(1,0) : ivec2(0,1);
+					int pos = dirX != 0 ? center.x : center.y;
+					int best = fetchPos(center);
+					for (int i = -1; i <= 1; i += 2) {
+						int p = fetchPos(center + dir*stepLen*i);
+						if (abs(p - pos) < abs(best - pos)) best = p;
+					}
+					if (dstMode == 0) FragColor = encodePos(best);
+					else FragColor = abs(best - pos) <= radius ? vec4(color.rgb, 1) : vec4(0,0,0,1);
+				}
+			'''
+			cls.__shader_Dilate = gpu.types.GPUShader(vertex_shader, fragment_shader)
+			cls.__batch_Dilate = batch_for_shader(
+				cls.__shader_Dilate, 'TRI_FAN',
+				{
+					"pos": ((0, 0), (1, 0), (1, 1), (0, 1)),
+				},
+			)
+
 		# レンダリング先のテクスチャサイズ
 		param = bpy.context.scene.iz_uv_tool_property
 		texSize = 2 ** param.island_preview_reso_level
 		overlayCol = param.island_preview_overlay_color
 
+		# 外周線の範囲より外側の膨張半径
+		radius = uv_raster.mipPaddingRadius(param.island_preview_mip_levels)
+
 		# 作業用オフスクリーンバッファの作成
 		if cls.__offscreen0 is None or cls.__offscreen0.width != texSize:
 			if cls.__offscreen0 is not None:
 				cls.__offscreen0.free()
 				cls.__offscreen1.free()
+				cls.__offscreen2.free()
+				cls.__offscreenMask.free()
 			cls.__offscreen0 = gpu.types.GPUOffScreen(texSize, texSize)
 			cls.__offscreen1 = gpu.types.GPUOffScreen(texSize, texSize)
-		
-		# バッチを作成
+			cls.__offscreen2 = gpu.types.GPUOffScreen(texSize, texSize)
+			cls.__offscreenMask = gpu.types.GPUOffScreen(texSize, texSize)
+			cls.__renderKey = None
+
+		# 編集中オブジェクトにUV編集などの更新が無い場合は、描画済みの内容をそのまま使用する。
+		# スナップショットの取得でMeshを書き換えると、それ自体が更新になってしまうので、BMeshから直接読み取る
 		bmList = getEditingBMeshList()
-		bMeshes = [bm for _,bm in bmList]
-		uvs = []
-		indices_tri = []
-		indices_line = []
-		for bm in bMeshes:
-			# 移動などの編集とかち合うと、bMeshのreadonly参照を行うだけで
-			# bMesh自体が破壊されるという不具合が起きる（多分バグ?）ので
-			# ここでは毎回bMesh丸ごとコピーしたものを参照するようにする。
-			bm = bm.copy()
-
-			uv_layer = bm.loops.layers.uv.active
-			for face in bm.faces:
-				i0 = len(uvs)
-#					if len(face.loops) < 3: break	これは無くても一応大丈夫
-
-				tris = [0,0,0]
-				for loop in face.loops:
-					uv = loop[uv_layer]
-
-					i1 = len(uvs) - i0
-					if i1 < 2:		# Triangleのシーケンスを格納
-						tris[i1] = len(uvs)
-					elif i1 == 2:
-						tris[2] = len(uvs)
-						indices_tri.append( tris )
-					else:
-						indices_tri.append( [i0, len(uvs)-1, len(uvs)] )
-					if i1 != 0:		# Lineのシーケンスを格納
-						indices_line.append( [len(uvs)-1, len(uvs)] )
-
-					uvs.append( [ uv.uv.x, uv.uv.y ] )
-#						if uv.select: result.append( (uv, loop.vert) )
-				if len(uvs)-1 != i0:		# Lineのシーケンスが一つ足りてないので、最後の一つを格納
-					indices_line.append( [len(uvs)-1, i0] )
-			bm.free()
+		renderKey = (texSize, radius, tuple(overlayCol), tuple(sorted(obj.name for obj,_ in bmList)))
+		isSameKey = renderKey == cls.__renderKey
+		isDirty = cls.__drawCache.isDirty([i for obj,_ in bmList for i in getIDKeys(obj)])
+		cls.__drawCache.endDraw()
+		if isSameKey and not isDirty: return
+
+		# 前回から変化のあった面の範囲のみを描画しなおす。
+		# 面構成が変わった場合などは、全体を描画しなおす。
+		snap, _ = getBMeshUVSnapshot(bmList)
+		dirtyRect = None
+		prevSnap = cls.__renderSnap
+		if isSameKey and prevSnap is not None and snap.isSameTopology(prevSnap):
+			dirtyRect = snap.changedFaceRect(prevSnap)
+			if dirtyRect is None: return
+		cls.__renderKey = renderKey
+		cls.__renderSnap = snap
+
+		# 範囲をピクセル単位にする。外周線のはみ出し分も考慮して広げておく
+		if dirtyRect is None:
+			rect = (0, 0, texSize, texSize)
+		else:
+			rect = (
+				math.floor(dirtyRect[0][0]*texSize) - 2,
+				math.floor(dirtyRect[0][1]*texSize) - 2,
+				math.ceil(dirtyRect[1][0]*texSize) + 2,
+				math.ceil(dirtyRect[1][1]*texSize) + 2,
+			)
+		def setScissor(x0, y0, x1, y1):
+			x0 = max(x0, 0)
+			y0 = max(y0, 0)
+			x1 = min(x1, texSize)
+			y1 = min(y1, texSize)
+			if x1 <= x0 or y1 <= y0: return False
+			gpu.state.scissor_test_set(True)
+			gpu.state.scissor_set(x0, y0, x1-x0, y1-y0)
+			return True
+
+		# バッチを作成。外周線は、ラインを±0.49ピクセルずらして描画した範囲を三角形で塗る
+		uvs = snap.uv.astype(np.float32)
+		indices_tri = snap.triangles().astype(np.int32)
+		edgeUVs, edgeTris, _ = uv_raster.edgeBleedTriangles(
+			snap.uv, snap.faceLines(), uv_raster.EDGE_BLEED_PIXELS / texSize )
 		batch_Tri = batch_for_shader(cls.__shader_Offsc, 'TRIS', {"uv": uvs}, indices=indices_tri)
-		batch_Line = batch_for_shader(cls.__shader_Offsc, 'LINES', {"uv": uvs}, indices=indices_line)
+		batch_Edge = batch_for_shader(
+			cls.__shader_Offsc, 'TRIS', {"uv": edgeUVs.astype(np.float32)}, indices=edgeTris.astype(np.int32) )
 
-		# オフスクリーンバッファへ描画
-		ofsSize = 0.49
-		pixelOffsets = [(-ofsSize,-ofsSize),(0,-ofsSize),(ofsSize,-ofsSize),(-ofsSize,0),(ofsSize,0),(-ofsSize,ofsSize),(0,ofsSize),(ofsSize,ofsSize)]
-		with cls.__offscreen0.bind():
+		# アイランドのマスクをオフスクリーンバッファへ描画
+		with cls.__offscreenMask.bind():
+			if not setScissor(*rect): return
 			fb = gpu.state.active_framebuffer_get()
-			fb.clear(color=(0.0, 0.0, 0.0, 1.0), depth=1)
+			fb.clear(color=(0.0, 0.0, 0.0, 0.0), depth=1)
 
+			gpu.state.blend_set("NONE")
 			gpu.state.face_culling_set("NONE")
 			cls.__shader_Offsc.bind()
-			cls.__shader_Offsc.uniform_float("texSize", texSize)
-			cls.__shader_Offsc.uniform_float("color", (overlayCol[0],overlayCol[1],overlayCol[2],1))
-			cls.__shader_Offsc.uniform_float("pixelOffset", (0,0))
+			cls.__shader_Offsc.uniform_float("color", (1,1,1,1))
 			batch_Tri.draw(cls.__shader_Offsc)
-			for pixelOfs in pixelOffsets:
-				cls.__shader_Offsc.uniform_float("pixelOffset", pixelOfs)
-				batch_Line.draw(cls.__shader_Offsc)
+			batch_Edge.draw(cls.__shader_Offsc)
+			gpu.state.scissor_test_set(False)
+
+		# マスクを、X方向・Y方向の順にJump Floodingで膨張させる。
+		# 途中結果は offscreen1 と offscreen2 を交互に使用し、最後のパスで膨張結果の色を offscreen0 へ書き出す。
+		# 最後のパスは変化した範囲が影響するピクセルのみ、途中のパスはそれが参照しうる範囲のみを更新する。
+		x0, y0, x1, y1 = rect
+		steps = uv_raster.jumpFloodSteps(radius)
+		reach = sum(steps)
+		finalRect = (x0-radius, y0-radius, x1+radius, y1+radius)
+		workRect = (x0-radius-reach, y0-radius-reach, x1+radius+reach, y1+radius+reach)
+		passes = [(True, i) for i in steps] + [(False, i) for i in steps]
+		src = cls.__offscreenMask
+		for idx, (isDirX, step) in enumerate(passes):
+			isFirstOfDir = idx == 0 or idx == len(steps)
+			isLast = idx == len(passes) - 1
+			dst = cls.__offscreen0 if isLast else (cls.__offscreen1 if idx % 2 == 0 else cls.__offscreen2)
+			with dst.bind():
+				if not setScissor(*(finalRect if isLast else workRect)): return
+				gpu.state.blend_set("NONE")
+				cls.__shader_Dilate.bind()
+				cls.__shader_Dilate.uniform_sampler("image", src.texture_color)
+				cls.__shader_Dilate.uniform_int("srcMode", (0 if isDirX else 2) if isFirstOfDir else 1)
+				cls.__shader_Dilate.uniform_int("dstMode", 1 if isLast else 0)
+				cls.__shader_Dilate.uniform_int("dirX", 1 if isDirX else 0)
+				cls.__shader_Dilate.uniform_int("stepLen", step)
+				cls.__shader_Dilate.uniform_int("radius", radius)
+				cls.__shader_Dilate.uniform_float("color", (overlayCol[0],overlayCol[1],overlayCol[2],1))
+				cls.__batch_Dilate.draw(cls.__shader_Dilate)
+				gpu.state.scissor_test_set(False)
+			src = dst
 
 
 	@classmethod
@@ -351,5 +516,24 @@ class OperatorSet(OperatorSet_Base):
 #		cls.__shader_ImgEdt.uniform_float("viewportSize", (viewportW, viewportH))
 		cls.__batch_ImgEdt.draw(cls.__shader_ImgEdt)
 
+	# 描画キャッシュを破棄する
+	@classmethod
+	def _clearCache(cls):
+		cls.__renderKey = None
+		cls.__renderSnap = None
+		cls.__drawCache.clear()
+
+	# Depsgraph更新時に、更新のあったIDを記録しておく
+	@classmethod
+	def _onDepsgraphUpdate(cls, depsgraph):
+		cls.__drawCache.onDepsgraphUpdate(getUpdatedIDKeys(depsgraph))
+
 
+# ハンドラから呼ばれる処理。ファイル読み込み後も維持されるように、persistentにしておく
+@bpy.app.handlers.persistent
+def _onDepsgraphUpdate(scene, depsgraph):
+	OperatorSet._onDepsgraphUpdate(depsgraph)
 
+@bpy.app.handlers.persistent
+def _onClearCache(*args):
+	OperatorSet._clearCache()
@@ -0,0 +1,129 @@
+#
+# ファイル内の全メッシュの全UVレイヤーについて、アイランド間の間隔を調べて
+# 何段目のミップマップで色の滲みが起きるかをレポート出力する機能。
+#
+# 画面の無い環境でも、以下のようにして実行できる。
+#	blender -b file.blend --python-expr "import bpy; bpy.ops.object.izt_uv_padding_audit(filepath='//padding.json')"
+#
+
+
+import bpy
+import bmesh
+from mathutils import *
+import math
+import time
+
+from bpy.types import (
+		Operator,
+		Panel,
+		PropertyGroup,
+		OperatorFileListElement,
+		)
+
+from bpy.props import (
+		BoolProperty,
+		PointerProperty,
+		StringProperty,
+		CollectionProperty,
+		FloatProperty,
+		EnumProperty,
+		IntProperty,
+		)
+
+
+from .opSet_base import *
+from .common_uv import *
+from . import uv_audit
+
+
+#-------------------------------------------------------
+
+# 機能本体
+class OperatorSet(OperatorSet_Base):
+
+	# オペレータ本体
+	class OpImpl(Operator):
+		bl_idname = "object.izt_uv_padding_audit"
+		bl_label = "Iz Tools: UV: Padding Audit"
+
+		filepath: StringProperty(subtype="FILE_PATH", default="//uv_padding.json")
+		filter_glob: StringProperty(default="*.json;*.csv", options={'HIDDEN'})
+		reso_level: IntProperty(
+			name="reso level",
+			description="Texture Resolution Level",
+			default=10,
+			min=4,
+			max=14,
+		)
+		max_mip: IntProperty(
+			name="max mip",
+			description="Maximum mip level to check bleeding for",
+			default=4,
+			min=0,
+			max=10,
+		)
+
+		def execute(self, context):
+			texSize = 2 ** self.reso_level
+			beginT = time.time()
+
+			rows = []
+			for obj in bpy.data.objects:
+				if obj.type != 'MESH': continue
+				if obj.data.is_editmode: obj.update_from_editmode()
+				me = obj.data
+				for uvLayer in me.uv_layers:
+					snap = UVSnapshot.concat([getMeshUVArrays(me, uvLayer)])
+					result = uv_audit.auditSnapshot(snap, texSize, self.max_mip)
+					rows.append({
+						"object": obj.name,
+						"mesh": me.name,
+						"uvLayer": uvLayer.name,
+						"size": texSize,
+						"maxMip": self.max_mip,
+						**result,
+					})
+
+			filepath = bpy.path.abspath(self.filepath)
+			uv_audit.writeReport(rows, filepath)
+
+			bleedCnt = sum(1 for i in rows if i["bleedMipLevel"] is not None)
+			msg = "UV padding audit: {} layers, {} bleeding, {:.2f}s -> {}".format(
+				len(rows), bleedCnt, time.time() - beginT, filepath )
+			print("[IzTools] " + msg)
+			self.report({'WARNING'} if bleedCnt else {'INFO'}, msg)
+			return {'FINISHED'}
+
+		def invoke(self, context, event):
+			context.window_manager.fileselect_add(self)
+			return {'RUNNING_MODAL'}
+
+		def draw(self, context):
+			layout = self.layout
+			col = layout.column()
+			col.label(text="resolution: " + str(2**self.reso_level))
+			col.prop(self, "reso_level")
+			col.prop(self, "max_mip")
+
+	# UIパネル描画部分
+	class UI_PT_Izt_UV_Padding_Audit(OperatorSet_Base.Panel_Base):
+		bl_space_type = "IMAGE_EDITOR"
+		bl_region_type = "UI"
+		header_name = "Padding Audit"
+
+		def draw(self, context):
+			layout = self.layout
+
+			column = layout.column()
+			row = column.row()
+			row.operator(OperatorSet.OpImpl.bl_idname, text="Audit All Meshes")
+
+	def __init__(self, props):
+		super().__init__()
+
+		# 登録対象のクラスリストを定義
+		self._classes = (
+			OperatorSet.UI_PT_Izt_UV_Padding_Audit,
+			OperatorSet.OpImpl,
+		)
+
@@ -5,6 +5,7 @@
 # 複数頂点を選択して、その端にある2頂点を固定して
 # 間の頂点を直線的に並べた状態でUVリラックスを行うという機能。
 # 腕や足などのドラム缶状に展開したいUVに対して、決められた直線上にリラックスできるので便利。
+# Each Chainモードでは、選択中UVエッジで繋がったまとまりごとに、それぞれ別の直線上に並べる。
 #
 
 
@@ -12,6 +13,7 @@ import bpy
 import bmesh
 from mathutils import *
 import math
+from concurrent.futures import ThreadPoolExecutor
 
 from bpy.types import (
 		Operator,
@@ -46,87 +48,55 @@ class OperatorSet(OperatorSet_Base):
 		bl_label = "Iz Tools: UV: Straight Relax"
 		bl_options = {'REGISTER', 'UNDO'}
 
+		mode: EnumProperty(
+			name="mode",
+			items=(
+				("SINGLE", "Single", "Align all selected UVs to one line"),
+				("CHAINS", "Chains", "Align each connected chain of selected UV edges separately"),
+			),
+			default="SINGLE",
+		)
+
 		def execute(self, context):
 #			bpy.ops.object.mode_set(mode='OBJECT')
 			self.proc()
 #			bpy.ops.object.mode_set(mode='EDIT')
 			return {'FINISHED'}
 
-		# UV座標リストから、それらのUVがなんとなく並んでいる方向を計算する
-		def calcLineupDir(self, uvs):
-
-			# 2頂点に外接し、その中間点を中心とし、他の全ての頂点を内包するという円が
-			# ある場合に、それが方向を定義する2頂点とする。
-			# 無い場合は方向を定義できない。
-			for i in range(len(uvs)):
-				for j in range(i+1,len(uvs)):
-					a = uvs[i]
-					b = uvs[j]
-					ctr = (a+b)/2
-					rSqr = (a-ctr).length_squared
-
-					isOk = True
-					for k in range(len(uvs)):
-						if k==i or k==j or uvs[k]==a or uvs[k]==b: continue
-
-						if rSqr < ( uvs[k] - ctr ).length_squared:
-							isOk = False
-							break
-
-					if isOk: return (a-b).normalized()
+		def proc(self):
 
-			# 方向が定義できない
-			return None
+			snap, tgtList = getUVSnapshot( getEditingBMeshList() )
 
-		def proc(self):
+			# 処理対象のLoopのまとまりを決定
+			if self.mode == "CHAINS":
+				groups = [i for i in snap.selectedChains() if 1 < len(i)]
+			else:
+				groups = [snap.selectedLoops()]
 
-			bmList = getEditingBMeshList()
-			uvVerts = getSelectedUVVerts( [bm for _,bm in bmList] )
-
-			# UV座標と頂点座標のみの処理用配列を生成
-			uvLst = [(i.uv, j.co) for i,j in uvVerts]
-			dctUVs = []			# 重複を除いたリスト
-			for i in uvLst:
-				if (not i in dctUVs): dctUVs.append((i[0].copy(), i[1].copy()))
-
-			# 対象頂点が1以下の場合は何もしない
-			if len(dctUVs) <= 1:
-				print( "There is only one target vertex" );
-				return
-
-			# 方向を決定する
-			dir = self.calcLineupDir([i[0] for i in uvLst])
-			if dir is None:
-				print( "Direction cannot be defined" );
-				for i in uvLst: print(i[0])
-				return		#方向が定義できない
-
-			# 整列方向に沿って、dctUVsをソートする
-			dctUVs.sort(key=lambda i: i[0].dot(dir))
-
-			# 元UVリストから、dctUVsのインデックスへのマップを構築
-			src2dctMap = []
-			for i in uvLst:
-				src2dctMap.append( next(idx for idx,j in enumerate(dctUVs) if (j==i)) )
-
-			# 頂点間距離を維持した形を計算する
-			kpdUVs = [dctUVs[0][0]]
-			for i in range( 1, len(dctUVs) ):
-				a = dctUVs[i-1]
-				b = dctUVs[i]
-				l = (b[1]-a[1]).length
-				c = kpdUVs[i-1]
-				kpdUVs.append( c + dir*l )
-			scl = (dctUVs[-1][0]-dctUVs[0][0]).length / (kpdUVs[-1]-kpdUVs[0]).length
-			kpdUVs = [kpdUVs[0]+(i-kpdUVs[0])*scl for i in kpdUVs]
+			# まとまりごとに独立して計算する。
+			# 計算はNumPy配列のみで完結しているので、複数ある場合はスレッドで並列に処理する
+			def solve(loops):
+				return straightRelax(snap.uv[loops], snap.vertCo[snap.loopVert[loops]])
+			if len(groups) <= 1:
+				results = [solve(i) for i in groups]
+			else:
+				with ThreadPoolExecutor() as executor:
+					results = list(executor.map(solve, groups))
 
 			# 元のUVに反映
-			for idx,i in enumerate(uvVerts):
-				i[0].uv = kpdUVs[src2dctMap[idx]]
+			skipCnt = 0
+			for loops, uvs in zip(groups, results):
+				if uvs is None:
+					skipCnt += 1
+					continue
+				snap.uv[loops] = uvs
+			if skipCnt != 0:
+				print( "Direction cannot be defined for {} of {} targets".format(skipCnt, len(groups)) )
+			if skipCnt == len(groups): return
 
 			# BMeshを反映
-			for obj,_ in bmList:
-				bmesh.update_edit_mesh(obj.data)
+			loops = np.concatenate([i for i,j in zip(groups, results) if j is not None])
+			applyUVSnapshot(snap, tgtList, loops)
 		
 	# UIパネル描画部分
 	class UI_PT_Izt_UV_Straight_Relax(OperatorSet_Base.Panel_Base):
@@ -139,7 +109,8 @@ class OperatorSet(OperatorSet_Base):
 			
 			column = layout.column()
 			row = column.row()
-			row.operator(OperatorSet.OpImpl.bl_idname, text="Execute")
+			row.operator(OperatorSet.OpImpl.bl_idname, text="Execute").mode = "SINGLE"
+			row.operator(OperatorSet.OpImpl.bl_idname, text="Each Chain").mode = "CHAINS"
 
 	def __init__(self, props):
 		super().__init__()
@@ -0,0 +1,508 @@
+#
+# UV情報をNumPy配列としてまとめて扱うためのモジュール。
+#
+# 編集中の全オブジェクトの、UV座標・UV選択状態・Loop→頂点/エッジ/面の対応を
+# 連続したNumPy配列に詰めたもの（UVスナップショット）を定義する。
+# bpyに依存しないので、Blender外でも単体でimportして使用できる。
+#
+
+import numpy as np
+
+
+# UV座標を同じものとみなす距離の既定値
+UV_EPSILON = 0.000001
+
+# 量子化したバケット番号の上限。int64に収まり、floatから正確に変換できる値にしておく
+QUANTIZE_LIMIT = 1 << 62
+
+
+#-------------------------------------------------------
+
+# UVスナップショット本体
+#
+#	uv			: (L,2) float64	各LoopのUV座標
+#	baseUV		: (L,2) float64	取得時点の各LoopのUV座標（uvを書き換えても変わらない）
+#	select		: (L,)  bool	各LoopのUV選択状態
+#	loopVert	: (L,)  int64	各Loopの頂点番号（全オブジェクト通し番号）
+#	loopEdge	: (L,)  int64	各Loopのエッジ番号（全オブジェクト通し番号）
+#	loopFace	: (L,)  int64	各Loopの面番号（全オブジェクト通し番号）
+#	edgeSharp	: (E,)  bool	各エッジのシャープ状態（BMEdge.smooth の反転）
+#	faceStart	: (F,)  int64	各面の先頭Loop番号
+#	faceTotal	: (F,)  int64	各面のLoop数
+#	vertCo		: (V,3) float64	各頂点の座標
+#	objLoopOfs	: (O+1,) int64	各オブジェクトの先頭Loop番号（末尾は総Loop数）
+#	objFaceOfs	: (O+1,) int64	各オブジェクトの先頭面番号（末尾は総面数）
+#
+# Loopの並び順は、BMeshの bm.faces -> face.loops の走査順と一致する。
+class UVSnapshot:
+
+	def __init__(self, uv, select, loopVert, loopEdge, edgeSharp, faceStart, faceTotal, vertCo, objLoopOfs):
+		self.uv = np.asarray(uv, dtype=np.float64).reshape(-1, 2)
+		self.baseUV = self.uv.copy()
+		self.select = np.asarray(select, dtype=bool).reshape(-1)
+		self.loopVert = np.asarray(loopVert, dtype=np.int64).reshape(-1)
+		self.loopEdge = np.asarray(loopEdge, dtype=np.int64).reshape(-1)
+		self.edgeSharp = np.asarray(edgeSharp, dtype=bool).reshape(-1)
+		self.faceStart = np.asarray(faceStart, dtype=np.int64).reshape(-1)
+		self.faceTotal = np.asarray(faceTotal, dtype=np.int64).reshape(-1)
+		self.vertCo = np.asarray(vertCo, dtype=np.float64).reshape(-1, 3)
+		self.objLoopOfs = np.asarray(objLoopOfs, dtype=np.int64).reshape(-1)
+
+		# 各オブジェクトの先頭面番号
+		self.objFaceOfs = np.searchsorted(self.faceStart, self.objLoopOfs)
+
+		# 各Loopの所属面番号
+		self.loopFace = np.repeat(
+			np.arange(len(self.faceStart), dtype=np.int64), self.faceTotal )
+
+	# オブジェクトごとの配列を連結して、通し番号のスナップショットを生成する。
+	# partsの各要素は (uv, select, loopVert, loopEdge, edgeSharp, faceStart, faceTotal, vertCo)
+	@classmethod
+	def concat(cls, parts):
+		uvs, sels, lVerts, lEdges, eSharps, fStarts, fTotals, vCos = [], [], [], [], [], [], [], []
+		objLoopOfs = [0]
+		loopOfs = vertOfs = edgeOfs = 0
+		for uv, select, loopVert, loopEdge, edgeSharp, faceStart, faceTotal, vertCo in parts:
+			loopVert = np.asarray(loopVert, dtype=np.int64)
+			loopEdge = np.asarray(loopEdge, dtype=np.int64)
+			vertCo = np.asarray(vertCo, dtype=np.float64).reshape(-1, 3)
+			uvs.append(np.asarray(uv, dtype=np.float64).reshape(-1, 2))
+			sels.append(np.asarray(select, dtype=bool))
+			lVerts.append(loopVert + vertOfs)
+			lEdges.append(loopEdge + edgeOfs)
+			eSharps.append(np.asarray(edgeSharp, dtype=bool))
+			fStarts.append(np.asarray(faceStart, dtype=np.int64) + loopOfs)
+			fTotals.append(np.asarray(faceTotal, dtype=np.int64))
+			vCos.append(vertCo)
+
+			loopOfs += len(loopVert)
+			vertOfs += len(vertCo)
+			edgeOfs += len(edgeSharp)
+			objLoopOfs.append(loopOfs)
+
+		def cat(lst, shape, dtype):
+			return np.concatenate(lst) if lst else np.zeros(shape, dtype=dtype)
+		return cls(
+			cat(uvs, (0,2), np.float64),
+			cat(sels, (0,), bool),
+			cat(lVerts, (0,), np.int64),
+			cat(lEdges, (0,), np.int64),
+			cat(eSharps, (0,), bool),
+			cat(fStarts, (0,), np.int64),
+			cat(fTotals, (0,), np.int64),
+			cat(vCos, (0,3), np.float64),
+			objLoopOfs,
+		)
+
+	@property
+	def loopCount(self): return len(self.uv)
+
+	@property
+	def objCount(self): return len(self.objLoopOfs) - 1
+
+	# 各Loopの、所属面内での順番
+	def loopInFace(self):
+		return np.arange(self.loopCount, dtype=np.int64) - self.faceStart[self.loopFace]
+
+	# 各Loopの次のLoop番号（BMLoop.link_loop_next 相当）
+	def loopNext(self):
+		start = self.faceStart[self.loopFace]
+		total = self.faceTotal[self.loopFace]
+		return start + (self.loopInFace() + 1) % total
+
+	# 各Loopの所属オブジェクト番号
+	def loopObj(self):
+		return np.repeat(
+			np.arange(self.objCount, dtype=np.int64), np.diff(self.objLoopOfs) )
+
+	# 指定Loopのうち、取得時点からUV座標が変わったもののLoop番号一覧
+	def changedLoops(self, loopIdxs):
+		loopIdxs = np.asarray(loopIdxs, dtype=np.int64)
+		return loopIdxs[np.any(self.uv[loopIdxs] != self.baseUV[loopIdxs], axis=1)]
+
+	# 選択中UVのLoop番号一覧
+	def selectedLoops(self):
+		return np.flatnonzero(self.select)
+
+	# 両端のUVが選択されているLoop（選択中UVエッジ）の一覧
+	def selectedEdgeLoops(self):
+		return np.flatnonzero(self.select & self.select[self.loopNext()])
+
+	# 選択中UVエッジと、同じエッジを参照する別Loopの組を列挙する。
+	# 戻り値は (参照元Loop番号, 対象Loop番号) の配列の組で、それぞれのUVは
+	#	参照元 : uv[src], uv[next[src]]
+	#	対象   : uv[next[dst]], uv[dst]
+	# の順で対応する。同じ位置にあるエッジは除外する。
+	# isShowSelEdgeがFalseの場合は、対象エッジも選択中のものは除外する。
+	def selectedEdgePairs(self, isShowSelEdge):
+		empty = np.zeros(0, dtype=np.int64)
+		if self.loopCount == 0: return empty, empty
+
+		nxt = self.loopNext()
+		selLoops = np.flatnonzero(self.select & self.select[nxt])
+		if len(selLoops) == 0: return empty, empty
+
+		# 選択中エッジごとに、代表となる参照元Loopを1つ決める
+		selEdges, firstIdx = np.unique(self.loopEdge[selLoops], return_index=True)
+		srcOfEdge = np.full(len(self.edgeSharp), -1, dtype=np.int64)
+		srcOfEdge[selEdges] = selLoops[firstIdx]
+
+		# 同じエッジを参照するLoopを対象として列挙
+		dst = np.flatnonzero(srcOfEdge[self.loopEdge] >= 0)
+		src = srcOfEdge[self.loopEdge[dst]]
+
+		sUV0 = self.uv[src]
+		sUV1 = self.uv[nxt[src]]
+		dUV0 = self.uv[nxt[dst]]
+		dUV1 = self.uv[dst]
+		isSame = (
+			np.all(sUV0 == dUV0, axis=1) & np.all(sUV1 == dUV1, axis=1) |
+			np.all(sUV0 == dUV1, axis=1) & np.all(sUV1 == dUV0, axis=1)
+		)
+		valid = ~isSame
+		if not isShowSelEdge:
+			valid &= ~(self.select[nxt[dst]] & self.select[dst])
+		return src[valid], dst[valid]
+
+	# 別のスナップショットと、面とLoopの構成が同じか否か
+	def isSameTopology(self, other):
+		return (
+			np.array_equal(self.faceStart, other.faceStart) and
+			np.array_equal(self.faceTotal, other.faceTotal) )
+
+	# 構成が同じ別のスナップショットと比べて、UV座標が変化した面を含む範囲を求める。
+	# 変化前後の両方の位置を含む (最小UV, 最大UV) を返す。変化がない場合はNone
+	def changedFaceRect(self, prev):
+		changed = np.flatnonzero(np.any(self.uv != prev.uv, axis=1))
+		if len(changed) == 0: return None
+
+		faceMask = np.zeros(len(self.faceStart), dtype=bool)
+		faceMask[self.loopFace[changed]] = True
+		loopMask = faceMask[self.loopFace]
+		uvs = np.concatenate((self.uv[loopMask], prev.uv[loopMask]))
+		return uvs.min(axis=0), uvs.max(axis=0)
+
+	# 同じエッジを参照し、両端のUV座標が一致しているLoopの組（UV上で繋がっているLoop）を列挙する。
+	# 戻り値は (Loop番号の配列a, Loop番号の配列b)
+	def linkedLoopPairs(self):
+		nxt = self.loopNext()
+
+		# エッジ番号順にLoopを並べ、隣り合う同じエッジのLoop同士を比較する
+		order = np.argsort(self.loopEdge, kind="stable")
+		a = order[:-1]
+		b = order[1:]
+		isPair = self.loopEdge[a] == self.loopEdge[b]
+		a = a[isPair]
+		b = b[isPair]
+		isLinked = (
+			np.all(self.uv[a] == self.uv[nxt[b]], axis=1) &
+			np.all(self.uv[nxt[a]] == self.uv[b], axis=1)
+		)
+		return a[isLinked], b[isLinked]
+
+	# UV上で繋がっている面ごとに、アイランド番号を割り振る。
+	# 戻り値は (各面のアイランド番号の(F,)配列, アイランド数)
+	def faceIslands(self):
+		faceCnt = len(self.faceStart)
+		if faceCnt == 0: return np.zeros(0, dtype=np.int64), 0
+
+		a, b = self.linkedLoopPairs()
+		return connectedLabels(faceCnt, self.loopFace[a], self.loopFace[b])
+
+	# アイランドの外周となるLoop（UV上で他の面と繋がっていないLoop）の一覧
+	def islandBoundaryLoops(self):
+		isLinked = np.zeros(self.loopCount, dtype=bool)
+		a, b = self.linkedLoopPairs()
+		isLinked[a] = True
+		isLinked[b] = True
+		return np.flatnonzero(~isLinked)
+
+	# 選択中UVを、選択中UVエッジで繋がっているもの同士のまとまり（チェーン）に分ける。
+	# 同じ頂点で同じUV座標のLoopは、同じUV頂点とみなす。
+	# 戻り値はチェーンごとの、選択中Loop番号の配列のリスト
+	def selectedChains(self):
+		sel = self.selectedLoops()
+		if len(sel) == 0: return []
+
+		# 選択中LoopごとのUV頂点番号
+		keys = np.concatenate((self.loopVert[sel,None].astype(np.float64), self.uv[sel]), axis=1)
+		_, uvVert = np.unique(keys, axis=0, return_inverse=True)
+		uvVert = uvVert.reshape(-1)
+		selPos = np.full(self.loopCount, -1, dtype=np.int64)
+		selPos[sel] = np.arange(len(sel))
+
+		# 選択中UVエッジで、UV頂点同士を連結する
+		nxt = self.loopNext()
+		edgeLoops = np.flatnonzero(self.select & self.select[nxt])
+		labels, _ = connectedLabels(
+			int(uvVert.max()) + 1,
+			uvVert[selPos[edgeLoops]],
+			uvVert[selPos[nxt[edgeLoops]]] )
+
+		selLabel = labels[uvVert]
+		order = np.argsort(selLabel, kind="stable")
+		bounds = np.flatnonzero(np.diff(selLabel[order])) + 1
+		return np.split(sel[order], bounds)
+
+	# 全面を扇状に三角形分割した、Loop番号の(T,3)配列を得る
+	def triangles(self):
+		return triangulateFaces(self.faceStart, self.faceTotal)
+
+	# 全面の外周を構成する、Loop番号の(E,2)配列を得る
+	def faceLines(self):
+		idx = np.arange(self.loopCount, dtype=np.int64)
+		return np.stack((idx, self.loopNext()), axis=1)
+
+
+#-------------------------------------------------------
+
+# 面の先頭Loop番号とLoop数から、扇状に三角形分割したLoop番号の(T,3)配列を得る。
+# 各面の3角形の並びは (s, s+1, s+2), (s, s+2, s+3), ... となる。
+def triangulateFaces(faceStart, faceTotal):
+	faceStart = np.asarray(faceStart, dtype=np.int64)
+	triCnt = np.maximum(np.asarray(faceTotal, dtype=np.int64) - 2, 0)
+	triTotal = int(triCnt.sum())
+	if triTotal == 0: return np.zeros((0,3), dtype=np.int64)
+
+	triFace = np.repeat(np.arange(len(faceStart), dtype=np.int64), triCnt)
+	triOfs = np.cumsum(triCnt) - triCnt
+	k = np.arange(triTotal, dtype=np.int64) - triOfs[triFace] + 1
+	s = faceStart[triFace]
+	return np.stack((s, s+k, s+k+1), axis=1)
+
+
+#-------------------------------------------------------
+
+# 2次元点群の凸包を、反時計回りの点番号の配列で得る（Andrewのモノトーンチェーン法）。
+# 同じ座標の点は1つにまとめ、直線上の点は含めない。
+def convexHull(pts):
+	pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+	_, uniq = np.unique(pts, axis=0, return_index=True)
+	order = uniq[np.lexsort((pts[uniq,1], pts[uniq,0]))]
+	if len(order) <= 2: return order
+
+	def cross(o, a, b):
+		return (a[0]-o[0])*(b[1]-o[1]) - (a[1]-o[1])*(b[0]-o[0])
+	p = pts.tolist()
+	def half(idxs):
+		result = []
+		for i in idxs:
+			while 2 <= len(result) and cross(p[result[-2]], p[result[-1]], p[i]) <= 0:
+				result.pop()
+			result.append(i)
+		return result
+	order = order.tolist()
+	lower = half(order)
+	upper = half(reversed(order))
+	return np.array(lower[:-1] + upper[:-1], dtype=np.int64)
+
+# 2次元点群の中で、最も離れた2点の点番号の組の一覧を得る（凸包上のキャリパー法）。
+# 同じ距離の組が複数ある場合は全て返す。点が1種類しかない場合は空リスト
+def farthestPairs(pts):
+	pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+	hull = convexHull(pts)
+	if len(hull) < 2: return []
+	if len(hull) == 2: return [tuple(sorted((int(hull[0]), int(hull[1]))))]
+
+	# 凸包の各辺に対して、最も遠い頂点を順に進めながら対蹠点対を列挙する
+	h = pts[hull].tolist()
+	n = len(h)
+	def area2(i, j, k):
+		return abs((h[j][0]-h[i][0])*(h[k][1]-h[i][1]) - (h[j][1]-h[i][1])*(h[k][0]-h[i][0]))
+	antipodals = []
+	k = 1
+	for i in range(n):
+		j = (i + 1) % n
+		while area2(i, j, (k+1) % n) > area2(i, j, k):
+			k = (k + 1) % n
+		antipodals += [(i, k), (j, k)]
+		# 辺が平行な場合は、次の頂点も対蹠点になる
+		if area2(i, j, (k+1) % n) == area2(i, j, k):
+			antipodals += [(i, (k+1) % n), (j, (k+1) % n)]
+
+	dists = [(h[a][0]-h[b][0])**2 + (h[a][1]-h[b][1])**2 for a, b in antipodals]
+	best = max(dists)
+	result = {
+		tuple(sorted((int(hull[a]), int(hull[b]))))
+		for (a, b), d in zip(antipodals, dists) if d == best
+	}
+	return sorted(result)
+
+# 2点を直径とする円が、他の全ての点を内包するような2点を探す。
+# そのような2点は必ず最遠点対になるので、最遠点対についてのみ判定すればよい。
+# 戻り値は点番号の組 (小さい番号, 大きい番号)。複数ある場合は番号の小さいもの。無い場合はNone
+def lineupEndpoints(pts):
+	pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+	for i, j in farthestPairs(pts):
+		ctr = (pts[i] + pts[j]) / 2
+		rSqr = np.sum((pts[i] - ctr) ** 2)
+
+		# 2点自身と同じ座標の点は、判定から除外する
+		others = ~(np.all(pts == pts[i], axis=1) | np.all(pts == pts[j], axis=1))
+		if not np.any(rSqr < np.sum((pts[others] - ctr) ** 2, axis=1)): return i, j
+	return None
+
+# 2次元点群がなんとなく並んでいる方向の単位ベクトルを得る。
+# lineupEndpointsの2点が定義できる場合はその2点の方向、できない場合は主成分方向。
+# どちらも定義できない場合はNone
+def lineupDir(pts):
+	pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+	ends = lineupEndpoints(pts)
+	if ends is not None:
+		d = pts[ends[0]] - pts[ends[1]]
+		return d / np.linalg.norm(d)
+	return principalDir(pts)
+
+# 2次元点群の主成分方向（最も分散の大きい方向）の単位ベクトルを得る。
+# 点が1種類しかない場合はNone
+def principalDir(pts):
+	pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+	if len(pts) < 2: return None
+	d = pts - pts.mean(axis=0)
+	w, v = np.linalg.eigh(d.T @ d)
+	if w[-1] <= 0: return None
+	return v[:,-1]
+
+# UV座標群を、頂点間距離の比率を維持したまま一直線に並べ直す（Straight Relaxの本体）。
+#	uvs	: (N,2) Loopごとの UV座標
+#	cos	: (N,3) Loopごとの頂点座標
+# UV座標と頂点座標の組が同じものは、同じ点として扱う。
+# 戻り値は (N,2) の新しいUV座標。点が1種類以下・方向が定義できない場合はNone
+def straightRelax(uvs, cos):
+	uvs = np.asarray(uvs, dtype=np.float64).reshape(-1, 2)
+	cos = np.asarray(cos, dtype=np.float64).reshape(-1, 3)
+	dct, inv = dedupUVs(np.concatenate((uvs, cos), axis=1))
+	if len(dct) <= 1: return None
+	dctUVs = dct[:,:2]
+	dctCos = dct[:,2:]
+
+	# 方向を決定し、整列方向に沿ってソートする
+	dir = lineupDir(dctUVs)
+	if dir is None: return None
+	order = np.argsort(dctUVs @ dir, kind="stable")
+
+	# 頂点間距離を維持した形を計算し、両端のUV間の長さに合わせる
+	l = np.linalg.norm(np.diff(dctCos[order], axis=0), axis=1)
+	ofs = np.concatenate(([0.0], np.cumsum(l)))
+	if ofs[-1] <= 0: return None
+	ofs *= np.linalg.norm(dctUVs[order[-1]] - dctUVs[order[0]]) / ofs[-1]
+
+	kpdUVs = np.empty_like(dctUVs)
+	kpdUVs[order] = dctUVs[order[0]] + dir * ofs[:,None]
+	return kpdUVs[inv]
+
+
+#-------------------------------------------------------
+
+# UV座標（と付随する値）の行の重複を除く。np.unique(..., axis=0, return_inverse=True) 相当。
+# 各値をepsilon幅のバケットに量子化して比較し、同じバケットの行は同じものとみなす。
+# 戻り値は (重複を除いた行, 元の行ごとの重複を除いた行の番号)。
+# 重複を除いた行は、元の並びで最初に出現した順に並び、値も最初に出現した行のものになる。
+def dedupUVs(vals, epsilon=UV_EPSILON):
+	vals = np.asarray(vals, dtype=np.float64)
+	vals = vals.reshape(len(vals), -1)
+	if len(vals) == 0: return vals, np.zeros(0, dtype=np.int64)
+	q = quantizeUVs(vals, epsilon)
+	_, first, inv = np.unique(q, axis=0, return_index=True, return_inverse=True)
+
+	# np.uniqueはキーの昇順に並ぶので、最初に出現した順に並べ直す
+	order = np.argsort(first)
+	rank = np.empty_like(order)
+	rank[order] = np.arange(len(order))
+	return vals[first[order]], rank[inv.reshape(-1)]
+
+# UV座標（と付随する値）を、epsilon幅のバケット番号の整数配列へ量子化する。
+# 大きな座標や小さなepsilonでもint64の範囲を超えないように、バケット番号は±QUANTIZE_LIMITに丸める。
+def quantizeUVs(vals, epsilon):
+	vals = np.asarray(vals, dtype=np.float64)
+	q = np.clip(np.rint(vals / epsilon), -QUANTIZE_LIMIT, QUANTIZE_LIMIT)
+	return q.astype(np.int64)
+
+# 整数の(N,2)配列の各行を、同じ行が同じ番号になるような1次元のint64配列にする。
+# 値の範囲がint64に収まる場合は2列を1つの値に詰め、収まらない場合はnp.uniqueで番号を振る
+def packRows(rows):
+	rows = np.asarray(rows, dtype=np.int64).reshape(-1, 2)
+	if len(rows) == 0: return np.zeros(0, dtype=np.int64)
+	lo = rows.min(axis=0)
+	hi = rows.max(axis=0)
+	spanY = int(hi[1]) - int(lo[1]) + 1
+	if (int(hi[0]) - int(lo[0]) + 1) * spanY <= np.iinfo(np.int64).max:
+		return (rows[:,0] - lo[0]) * spanY + (rows[:,1] - lo[1])
+	_, inv = np.unique(rows, axis=0, return_inverse=True)
+	return inv.reshape(-1).astype(np.int64)
+
+# UV座標の変換テーブル。
+# 変換元UV座標を量子化したバケット番号の組をキーにしてハッシュ引きするので、登録・検索ともにO(1)で行える。
+# 同じバケットに複数登録しようとした場合は、最初に登録したものが優先される。
+class UVConvMap:
+
+	def __init__(self, epsilon):
+		self.epsilon = epsilon
+		self.__map = {}
+
+	def __len__(self): return len(self.__map)
+
+	# 1点分のキー計算。quantizeUVsと同じ値をPythonの数値演算のみで求める
+	def __key(self, uv):
+		return tuple(
+			max(-QUANTIZE_LIMIT, min(QUANTIZE_LIMIT, round(i / self.epsilon)))
+			for i in (uv[0], uv[1]) )
+
+	# 変換元UVと変換先UVの組を登録する
+	def add(self, src, dst):
+		key = self.__key(src)
+		if key not in self.__map: self.__map[key] = dst
+
+	# 変換元UVから変換先UVを得る。登録されていない場合はNone
+	def find(self, uv):
+		return self.__map.get(self.__key(uv))
+
+	# UV座標配列のうち、変換対象のものを一括で検索する。
+	# 戻り値は (変換対象のインデックス配列, 変換先UV座標の(N,2)配列)
+	def remap(self, uvs):
+		if len(self.__map) == 0:
+			return np.zeros(0, dtype=np.int64), np.zeros((0,2), dtype=np.float64)
+
+		# 登録済みのキーと検索するキーを1次元の番号にまとめ、登録済みのキーと同じ番号のものを変換対象とする
+		regKeys = np.array(list(self.__map.keys()), dtype=np.int64).reshape(-1, 2)
+		keys = quantizeUVs(np.asarray(uvs).reshape(-1, 2), self.epsilon)
+		ids = packRows(np.concatenate((regKeys, keys)))
+		regIds = ids[:len(regKeys)]
+		order = np.argsort(regIds)
+		pos = np.minimum(np.searchsorted(regIds, ids[len(regKeys):], sorter=order), len(order) - 1)
+		hitIdx = order[pos]
+		hit = np.flatnonzero(regIds[hitIdx] == ids[len(regKeys):])
+		hitIdx = hitIdx[hit]
+
+		dsts = list(self.__map.values())
+		dst = [dsts[i] for i in hitIdx.tolist()]
+		return hit, np.asarray(dst, dtype=np.float64).reshape(-1, 2)
+
+
+#-------------------------------------------------------
+
+# 要素数countのグラフを、(a[i], b[i]) の辺で連結したときの連結成分番号を求める。
+# 戻り値は (各要素の成分番号の配列, 成分数)。成分番号は0から連番になる。
+def connectedLabels(count, a, b):
+	a = np.asarray(a, dtype=np.int64)
+	b = np.asarray(b, dtype=np.int64)
+	labels = np.arange(count, dtype=np.int64)
+	while True:
+		# 各辺の両端の代表を、小さい方の番号に付け替える
+		la = labels[a]
+		lb = labels[b]
+		m = np.minimum(la, lb)
+		prev = labels.copy()
+		np.minimum.at(labels, la, m)
+		np.minimum.at(labels, lb, m)
+
+		# 代表をたどって、根まで縮約する
+		while True:
+			jumped = labels[labels]
+			if np.array_equal(jumped, labels): break
+			labels = jumped
+
+		if np.array_equal(prev, labels): break
+
+	_, labels = np.unique(labels, return_inverse=True)
+	return labels.reshape(-1), int(labels.max()) + 1 if count else 0
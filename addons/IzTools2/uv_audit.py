@@ -0,0 +1,204 @@
+#
+# UVアイランド間の間隔（テクセル単位）を調べ、何段目のミップマップで色の滲みが起きるかを求めるモジュール。
+#
+# アイランドの外周エッジを一様グリッドの空間ハッシュに登録し、近傍セル同士でのみ
+# 距離を計算するので、全ての組み合わせを比較する必要はない。
+# 滲みの判定には、Island Previewと同じuv_rasterのマージンの幅を使用する。
+# bpyに依存しないので、Blender外でも単体でimportして使用できる。
+#
+
+import csv
+import json
+import numpy as np
+
+try:
+	from . import uv_array
+	from . import uv_raster
+except ImportError:
+	# Blender外で単体でimportした場合
+	import uv_array
+	import uv_raster
+
+
+# 一度に距離を計算する線分の組の数の上限
+PAIR_CHUNK = 1 << 21
+
+
+#-------------------------------------------------------
+
+# UVスナップショット1つ分の、アイランド間隔を調べる。
+#	size	: テクスチャ解像度
+#	maxMip	: 調べる最大のミップレベル
+# 戻り値の辞書
+#	islands			: アイランド数
+#	minDistance		: 異なるアイランド間の最小距離（テクセル）。maxMipまでに滲まない場合はNone
+#	bleedMipLevel	: 初めて滲みが起きるミップレベル。maxMipまでに滲まない場合はNone
+#	islandPair		: 最小距離となったアイランド番号の組
+def auditSnapshot(snap, size, maxMip):
+	faceIsland, islandCnt = snap.faceIslands()
+	result = {
+		"islands": islandCnt,
+		"minDistance": None,
+		"bleedMipLevel": None,
+		"islandPair": None,
+	}
+	if islandCnt < 2: return result
+
+	# アイランド外周の線分を、テクセル単位の座標で得る
+	loops = snap.islandBoundaryLoops()
+	nxt = snap.loopNext()
+	p0 = snap.uv[loops] * size
+	p1 = snap.uv[nxt[loops]] * size
+	labels = faceIsland[snap.loopFace[loops]]
+
+	dist, pair = minSegmentDistance(p0, p1, labels, bleedDistance(maxMip))
+	if dist is None: return result
+
+	result["minDistance"] = dist
+	result["bleedMipLevel"] = bleedMipLevel(dist)
+	result["islandPair"] = pair
+	return result
+
+# ミップレベルmipで滲みが起きる、アイランド間の距離（テクセル）。
+# 双方のアイランドのマージンの幅の和より近いと、ピクセルとの位置関係によってはマージン同士が重なる。
+# Island Previewでも、この距離以上では重ならず、これより1テクセル以上近ければ位置によらず重なる
+def bleedDistance(mip):
+	return 2 * uv_raster.mipPaddingWidth(mip)
+
+# アイランド間の距離（テクセル）から、初めて滲みが起きるミップレベルを求める
+def bleedMipLevel(dist):
+	mip = 0
+	while bleedDistance(mip) <= dist: mip += 1
+	return mip
+
+
+#-------------------------------------------------------
+
+# ラベルの異なる線分同士の最小距離を、maxDist未満の範囲で求める。
+# 探索距離を小さい値から倍々に広げていき、見つかった時点で打ち切る。
+# 戻り値は (最小距離, (ラベル, ラベル))。maxDist未満の組が無い場合は (None, None)
+def minSegmentDistance(p0, p1, labels, maxDist, minDist=2.0):
+	p0 = np.asarray(p0, dtype=np.float64).reshape(-1, 2)
+	p1 = np.asarray(p1, dtype=np.float64).reshape(-1, 2)
+	labels = np.asarray(labels, dtype=np.int64)
+	if len(p0) == 0: return None, None
+
+	dist = min(minDist, maxDist)
+	while True:
+		best = None
+		for a, b in _candidatePairs(p0, p1, dist):
+			isOther = labels[a] != labels[b]
+			a = a[isOther]
+			b = b[isOther]
+			if len(a) == 0: continue
+
+			d = segmentDistances(p0[a], p1[a], p0[b], p1[b])
+			i = int(np.argmin(d))
+			if best is None or d[i] < best[0]:
+				best = (float(d[i]), (int(labels[a[i]]), int(labels[b[i]])))
+
+		if best is not None and best[0] < dist:
+			return best[0], tuple(sorted(best[1]))
+		if maxDist <= dist: return None, None
+		dist = min(dist * 2, maxDist)
+
+# 線分 (a0,a1) と (b0,b1) の距離を、組ごとに求める。交差している場合は0
+def segmentDistances(a0, a1, b0, b1):
+	d = np.minimum(
+		np.minimum(_pointSegmentDistances(a0, b0, b1), _pointSegmentDistances(a1, b0, b1)),
+		np.minimum(_pointSegmentDistances(b0, a0, a1), _pointSegmentDistances(b1, a0, a1)),
+	)
+	def cross(o, p, q):
+		return (p[:,0]-o[:,0])*(q[:,1]-o[:,1]) - (p[:,1]-o[:,1])*(q[:,0]-o[:,0])
+	isCross = (
+		(np.sign(cross(a0, a1, b0)) * np.sign(cross(a0, a1, b1)) < 0) &
+		(np.sign(cross(b0, b1, a0)) * np.sign(cross(b0, b1, a1)) < 0)
+	)
+	d[isCross] = 0
+	return d
+
+# 点pと線分 (a,b) の距離を、組ごとに求める
+def _pointSegmentDistances(p, a, b):
+	ab = b - a
+	lenSqr = np.einsum("ij,ij->i", ab, ab)
+	t = np.einsum("ij,ij->i", p - a, ab) / np.where(lenSqr == 0, 1, lenSqr)
+	t = np.clip(t, 0, 1)
+	return np.linalg.norm(a + ab * t[:,None] - p, axis=1)
+
+# 距離がmaxDist未満の可能性がある線分の組を、一様グリッドで列挙する。
+# 各線分を、一辺maxDistの正方形で掃引した範囲が通るセルに登録すると、
+# 距離がmaxDist未満の2線分は、最近点同士の中点を含むセルに必ず共に登録される。
+# メモリ使用量を抑えるため、組はPAIR_CHUNK程度ずつ (線分番号の配列a, 線分番号の配列b) で返す。
+def _candidatePairs(p0, p1, maxDist):
+	seg, cx, cy = _segmentCells(p0, p1, maxDist, maxDist / 2)
+	key = uv_array.packRows(np.stack((cx, cy), axis=1))
+
+	# セルごとにまとめ、同じセル内の全ての組を列挙する
+	order = np.argsort(key, kind="stable")
+	key = key[order]
+	seg = seg[order]
+	groupStart = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+	groupSize = np.diff(np.r_[groupStart, len(key)])
+	groupEnd = np.repeat(groupStart + groupSize, groupSize)
+	pos = np.arange(len(key), dtype=np.int64)
+	pairCnt = groupEnd - pos - 1
+
+	chunkId = (np.cumsum(pairCnt) - pairCnt) // PAIR_CHUNK
+	for cpos in np.split(pos, np.flatnonzero(np.diff(chunkId)) + 1):
+		cc = pairCnt[cpos]
+		a = np.repeat(cpos, cc)
+		b = a + 1 + np.arange(int(cc.sum()), dtype=np.int64) - np.repeat(np.cumsum(cc) - cc, cc)
+		yield seg[a], seg[b]
+
+
+# 各線分を一辺2*halfの正方形で掃引した範囲が通る、一辺cellのセルを列挙する。
+# バウンディングボックス内の全セルではなく、X方向のセルの列ごとに、
+# その列に掛かる部分の線分のY範囲だけを登録するので、登録数は線分の長さに比例する。
+# 戻り値は (線分番号, セルX, セルY) の配列の組
+def _segmentCells(p0, p1, cell, half):
+	half = half + cell * 1e-6		# 丸め誤差でセルを取りこぼさないよう、わずかに広げる
+	cMin = np.floor((np.minimum(p0, p1) - half) / cell).astype(np.int64)
+	cMax = np.floor((np.maximum(p0, p1) + half) / cell).astype(np.int64)
+	cw = cMax[:,0] - cMin[:,0] + 1
+
+	# (線分番号, セルの列) を展開
+	seg = np.repeat(np.arange(len(p0), dtype=np.int64), cw)
+	cx = cMin[seg,0] + np.arange(len(seg), dtype=np.int64) - np.repeat(np.cumsum(cw) - cw, cw)
+
+	# 列のX範囲から±half以内となる、線分上の区間のY範囲
+	a = p0[seg]
+	d = p1[seg] - a
+	with np.errstate(divide="ignore", invalid="ignore"):
+		t0 = (cx * cell - half - a[:,0]) / d[:,0]
+		t1 = ((cx + 1) * cell + half - a[:,0]) / d[:,0]
+	isFlat = d[:,0] == 0
+	tMin = np.clip(np.where(isFlat, 0.0, np.minimum(t0, t1)), 0, 1)
+	tMax = np.clip(np.where(isFlat, 1.0, np.maximum(t0, t1)), 0, 1)
+	y0 = a[:,1] + d[:,1] * tMin
+	y1 = a[:,1] + d[:,1] * tMax
+	rMin = np.maximum(np.floor((np.minimum(y0, y1) - half) / cell).astype(np.int64), cMin[seg,1])
+	rMax = np.minimum(np.floor((np.maximum(y0, y1) + half) / cell).astype(np.int64), cMax[seg,1])
+	ch = np.maximum(rMax - rMin + 1, 0)
+
+	# (線分番号, セルの列, セルの行) を展開
+	col = np.repeat(np.arange(len(seg), dtype=np.int64), ch)
+	cy = rMin[col] + np.arange(len(col), dtype=np.int64) - np.repeat(np.cumsum(ch) - ch, ch)
+	return seg[col], cx[col], cy
+
+
+#-------------------------------------------------------
+
+# 監査結果の行リストを、JSONもしくはCSVで書き出す。拡張子が .csv の場合はCSVにする
+def writeReport(rows, filepath):
+	if filepath.lower().endswith(".csv"):
+		keys = []
+		for row in rows:
+			for k in row.keys():
+				if k not in keys: keys.append(k)
+		with open(filepath, "w", newline="", encoding="utf-8") as f:
+			writer = csv.DictWriter(f, fieldnames=keys)
+			writer.writeheader()
+			for row in rows: writer.writerow(row)
+	else:
+		with open(filepath, "w", encoding="utf-8") as f:
+			json.dump(rows, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,277 @@
+#
+# Island Previewと同じアイランドマスク・膨張マージンを、CPU上で計算するモジュール。
+#
+# GPUのオフスクリーン描画結果と同じものを、NumPyのみで求める。
+# 画面の無い環境でのパディング確認や、GPU描画結果の検証用の基準として使用する。
+# bpyに依存しないので、Blender外でも単体でimportして使用できる。
+#
+# 画像は [y, x] の順の2次元配列で、ピクセル(x,y)の中心はUV座標 ((x+0.5)/size, (y+0.5)/size) 。
+#
+
+import numpy as np
+
+
+# 一度に評価する候補ピクセル数の上限。メモリ使用量を抑えるために分割して処理する
+CHUNK_PIXELS = 1 << 22
+
+# 外周線を塗る範囲の半径（ピクセル）
+EDGE_BLEED_PIXELS = 0.49
+
+
+#-------------------------------------------------------
+
+# 三角形群を塗りつぶし、ラベル画像へ書き込む。
+#	uvs		: (N,2) 頂点のUV座標
+#	tris	: (T,3) 三角形ごとの頂点番号
+#	labels	: (T,)  三角形ごとに書き込む値
+#	img		: (size,size) 書き込み先のラベル画像
+# ピクセル中心が三角形の内側（辺上を含む）にあるピクセルを塗る。
+# 同じピクセルを複数の三角形が塗る場合は、後の三角形のラベルになる。
+def rasterizeTriangles(uvs, tris, labels, img):
+	size = img.shape[0]
+	tris = np.asarray(tris, dtype=np.int64).reshape(-1, 3)
+	if len(tris) == 0: return img
+	labels = np.asarray(labels)
+
+	# ピクセル中心が整数座標に来るように、0.5ずらしたピクセル空間に変換
+	p = np.asarray(uvs, dtype=np.float64).reshape(-1, 2) * size - 0.5
+	p0 = p[tris[:,0]]
+	p1 = p[tris[:,1]]
+	p2 = p[tris[:,2]]
+
+	# 各三角形が覆うピクセル範囲
+	pMin = np.minimum(np.minimum(p0, p1), p2)
+	pMax = np.maximum(np.maximum(p0, p1), p2)
+	x0 = np.clip(np.ceil(pMin[:,0]), 0, size).astype(np.int64)
+	y0 = np.clip(np.ceil(pMin[:,1]), 0, size).astype(np.int64)
+	x1 = np.clip(np.floor(pMax[:,0]) + 1, 0, size).astype(np.int64)
+	y1 = np.clip(np.floor(pMax[:,1]) + 1, 0, size).astype(np.int64)
+	w = np.maximum(x1 - x0, 0)
+	h = np.maximum(y1 - y0, 0)
+
+	# 面積0の三角形と、ピクセル中心を1つも含まない三角形は除外
+	area = _cross(p0, p1, p2)
+	valid = np.flatnonzero((area != 0) & (w > 0) & (h > 0))
+
+	# 各辺 a->b の、三角形の向きを揃えた (ax, ay, ex, ey)。
+	# ピクセル中心(x,y)は ex*(y-ay) - ey*(x-ax) >= 0 のとき辺の内側
+	sgn = np.sign(area)
+	coefs = [
+		(a[:,0], a[:,1], (b[:,0]-a[:,0])*sgn, (b[:,1]-a[:,1])*sgn)
+		for a, b in ((p0, p1), (p1, p2), (p2, p0)) ]
+
+	# 三角形の各行ごとに、内側となるXの範囲を求めて塗る。候補ピクセル数ごとに分割して処理
+	for idxs in _chunks(valid, (w * h)[valid]):
+		ch = h[idxs]
+		t = np.repeat(idxs, ch)
+		py = np.arange(len(t), dtype=np.int64) - np.repeat(np.cumsum(ch) - ch - y0[idxs], ch)
+		y = py.astype(np.float64)
+		rowX0 = x0[t]
+		rowX1 = x1[t] - 1
+
+		# 各辺の内側となるXの範囲の、共通部分を求める
+		lo = rowX0.astype(np.float64)
+		hi = rowX1.astype(np.float64)
+		rows = []
+		for ax, ay, ex, ey in coefs:
+			ax = ax[t]
+			ey = ey[t]
+			rowA = ex[t] * (y - ay[t])
+			rows.append((ax, ey, rowA))
+			with np.errstate(divide="ignore", invalid="ignore"):
+				bound = ax + rowA / ey
+			lo = np.where(ey < 0, np.maximum(lo, bound), lo)
+			hi = np.where(ey > 0, np.minimum(hi, bound), hi)
+			hi = np.where((ey == 0) & (rowA < 0), -1.0, hi)
+
+		# 割り算の丸め誤差の分を、辺関数による判定で補正する。
+		# 辺関数は行内でXに対して単調なので、内側のピクセルは連続している
+		def isInside(x):
+			xf = x.astype(np.float64)
+			ret = (rowX0 <= x) & (x <= rowX1)
+			for ax, ey, rowA in rows: ret &= rowA - ey * (xf - ax) >= 0
+			return ret
+		xl = np.ceil(lo).astype(np.int64)
+		xr = np.floor(hi).astype(np.int64)
+		xl = np.where(isInside(xl - 1), xl - 1, np.where(isInside(xl), xl, xl + 1))
+		xr = np.where(isInside(xr + 1), xr + 1, np.where(isInside(xr), xr, xr - 1))
+
+		cnt = np.maximum(xr - xl + 1, 0)
+		px = np.arange(int(cnt.sum()), dtype=np.int64) - np.repeat(np.cumsum(cnt) - cnt - xl, cnt)
+		img[np.repeat(py, cnt), px] = np.repeat(labels[t], cnt)
+
+	return img
+
+# 外周線の代わりに塗る、各線分を一辺2*halfWidthの正方形で掃引した範囲を三角形群で得る。
+# ラインを8方向に±halfWidthずらして描画したものを、隙間なく1回の描画で塗るためのもの。
+#	lines		: (E,2) 線分ごとの頂点番号。各頂点が、いずれかの線分の始点になっていること（面の外周など）
+#	halfWidth	: 正方形の半径（UV単位）
+# 線分ごとに、始点の正方形と、進行方向に対して両側に張り出す対角線を掃引した平行四辺形を作る。
+# 終点の正方形は、その頂点を始点とする線分側で作られる。
+# 戻り値は (頂点のUV座標の(E*8,2)配列, 三角形の(E*4,3)配列, 三角形ごとの線分番号の(E*4,)配列)
+def edgeBleedTriangles(uvs, lines, halfWidth):
+	uvs = np.asarray(uvs, dtype=np.float64).reshape(-1, 2)
+	lines = np.asarray(lines, dtype=np.int64).reshape(-1, 2)
+	p0 = uvs[lines[:,0]]
+	p1 = uvs[lines[:,1]]
+
+	sgn = np.where(p1 - p0 >= 0, 1.0, -1.0)
+	a = np.stack((-sgn[:,0], sgn[:,1]), axis=1) * halfWidth
+	square = np.array(((-1,-1), (1,-1), (1,1), (-1,1)), dtype=np.float64) * halfWidth
+	verts = np.concatenate((
+		p0[:,None,:] + square[None],
+		np.stack((p0 + a, p0 - a, p1 - a, p1 + a), axis=1),
+	), axis=1).reshape(-1, 2)
+
+	local = np.array(((0,1,2), (0,2,3), (4,5,6), (4,6,7)), dtype=np.int64)
+	tris = (np.arange(len(lines), dtype=np.int64)[:,None,None] * 8 + local[None]).reshape(-1, 3)
+	return verts, tris, np.repeat(np.arange(len(lines), dtype=np.int64), 4)
+
+# UV三角形群と外周線から、Island Previewと同じアイランドのラベル画像を作成する。
+# 外周線は、±EDGE_BLEED_PIXELSピクセルの範囲を塗る。
+# 塗られていないピクセルは-1。ラベルを省略した場合は全て0になる。
+def rasterizeIslands(uvs, tris, lines, size, triLabels=None, lineLabels=None):
+	img = np.full((size, size), -1, dtype=np.int64)
+	if triLabels is None: triLabels = np.zeros(len(tris), dtype=np.int64)
+	if lineLabels is None: lineLabels = np.zeros(len(lines), dtype=np.int64)
+	rasterizeTriangles(uvs, tris, triLabels, img)
+	edgeUVs, edgeTris, edgeLine = edgeBleedTriangles(uvs, lines, EDGE_BLEED_PIXELS / size)
+	rasterizeTriangles(edgeUVs, edgeTris, np.asarray(lineLabels)[edgeLine], img)
+	return img
+
+
+#-------------------------------------------------------
+
+# 半径radiusの正方形範囲で、ラベル画像を膨張させる。
+# 戻り値は (範囲内の最小ラベル, 範囲内の最大ラベル)。塗られていないピクセルは-1。
+# 最小と最大が異なるピクセルは、複数のアイランドのマージンが重なっている。
+def dilateLabels(img, radius):
+	big = np.iinfo(np.int64).max
+	imgMin = np.where(img < 0, big, img)
+	imgMax = img
+	for axis in (0, 1):
+		imgMin = _slidingReduce(imgMin, radius, axis, np.minimum, big)
+		imgMax = _slidingReduce(imgMax, radius, axis, np.maximum, -1)
+	imgMin = np.where(imgMin == big, -1, imgMin)
+	return imgMin, imgMax
+
+# Island Previewと同じ、マスクを膨張させた結果の真偽値画像を得る
+def dilateMask(mask, radius):
+	return _slidingReduce(
+		_slidingReduce(np.asarray(mask, dtype=bool), radius, 0, np.logical_or, False),
+		radius, 1, np.logical_or, False )
+
+# 指定ミップレベルまで色が滲まないために必要な、外周線の範囲より外側の膨張半径（ピクセル）。
+# ミップレベル0では外周線の範囲のみで、膨張させない
+def mipPaddingRadius(mipLevel):
+	return 2 ** mipLevel - 1
+
+# 指定ミップレベルで、アイランドの外側に確保されるマージンの幅（ピクセル）。
+# 外周線の範囲と、その外側の膨張半径を合わせたもの。
+# 2つのアイランドの間隔がそれぞれのマージンの和より狭いと、マージン同士が重なって色が滲む
+def mipPaddingWidth(mipLevel):
+	return mipPaddingRadius(mipLevel) + EDGE_BLEED_PIXELS
+
+# Island Previewの膨張シェーダの各パスで参照する距離の一覧。
+# 半径以下の最大の2の累乗から、1まで半分ずつにしていく
+def jumpFloodSteps(radius):
+	step = 1
+	while step*2 <= radius: step *= 2
+	steps = []
+	while 1 <= step:
+		steps.append(step)
+		step //= 2
+	return steps
+
+# Island Previewの膨張シェーダと同じ手順で、マスクを膨張させる（dilateMaskと同じ結果になる）。
+# X方向・Y方向それぞれに1次元のJump Floodingを行い、各ピクセルから最も近いマスク上のピクセルを求める。
+# 各パスでは、自身と ±step 離れた3ピクセルの持つ最も近いピクセルのうち、最も近いものを引き継ぐ。
+# 1次元では、この手順で半径以内の最も近いピクセルが必ず見つかる。
+def jumpFloodMask(mask, radius):
+	mask = np.asarray(mask, dtype=bool)
+	for axis in (1, 0):
+		m = np.moveaxis(mask, axis, -1)
+		n = m.shape[-1]
+		pos = np.arange(n)
+		none = -(n + 2*radius + 2)		# 見つかっていない場合の、どのピクセルからも半径外になる位置
+		seed = np.where(m, pos, none)
+		for step in jumpFloodSteps(radius):
+			best = seed
+			for ofs in (-step, step):
+				nb = np.full_like(seed, none)
+				if step < n:
+					if ofs < 0: nb[..., step:] = seed[..., :n-step]
+					else: nb[..., :n-step] = seed[..., step:]
+				best = np.where(np.abs(nb - pos) < np.abs(best - pos), nb, best)
+			seed = best
+		mask = np.moveaxis(np.abs(seed - pos) <= radius, -1, axis)
+	return mask
+
+# ラベル画像から、パディングの状況を集計する。
+#	islandPixels	: アイランド本体のピクセル数
+#	marginPixels	: 膨張で追加されたピクセル数
+#	overlapPixels	: 複数アイランドのマージンが重なるピクセル数
+#	overlapIslands	: マージンが重なっているアイランド番号の組の一覧
+def paddingReport(img, radius):
+	imgMin, imgMax = dilateLabels(img, radius)
+	isIsland = img >= 0
+	isDilated = imgMax >= 0
+	isOverlap = isDilated & (imgMin != imgMax)
+	pairs = np.unique(np.stack((imgMin[isOverlap], imgMax[isOverlap]), axis=1), axis=0)
+	return {
+		"islandPixels": int(isIsland.sum()),
+		"marginPixels": int((isDilated & ~isIsland).sum()),
+		"overlapPixels": int(isOverlap.sum()),
+		"overlapIslands": [tuple(i) for i in pairs.tolist()],
+	}
+
+# UVスナップショットから、アイランドごとにラベル付けしたラベル画像を作成し、パディングの状況を集計する
+def snapshotPaddingReport(snap, size, radius):
+	faceIsland, islandCnt = snap.faceIslands()
+	tris = snap.triangles()
+	lines = snap.faceLines()
+	img = rasterizeIslands(
+		snap.uv, tris, lines, size,
+		faceIsland[snap.loopFace[tris[:,0]]],
+		faceIsland[snap.loopFace[lines[:,0]]] )
+
+	report = paddingReport(img, radius)
+	report["size"] = size
+	report["radius"] = radius
+	report["islands"] = islandCnt
+	return report
+
+
+#-------------------------------------------------------
+
+# 3点 a,b,c について、(b-a)と(c-a)の外積のZ成分
+def _cross(a, b, c):
+	return (b[:,0]-a[:,0])*(c[:,1]-a[:,1]) - (b[:,1]-a[:,1])*(c[:,0]-a[:,0])
+
+# 要素ごとのコストcostsの合計がCHUNK_PIXELS程度になるように、idxsを分割する
+def _chunks(idxs, costs):
+	if len(idxs) == 0: return
+	costs = np.asarray(costs, dtype=np.int64)
+	chunkId = (np.cumsum(costs) - costs) // CHUNK_PIXELS
+	bounds = np.flatnonzero(np.diff(chunkId)) + 1
+	for c in np.split(idxs, bounds): yield c
+
+# 指定軸方向に、半径radiusの範囲でfuncによる畳み込みを行う。
+# 範囲を倍々に広げていくので、処理回数は半径の対数に比例する。
+def _slidingReduce(img, radius, axis, func, fill):
+	if radius <= 0: return img
+	n = img.shape[axis]
+	pad = [(0,0), (0,0)]
+	pad[axis] = (radius, radius)
+	a = np.pad(img, pad, constant_values=fill)
+
+	# 幅widthの範囲の結果を、幅2*width、最終的に2*radius+1へと広げる
+	width = 1
+	total = 2*radius + 1
+	while width*2 <= total:
+		a = func(a, np.roll(a, -width, axis=axis))
+		width *= 2
+	if width < total:
+		a = func(a, np.roll(a, -(total - width), axis=axis))
+
+	return np.take(a, np.arange(n), axis=axis)
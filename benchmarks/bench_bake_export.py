@@ -0,0 +1,375 @@
+#
+# ExportBakedFBXのベイク・FBX出力の速度計測用スクリプト。
+# Blenderのバックグラウンドモードで実行する。
+#
+#	blender -b --factory-startup --python benchmarks/bench_bake_export.py -- [オプション]
+#
+# 指定したボーン数・Constraintの種類・アクション数・フレーム数のArmatureを生成して一時フォルダに保存し、
+# bakeAnimとexportFBXを実行して、処理時間・ピークメモリ・FBXのサイズを
+# benchmarks/bench_bake_export_history.json に追記する。前回の同じ構成の結果との比較も出力する。
+# ピークメモリ(tracemalloc)は処理時間に影響するので、--profile-memory を指定した場合のみ、
+# 保存したファイルを開き直して、処理時間とは別の実行で計測する。
+# また、ベイク結果の全フレームのTransformを、benchmarks/golden 以下に保存した結果と比較し、
+# 許容誤差を超えた場合は終了コード1で終了する。保存した結果が無い場合は、今回の結果を保存する。
+#
+# Constraintの種類（--constraints）は、ボーンチェーンごとに順番に割り当てる。
+#	COPY_ROTATION	: チェーンの根元が、コントローラーボーンの回転をコピーする
+#	DAMPED_TRACK	: チェーンの先端が、コントローラーボーンの方を向く
+#	IK				: チェーンの先端から、コントローラーボーンへのIK
+#	DRIVER_LAG		: チェーンの中間のボーンを、コントローラーボーンのワールド回転を読むDriverで回転させる
+#					  （姿勢の反映が1フレーム遅延するので、強制再更新が必要になる）
+#	ACTION			: チェーンの根元が、コントローラーボーンの位置に応じて先頭のアクションの姿勢を再生する
+#					  （ベイク対象のアクションを参照するので、全アクションを書き込み前にサンプリングする必要がある）
+#					  指定した場合は、最後のアクションだけをベイクした結果が、全アクションをベイクした結果と
+#					  一致するかも確認する
+#
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import subprocess
+import tempfile
+import bpy
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "addons"))
+from ExportBakedFBX import bake_proc
+from ExportBakedFBX import bake_profile
+from ExportBakedFBX.bake_parallel import ConsoleReporter
+
+
+# 1チェーンあたりのボーン数
+CHAIN_LEN = 8
+
+# アクションのキーを打つ間隔（フレーム）
+KEY_STEP = 5
+
+CONSTRAINT_TYPES = ("COPY_ROTATION", "DAMPED_TRACK", "IK", "DRIVER_LAG", "ACTION")
+
+HISTORY_PATH = os.path.join(BENCH_DIR, "bench_bake_export_history.json")
+GOLDEN_DIR = os.path.join(BENCH_DIR, "golden")
+
+
+#-------------------------------------------------------
+
+# シーンを空にして、Armatureとスキンメッシュを生成する。戻り値はArmatureオブジェクト
+def buildRig(boneNum, constraintTypes):
+	for obj in list(bpy.data.objects): bpy.data.objects.remove(obj)
+	for act in list(bpy.data.actions): bpy.data.actions.remove(act)
+
+	arma = bpy.data.armatures.new("BenchRig")
+	armaObj = bpy.data.objects.new("BenchRig", arma)
+	bpy.context.scene.collection.objects.link(armaObj)
+	# FBX出力はアクティブなコレクションのみを対象にするので、リグを置くシーン直下をアクティブにする
+	viewLayer = bpy.context.view_layer
+	viewLayer.active_layer_collection = viewLayer.layer_collection
+	viewLayer.objects.active = armaObj
+	bpy.ops.object.mode_set(mode='EDIT')
+
+	# 根元ボーンの下に、CHAIN_LEN本ずつのDeformボーンのチェーンと、チェーンごとのコントローラーを作る
+	root = arma.edit_bones.new("root")
+	root.head = (0, 0, 0)
+	root.tail = (0, 0, 0.1)
+	chainNum = (boneNum + CHAIN_LEN - 1) // CHAIN_LEN
+	for c in range(chainNum):
+		x = c * 0.3
+		parent = root
+		for j in range(min(CHAIN_LEN, boneNum - c*CHAIN_LEN)):
+			bone = arma.edit_bones.new("def_{:03}".format(c*CHAIN_LEN + j))
+			bone.head = (x, 0, 0.1 + j*0.2)
+			bone.tail = (x, 0, 0.1 + (j+1)*0.2)
+			bone.parent = parent
+			bone.use_connect = parent != root
+			parent = bone
+		ctl = arma.edit_bones.new("ctl_{:02}".format(c))
+		ctl.head = (x, -0.5, parent.tail.z)
+		ctl.tail = (x, -0.6, parent.tail.z)
+		ctl.parent = root
+		ctl.use_deform = False
+	bpy.ops.object.mode_set(mode='POSE')
+
+	# チェーンごとにConstraint・Driverを設定する
+	for c in range(chainNum):
+		chain = [i for i in armaObj.pose.bones if i.name.startswith("def_") and int(i.name[4:]) // CHAIN_LEN == c]
+		ctlName = "ctl_{:02}".format(c)
+		cnsType = constraintTypes[c % len(constraintTypes)]
+		if cnsType == "COPY_ROTATION":
+			cns = chain[0].constraints.new('COPY_ROTATION')
+			cns.target = armaObj
+			cns.subtarget = ctlName
+		elif cnsType == "DAMPED_TRACK":
+			cns = chain[-1].constraints.new('DAMPED_TRACK')
+			cns.target = armaObj
+			cns.subtarget = ctlName
+		elif cnsType == "IK":
+			cns = chain[-1].constraints.new('IK')
+			cns.target = armaObj
+			cns.subtarget = ctlName
+			cns.chain_count = len(chain)
+		elif cnsType == "DRIVER_LAG":
+			bone = chain[len(chain)//2]
+			fcu = bone.driver_add("rotation_quaternion", 1)
+			fcu.driver.type = 'SCRIPTED'
+			fcu.driver.expression = "rot * 0.5"
+			var = fcu.driver.variables.new()
+			var.name = "rot"
+			var.type = 'TRANSFORMS'
+			var.targets[0].id = armaObj
+			var.targets[0].bone_target = ctlName
+			var.targets[0].transform_type = 'ROT_X'
+			var.targets[0].transform_space = 'WORLD_SPACE'
+		elif cnsType == "ACTION":
+			# 再生するアクションは、buildActionsで設定する
+			cns = chain[0].constraints.new('ACTION')
+			cns.target = armaObj
+			cns.subtarget = ctlName
+			cns.target_space = 'LOCAL'
+			cns.transform_channel = 'LOCATION_X'
+			cns.min = -0.5
+			cns.max = 0.5
+	bpy.ops.object.mode_set(mode='OBJECT')
+
+	# Deformボーンごとに1頂点を持つ、スキンメッシュ
+	deformBones = [i for i in arma.bones if i.use_deform]
+	mesh = bpy.data.meshes.new("BenchBody")
+	mesh.from_pydata([tuple(i.head_local) for i in deformBones], [], [])
+	meshObj = bpy.data.objects.new("BenchBody", mesh)
+	bpy.context.scene.collection.objects.link(meshObj)
+	meshObj.parent = armaObj
+	for i, bone in enumerate(deformBones):
+		meshObj.vertex_groups.new(name=bone.name).add([i], 1.0, 'REPLACE')
+	meshObj.modifiers.new("Armature", 'ARMATURE').object = armaObj
+	return armaObj
+
+# ランダムなキーを打ったアクションを生成し、それぞれNLAトラックに積む
+def buildActions(armaObj, actionNum, frameNum, seed):
+	rng = np.random.default_rng(seed)
+	armaObj.animation_data_create()
+	frames = np.arange(1, frameNum+1, KEY_STEP, dtype=np.float32)
+	ctlBones = [i.name for i in armaObj.pose.bones if i.name.startswith("ctl_")]
+	defBones = [i.name for i in armaObj.pose.bones if i.name.startswith("def_")]
+	for a in range(actionNum):
+		act = bpy.data.actions.new("act_{:02}".format(a))
+		act.id_root = 'OBJECT'
+		for name in ctlBones:
+			for i in range(3):
+				bake_proc.writeFCurve(
+					act, 'pose.bones["'+name+'"].location', i, frames, rng.normal(0, 0.3, len(frames)) )
+
+		# 半分のDeformボーンだけ回転させ、残りは静止させておく
+		for name in defBones[::2]:
+			bake_proc.writeFCurve(act, 'pose.bones["'+name+'"].rotation_quaternion', 0, frames, np.ones(len(frames)))
+			for i in range(1, 4):
+				bake_proc.writeFCurve(
+					act, 'pose.bones["'+name+'"].rotation_quaternion', i, frames, rng.normal(0, 0.2, len(frames)) )
+		track = armaObj.animation_data.nla_tracks.new()
+		track.name = act.name
+		track.strips.new(act.name, int(frames[0]), act)
+
+	# ACTION Constraintには、先頭のアクションを再生させる
+	if actionNum == 0: return
+	firstAction = bpy.data.actions["act_00"]
+	for bone in armaObj.pose.bones:
+		for cns in bone.constraints:
+			if cns.type != 'ACTION': continue
+			cns.action = firstAction
+			cns.frame_start = 1
+			cns.frame_end = frameNum
+			if hasattr(cns, "action_slot") and cns.action_slot is None and len(firstAction.slots) != 0:
+				cns.action_slot = firstAction.slots[0]
+
+# ベイク結果の全フレームのTransformを、アクションごとに (フレーム数, Deformボーン数, 10) の配列で取得する。
+# キーの無いチャンネルは初期姿勢の値にする
+def collectBaked(actions, keyRanges, deformBoneKeys):
+	ret = {}
+	for action, keyRange in zip(actions, keyRanges):
+		frames = range(keyRange.firstFrame, keyRange.lastFrame+1)
+		vals = np.empty((len(frames), len(deformBoneKeys), 10), dtype=np.float32)
+		vals[:] = bake_proc.REST_VALUES
+		for boneIdx, boneName in enumerate(deformBoneKeys):
+			ch = 0
+			for path, num in bake_proc.BAKE_CHANNELS:
+				for i in range(num):
+					fcu = action.fcurves.find('pose.bones["'+boneName+'"].'+path, index=i)
+					if fcu is not None: vals[:, boneIdx, ch] = [fcu.evaluate(f) for f in frames]
+					ch += 1
+		ret[action.name] = vals
+	return ret
+
+# 保存済みの結果と比較する。戻り値は最大誤差。保存済みの結果が無い場合はNone
+def diffGolden(goldenPath, baked):
+	if not os.path.exists(goldenPath): return None
+	golden = np.load(goldenPath)
+	maxErr = 0.0
+	for name in sorted(set(golden.files) | set(baked)):
+		if name not in golden.files or name not in baked or golden[name].shape != baked[name].shape:
+			print("[Bench] Golden mismatch: action {} is missing or has a different shape".format(name))
+			return float("inf")
+		err = np.abs(golden[name] - baked[name])
+		if err.max(initial=0) > maxErr:
+			maxErr = float(err.max())
+			f, b, c = np.unravel_index(np.argmax(err), err.shape)
+			print("[Bench] Max error so far: {:.6g} (action {}, frame {}, bone {}, channel {})".format(
+				maxErr, name, f, b, c ))
+	return maxErr
+
+# 保存したファイルを開き直して、指定したアクションだけをベイクした結果を取得する
+def bakeIsolated(blendPath, actionName, deformBoneKeys, settings, reporter):
+	bpy.ops.wm.open_mainfile(filepath=blendPath)
+	armaObj = bpy.data.objects["BenchRig"]
+	actions = [i for i in bake_proc.getBakeActions() if i.name == actionName]
+	keyRanges = [bake_proc.ActionKeyRange(i) for i in actions]
+	if not bake_proc.bakeAnim(reporter, settings, armaObj, actions):
+		raise RuntimeError("Bake failed")
+	return collectBaked(actions, keyRanges, deformBoneKeys)[actionName]
+
+def gitRevision():
+	try:
+		return subprocess.run(
+			["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+			capture_output=True, text=True, check=True ).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+# プロセスの最大常駐メモリ(byte)。取得できない環境ではNone
+def maxRss():
+	try:
+		import resource
+	except ImportError:
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return rss if sys.platform == "darwin" else rss * 1024
+
+def parseArgs():
+	argv = sys.argv[sys.argv.index("--")+1:] if "--" in sys.argv else []
+	parser = argparse.ArgumentParser(prog="bench_bake_export")
+	parser.add_argument("--bones", type=int, default=64, help="number of deform bones")
+	parser.add_argument("--constraints", default="COPY_ROTATION,IK,DRIVER_LAG,ACTION",
+		help="comma separated constraint types assigned to chains: " + ",".join(CONSTRAINT_TYPES))
+	parser.add_argument("--actions", type=int, default=4)
+	parser.add_argument("--frames", type=int, default=120)
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--workers", type=int, default=1)
+	parser.add_argument("--refresh-mode", default="AUTO", choices=("AUTO", "ALWAYS"))
+	parser.add_argument("--restrict-sampling", action="store_true")
+	parser.add_argument("--skip-static", action="store_true")
+	parser.add_argument("--reduce-keys", action="store_true")
+	parser.add_argument("--profile-memory", action="store_true", help="measure peak Python memory in a separate run")
+	parser.add_argument("--tolerance", type=float, default=0.0001, help="allowed error against the golden result")
+	parser.add_argument("--update-golden", action="store_true")
+	parser.add_argument("--history", default=HISTORY_PATH)
+	args = parser.parse_args(argv)
+	args.constraints = [i for i in args.constraints.split(",") if i]
+	for i in args.constraints:
+		if i not in CONSTRAINT_TYPES: parser.error("unknown constraint type: " + i)
+	return args
+
+
+if __name__ == "__main__":
+	args = parseArgs()
+	config = {
+		"bones": args.bones, "constraints": args.constraints,
+		"actions": args.actions, "frames": args.frames, "seed": args.seed,
+	}
+	settingsDict = {
+		"workerCount": args.workers, "refreshMode": args.refresh_mode,
+		"restrictSampling": args.restrict_sampling, "skipStatic": args.skip_static,
+		"reduceKeys": args.reduce_keys,
+	}
+	configTag = "b{}_a{}_f{}_s{}_{}".format(
+		args.bones, args.actions, args.frames, args.seed, "-".join(args.constraints) )
+
+	# リグを生成して、一時フォルダに保存する（並列ベイクのワーカーは保存済みファイルを開く）
+	workDir = tempfile.mkdtemp(prefix="bench_bake_")
+	blendPath = os.path.join(workDir, "bench_rig.blend")
+	fbxPath = os.path.join(workDir, "bench_rig.fbx")
+	beginTime = time.perf_counter()
+	armaObj = buildRig(args.bones, args.constraints)
+	buildActions(armaObj, args.actions, args.frames, args.seed)
+	bpy.ops.wm.save_as_mainfile(filepath=blendPath)
+	print("[Bench] Built rig in {:.2f}s: {}".format(time.perf_counter() - beginTime, blendPath))
+
+	deformBoneKeys = bake_proc.getDeformBoneKeys(armaObj)
+	actions = bake_proc.getBakeActions()
+	actionNames = [i.name for i in actions]
+	keyRanges = [bake_proc.ActionKeyRange(i) for i in actions]
+	settings = bake_proc.BakeSettings(**settingsDict)
+	reporter = ConsoleReporter()
+
+	with bake_profile.profiling(True) as profiler:
+		with bake_profile.phase("bake"):
+			if not bake_proc.bakeAnim(reporter, settings, armaObj, actions):
+				raise RuntimeError("Bake failed")
+		with bake_profile.phase("collect"):
+			baked = collectBaked(actions, keyRanges, deformBoneKeys)
+		with bake_profile.phase("exportFBX"):
+			bake_proc.exportFBX(reporter, fbxPath, 'ActiveNLA', armaObj, settings)
+
+	fbxBytes = os.path.getsize(fbxPath)
+
+	# ピークメモリは、tracemallocで処理時間が遅くならないように別の実行で計測する
+	peakMemory = None
+	if args.profile_memory:
+		bpy.ops.wm.open_mainfile(filepath=blendPath)
+		armaObj = bpy.data.objects["BenchRig"]
+		with bake_profile.profiling(True, traceMemory=True) as memProfiler:
+			if not bake_proc.bakeAnim(reporter, settings, armaObj, bake_proc.getBakeActions()):
+				raise RuntimeError("Bake failed")
+			bake_proc.exportFBX(reporter, fbxPath, 'ActiveNLA', armaObj, settings)
+		peakMemory = memProfiler.peakMemory
+
+	# 他のアクションのベイク結果が、ACTION Constraintを通して混ざっていないか確認する
+	isolationErr = None
+	if "ACTION" in args.constraints and 1 < len(actionNames):
+		isolated = bakeIsolated(blendPath, actionNames[-1], deformBoneKeys, settings, reporter)
+		isolationErr = float(np.abs(isolated - baked[actionNames[-1]]).max(initial=0))
+		print("[Bench] Isolated bake of {} differs by {:.6g}".format(actionNames[-1], isolationErr))
+
+	# 保存済みの結果との比較
+	goldenPath = os.path.join(GOLDEN_DIR, "bench_bake_export_" + configTag + ".npz")
+	maxErr = None if args.update_golden else diffGolden(goldenPath, baked)
+	if maxErr is None:
+		os.makedirs(GOLDEN_DIR, exist_ok=True)
+		np.savez_compressed(goldenPath, **baked)
+		print("[Bench] Golden saved: " + goldenPath)
+
+	record = {
+		"date": datetime.datetime.now().isoformat(timespec="seconds"),
+		"revision": gitRevision(),
+		"blender": bpy.app.version_string,
+		"config": config,
+		"settings": settingsDict,
+		"bakeSeconds": profiler.totals["total/bake"][0],
+		"exportSeconds": profiler.totals["total/exportFBX"][0],
+		"peakMemoryPython": peakMemory,
+		"maxRss": maxRss(),
+		"fbxBytes": fbxBytes,
+		"goldenMaxError": maxErr,
+		"isolationMaxError": isolationErr,
+	}
+
+	# 前回の同じ構成の結果と比較して、履歴に追記する
+	history = []
+	if os.path.exists(args.history):
+		with open(args.history, encoding="utf-8") as f: history = json.load(f)
+	prev = [i for i in history if i["config"] == config and i["settings"] == settingsDict]
+	for key in ("bakeSeconds", "exportSeconds", "peakMemoryPython", "fbxBytes"):
+		if record[key] is None: continue
+		line = "[Bench] {:<18} {:>14.3f}".format(key, record[key])
+		if prev and prev[-1].get(key):
+			line += " ({:+.1f}% from {})".format(100 * (record[key] / prev[-1][key] - 1), prev[-1]["revision"])
+		print(line)
+	history.append(record)
+	with open(args.history, "w", encoding="utf-8") as f: json.dump(history, f, indent="\t")
+
+	if maxErr is not None and args.tolerance < maxErr:
+		print("[Bench] FAILED: baked transforms differ from golden by {:.6g}".format(maxErr))
+		sys.exit(1)
+	if isolationErr is not None and args.tolerance < isolationErr:
+		print("[Bench] FAILED: baking all actions differs from baking {} alone by {:.6g}".format(
+			actionNames[-1], isolationErr ))
+		sys.exit(1)
@@ -0,0 +1,95 @@
+#
+# ExportBakedFBXのキーフレーム書き込みの速度計測用スクリプト。
+# Blenderのバックグラウンドモードで実行する。
+#
+#	blender -b --factory-startup --python benchmarks/bench_fcurve_write.py -- [ボーン数] [フレーム数]
+#
+# ボーンごとに10チャンネル（位置3・四元数4・スケール3）の全フレームのキーを、
+# 以前の1キーずつ設定する方法と、foreach_setでまとめて設定する方法で書き込んで比較する。
+#
+
+import os
+import sys
+import time
+import bpy
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "addons"))
+from ExportBakedFBX import bake_proc
+
+
+CHANNELS = (("location", 3), ("rotation_quaternion", 4), ("scale", 3))
+
+# 以前の実装と同じ、1キーずつRNAのプロパティを設定する書き込み
+def procPerKey(action, boneNames, frames, vals):
+	for boneIdx, boneName in enumerate(boneNames):
+		c = 0
+		for path, num in CHANNELS:
+			fcs = []
+			for i in range(num):
+				fc = action.fcurves.new('pose.bones["'+boneName+'"].'+path, index=i)
+				fc.keyframe_points.add(len(frames))
+				fcs.append(fc)
+			for frameIdx, frameT in enumerate(frames.tolist()):
+				for idx, fc in enumerate(fcs):
+					pnt = fc.keyframe_points[frameIdx]
+					pnt.co = frameT, vals[frameIdx, boneIdx, c+idx]
+					pnt.interpolation = 'BEZIER'
+					pnt.handle_left_type = 'AUTO_CLAMPED'
+					pnt.handle_right_type = 'AUTO_CLAMPED'
+			for fc in fcs: fc.update()
+			c += num
+
+# foreach_setでまとめて設定する書き込み
+def procBulk(action, boneNames, frames, vals):
+	for boneIdx, boneName in enumerate(boneNames):
+		c = 0
+		for path, num in CHANNELS:
+			for i in range(num):
+				bake_proc.writeFCurve(
+					action, 'pose.bones["'+boneName+'"].'+path, i, frames, vals[:,boneIdx,c+i] )
+			c += num
+
+# F-Curveの書き込み先。
+# Blender 5.0以降はAction.fcurvesが無いので、スロットとレイヤーを作ってそのチャンネルバッグに書き込む。
+# チャンネルバッグもAction.fcurvesと同じfcurvesを持つので、書き込み処理にはそのまま渡せる
+def fcurveOwner(action):
+	if hasattr(action, "fcurves"): return action
+	slot = action.slots.new('OBJECT', "bench")
+	strip = action.layers.new("bench").strips.new(type='KEYFRAME')
+	return strip.channelbag(slot, ensure=True)
+
+def measure(func, boneNames, frames, vals):
+	action = bpy.data.actions.new("bench")
+	owner = fcurveOwner(action)
+	t = time.perf_counter()
+	func(owner, boneNames, frames, vals)
+	t = time.perf_counter() - t
+
+	# 書き込んだ結果を取り出しておく
+	ret = []
+	for fc in owner.fcurves:
+		co = np.empty(len(fc.keyframe_points)*2, dtype=np.float32)
+		fc.keyframe_points.foreach_get("co", co)
+		ret.append(co)
+	bpy.data.actions.remove(action)
+	return t, ret
+
+
+if __name__ == "__main__":
+	argv = sys.argv[sys.argv.index("--")+1:] if "--" in sys.argv else []
+	boneNum = int(argv[0]) if 0 < len(argv) else 100
+	frameNum = int(argv[1]) if 1 < len(argv) else 1000
+
+	rng = np.random.default_rng(0)
+	boneNames = ["bone{:03}".format(i) for i in range(boneNum)]
+	frames = np.arange(1, frameNum+1, dtype=np.float32)
+	vals = rng.standard_normal((frameNum, boneNum, 10)).astype(np.float32)
+
+	tBulk, retBulk = measure(procBulk, boneNames, frames, vals)
+	tPerKey, retPerKey = measure(procPerKey, boneNames, frames, vals)
+	assert all(np.array_equal(a, b) for a, b in zip(retBulk, retPerKey))
+
+	print("bones: {}, frames: {}, keys: {}".format(boneNum, frameNum, boneNum*frameNum*10))
+	print("per key: {:.3f}s".format(tPerKey))
+	print("bulk   : {:.3f}s ({:.1f}x)".format(tBulk, tPerKey / tBulk))
@@ -0,0 +1,69 @@
+#
+# Align・Straight Relaxで使用する、UV座標の重複除去の速度計測用スクリプト。
+# Blenderを使わず、uv_arrayモジュールだけを読み込んで実行する。
+#
+#	python benchmarks/bench_uv_dedup.py
+#
+# 格子状に並んだ四角形の面を作り、その全Loop（1頂点あたり最大4Loop）のUVについて
+# 重複を除いたリストと、元UVからそのインデックスへのマップを作るのにかかる時間を計測する。
+#
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "addons", "IzTools2"))
+from uv_array import dedupUVs
+
+
+# Loop数がおよそuvNumになる、格子状の四角形面の全LoopのUVを作る
+def makeGrid(uvNum):
+	n = max(int(np.sqrt(uvNum / 4)), 1)
+	x, y = np.meshgrid(np.arange(n), np.arange(n))
+	x = x.reshape(-1)
+	y = y.reshape(-1)
+	uvs = np.stack((
+		np.stack((x, y), 1),
+		np.stack((x+1, y), 1),
+		np.stack((x+1, y+1), 1),
+		np.stack((x, y+1), 1),
+	), 1).reshape(-1, 2) / n
+	return uvs
+
+# 以前の実装と同じ、リストの線形探索による重複除去
+def procLinear(uvs):
+	uvLst = [tuple(i) for i in uvs.tolist()]
+	dctUVs = []
+	for i in uvLst:
+		if (not i in dctUVs): dctUVs.append(i)
+	src2dctMap = []
+	for i in uvLst:
+		src2dctMap.append( next(idx for idx,j in enumerate(dctUVs) if (j==i)) )
+	return dctUVs, src2dctMap
+
+# 量子化キーでまとめる重複除去
+def procUnique(uvs):
+	return dedupUVs(uvs)
+
+def measure(func, *args):
+	t = time.perf_counter()
+	ret = func(*args)
+	return time.perf_counter() - t, ret
+
+
+if __name__ == "__main__":
+	# 線形探索版は、これより大きいと現実的な時間で終わらないので計測しない
+	linearLimit = 10000
+
+	print("{:>8} {:>8} {:>12} {:>12}".format("uvs", "unique", "linear[s]", "unique[s]"))
+	for uvNum in (1000, 10000, 100000):
+		uvs = makeGrid(uvNum)
+		tUnique, (dct, inv) = measure(procUnique, uvs)
+		tLinear = "skipped"
+		if uvNum <= linearLimit:
+			t, (dctL, invL) = measure(procLinear, uvs)
+			assert np.array_equal(dct, np.array(dctL))
+			assert inv.tolist() == invL
+			tLinear = "{:.4f}".format(t)
+		print("{:>8} {:>8} {:>12} {:>12.4f}".format(len(uvs), len(dct), tLinear, tUnique))
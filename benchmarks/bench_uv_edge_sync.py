@@ -0,0 +1,77 @@
+#
+# EdgeSyncのUV変換テーブルの速度計測用スクリプト。
+# Blenderを使わず、uv_arrayモジュールだけを読み込んで実行する。
+#
+#	python benchmarks/bench_uv_edge_sync.py
+#
+# 横一列に並んだ四角形の帯を2本作り、その境界の継ぎ目を同期するときの
+# 変換テーブルの構築と、全Loopへの適用にかかる時間を計測する。
+#
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "addons", "IzTools2"))
+from uv_array import UVConvMap
+
+
+# 継ぎ目エッジ数edgeNumの帯を2本作ったときの、全LoopのUVと、変換元・変換先UVの組を作る
+def makeSeam(edgeNum):
+	xs = np.arange(edgeNum+1, dtype=np.float64) / edgeNum
+	x0 = xs[:-1]
+	x1 = xs[1:]
+
+	# 帯1枚あたり四角形edgeNum個。各四角形の4LoopのUV
+	def strip(y0, y1):
+		return np.stack((
+			np.stack((x0, np.full_like(x0,y0)), 1),
+			np.stack((x1, np.full_like(x0,y0)), 1),
+			np.stack((x1, np.full_like(x0,y1)), 1),
+			np.stack((x0, np.full_like(x0,y1)), 1),
+		), 1).reshape(-1, 2)
+	uvs = np.concatenate((strip(0.0, 0.1), strip(0.5, 0.6)))
+
+	# 変換元は上の帯の下端、変換先は下の帯の上端
+	src = np.stack((xs, np.full_like(xs, 0.5)), 1)
+	dst = np.stack((xs, np.full_like(xs, 0.1)), 1)
+	return uvs, src, dst
+
+# 以前の実装と同じ、リストを線形探索する変換テーブル
+def procLinear(uvs, src, dst):
+	uvConvMap = []
+	def findConvMap(uv):
+		for i in uvConvMap:
+			if uv == i[0]: return i
+		return None
+	for s, d in zip(src.tolist(), dst.tolist()):
+		if not findConvMap(s): uvConvMap.append([s, d])
+	return [(idx, a[1]) for idx, uv in enumerate(uvs.tolist()) if (a := findConvMap(uv))]
+
+# ハッシュ引きする変換テーブル
+def procHash(uvs, src, dst):
+	uvConvMap = UVConvMap(0.000001)
+	for s, d in zip(src.tolist(), dst.tolist()): uvConvMap.add(s, d)
+	return uvConvMap.remap(uvs)
+
+def measure(func, *args):
+	t = time.perf_counter()
+	ret = func(*args)
+	return time.perf_counter() - t, ret
+
+
+if __name__ == "__main__":
+	# 線形探索版は、これより大きいと現実的な時間で終わらないので計測しない
+	linearLimit = 1000
+
+	print("{:>8} {:>10} {:>12} {:>12}".format("edges", "loops", "linear[s]", "hash[s]"))
+	for edgeNum in (10, 1000, 100000):
+		uvs, src, dst = makeSeam(edgeNum)
+		tHash, (idxs, _) = measure(procHash, uvs, src, dst)
+		tLinear = "skipped"
+		if edgeNum <= linearLimit:
+			t, ret = measure(procLinear, uvs, src, dst)
+			assert [i for i,_ in ret] == idxs.tolist()
+			tLinear = "{:.4f}".format(t)
+		print("{:>8} {:>10} {:>12} {:>12.4f}".format(edgeNum, len(uvs), tLinear, tHash))
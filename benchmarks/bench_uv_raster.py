@@ -0,0 +1,72 @@
+#
+# Island Previewの、CPU版ラスタライザの速度計測用スクリプト。
+# Blenderを使わず、uv_rasterモジュールだけを読み込んで実行する。
+#
+#	python benchmarks/bench_uv_raster.py
+#
+# 次の2通りの三角形群について、三角形の塗りつぶし（rasterizeTriangles）と、
+# 外周線を含むアイランド画像の作成（rasterizeIslands）にかかる時間を計測する。
+#	grid		: UV空間全体を覆う格子状の四角形を、2つずつの三角形に分割したもの
+#	scattered	: 1ピクセル程度の大きさの三角形を、UV空間にランダムに散らばらせたもの
+#
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "addons", "IzTools2"))
+import uv_raster
+from uv_array import UVSnapshot
+
+
+# 一辺n個の四角形の格子を作る。戻り値は (UVスナップショット)
+def makeGrid(n):
+	x, y = np.meshgrid(np.arange(n), np.arange(n))
+	x = x.reshape(-1)
+	y = y.reshape(-1)
+	uvs = np.stack((
+		np.stack((x, y), 1),
+		np.stack((x+1, y), 1),
+		np.stack((x+1, y+1), 1),
+		np.stack((x, y+1), 1),
+	), 1).reshape(-1, 2) / n
+	return _quadSnapshot(uvs)
+
+# triNum個の三角形を、UV空間にランダムに散らばらせる。大きさはおよそ1ピクセル
+def makeScattered(triNum, size):
+	rng = np.random.default_rng(0)
+	ctr = rng.random((triNum, 1, 2))
+	ofs = (rng.random((triNum, 3, 2)) - 0.5) * 2 / size
+	uvs = (ctr + ofs).reshape(-1, 2)
+	faceTotal = np.full(triNum, 3)
+	return UVSnapshot(
+		uvs, np.zeros(len(uvs), dtype=bool), np.arange(len(uvs)), np.arange(len(uvs)),
+		np.zeros(len(uvs), dtype=bool), np.arange(triNum) * 3, faceTotal,
+		np.zeros((len(uvs), 3)), [0, len(uvs)] )
+
+def _quadSnapshot(uvs):
+	faceCnt = len(uvs) // 4
+	return UVSnapshot(
+		uvs, np.zeros(len(uvs), dtype=bool), np.arange(len(uvs)), np.arange(len(uvs)),
+		np.zeros(len(uvs), dtype=bool), np.arange(faceCnt) * 4, np.full(faceCnt, 4),
+		np.zeros((len(uvs), 3)), [0, len(uvs)] )
+
+def measure(func, *args):
+	t = time.perf_counter()
+	ret = func(*args)
+	return time.perf_counter() - t, ret
+
+
+if __name__ == "__main__":
+	print("{:>10} {:>10} {:>6} {:>12} {:>12}".format("case", "tris", "size", "tris[s]", "islands[s]"))
+	for name, snap, size in (
+		("grid", makeGrid(708), 4096),
+		("scattered", makeScattered(1000000, 4096), 4096),
+	):
+		tris = snap.triangles()
+		lines = snap.faceLines()
+		img = np.full((size, size), -1, dtype=np.int64)
+		tTri, _ = measure(uv_raster.rasterizeTriangles, snap.uv, tris, np.zeros(len(tris), dtype=np.int64), img)
+		tAll, _ = measure(uv_raster.rasterizeIslands, snap.uv, tris, lines, size)
+		print("{:>10} {:>10} {:>6} {:>12.2f} {:>12.2f}".format(name, len(tris), size, tTri, tAll))
@@ -0,0 +1,10 @@
+#
+# テスト用の共通設定。
+# bpyに依存しないモジュールを、アドオンのフォルダから直接importできるようにする。
+#
+
+import os
+import sys
+
+for name in ("IzTools2", "ExportBakedFBX"):
+	sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "addons", name))
@@ -0,0 +1,40 @@
+#
+# batch_exportモジュールのテスト。
+#
+
+import os
+import time
+import stat
+
+import pytest
+
+import batch_export
+
+
+#-------------------------------------------------------
+
+# タイムアウトした子プロセスを終了させる時に、子プロセスが起動したワーカーも残さないこと
+@pytest.mark.skipif(os.name == "nt", reason="uses a POSIX shell script as the fake Blender")
+def test_runChild_timeoutKillsWorkers(tmp_path):
+	pidPath = tmp_path / "worker.pid"
+	blender = tmp_path / "blender"
+	blender.write_text("#!/bin/sh\nsleep 60 &\necho $! > {}\nwait\n".format(pidPath))
+	blender.chmod(blender.stat().st_mode | stat.S_IXUSR)
+	job = {
+		"blend": str(tmp_path / "rig.blend"),
+		"fbx": str(tmp_path / "rig.fbx"),
+		"log": str(tmp_path / "rig.log"),
+		"autoexec": False,
+	}
+	assert batch_export._runChild(str(blender), job, 0, 1.0) == "TIMEOUT"
+
+	workerPid = int(pidPath.read_text())
+	for _ in range(50):
+		try:
+			os.kill(workerPid, 0)
+		except ProcessLookupError:
+			break
+		time.sleep(0.1)
+	else:
+		os.kill(workerPid, 9)
+		pytest.fail("worker process was left running")
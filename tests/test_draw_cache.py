@@ -0,0 +1,68 @@
+#
+# draw_cacheモジュールのテスト。
+#
+
+import draw_cache
+from draw_cache import DrawCache
+
+
+OBJ = (("OBJECT", "Cube"), ("MESH", "Cube"))
+
+
+# 描画1回分。Edge Syncの描画ハンドラと同じ手順でキャッシュを引く
+def redraw(cache, build, paramKey=0):
+	value = cache.fetch("Cube", paramKey, OBJ, build)
+	cache.endDraw(["Cube"])
+	return value
+
+#-------------------------------------------------------
+
+# 編集の無い再描画（表示の移動・拡大縮小・カーソル移動）では作り直さないこと
+def test_redrawWithoutEdit():
+	cache = DrawCache()
+	build = lambda: object()
+	first = redraw(cache, build)
+	for _ in range(5):
+		assert redraw(cache, build) is first
+	assert cache.buildCount == 1
+
+# 作り直しの際にアドオン自身が引き起こした更新は、次の描画で作り直す理由にならないこと
+def test_selfUpdateIsIgnored():
+	cache = DrawCache()
+	def build():
+		draw_cache.markSelfUpdate(OBJ)		# getUVSnapshot の update_from_editmode 相当
+		return object()
+	redraw(cache, build)
+	cache.onDepsgraphUpdate(OBJ)
+	for _ in range(5):
+		redraw(cache, build)
+	assert cache.buildCount == 1
+
+# ユーザーの編集と、アドオンがUVを書き換えた場合は作り直すこと
+def test_editRebuilds():
+	cache = DrawCache()
+	build = lambda: object()
+	redraw(cache, build)
+
+	cache.onDepsgraphUpdate(OBJ)
+	redraw(cache, build)
+	assert cache.buildCount == 2
+
+	draw_cache.markSelfUpdate(OBJ)
+	draw_cache.markEdited(OBJ)			# applyUVSnapshot 相当
+	cache.onDepsgraphUpdate(OBJ)
+	redraw(cache, build)
+	assert cache.buildCount == 3
+
+# 関係のないIDの更新・パラメータの変更
+def test_otherUpdatesAndParams():
+	cache = DrawCache()
+	build = lambda: object()
+	redraw(cache, build)
+
+	cache.onDepsgraphUpdate([("OBJECT", "Light")])
+	redraw(cache, build)
+	assert cache.buildCount == 1
+
+	redraw(cache, build, paramKey=1)
+	assert cache.buildCount == 2
@@ -0,0 +1,26 @@
+#
+# driver_exprモジュールのテスト。
+#
+
+import driver_expr
+
+
+#-------------------------------------------------------
+
+# 現在のフレーム番号を参照する式を検出すること
+def test_usesFrame():
+	assert driver_expr.usesFrame("sin(frame/10)", ["var"])
+	assert driver_expr.usesFrame("var * 2 + frame", ["var"])
+	assert driver_expr.usesFrame("frame")
+	assert not driver_expr.usesFrame("var * 2", ["var"])
+	assert not driver_expr.usesFrame("frames + frame_ofs", ["frames", "frame_ofs"])
+	assert not driver_expr.usesFrame("1.0")
+
+# frameと同名の変数がある場合は、その変数を参照しているとみなすこと
+def test_usesFrame_shadowedByVariable():
+	assert not driver_expr.usesFrame("sin(frame/10)", ["frame"])
+
+# 解析できない式は、参照しているものとして扱うこと
+def test_usesFrame_unparsable():
+	assert driver_expr.usesFrame("var *", ["var"])
+	assert driver_expr.usesFrame("var\0", ["var"])
@@ -0,0 +1,53 @@
+#
+# key_reduceモジュールのテスト。
+#
+
+import numpy as np
+
+import key_reduce
+
+
+#-------------------------------------------------------
+
+# 間引いたキーを直線補間した値が、全フレームで許容誤差内に収まること
+def test_reduceKeys_withinTolerance():
+	rng = np.random.default_rng(0)
+	for _ in range(50):
+		frameNum = int(rng.integers(2, 200))
+		vals = np.cumsum(rng.normal(0, 0.01, (frameNum, 4)), axis=0)
+		vals[:, 1] = 0.5		# 値が一定のチャンネル
+		tol = float(rng.choice((1e-4, 1e-3, 1e-2)))
+		keep = key_reduce.reduceKeys(vals, tol)
+		assert keep[0].all() and keep[-1].all()
+		assert keep[:, 1].sum() == min(frameNum, 2)
+		assert (key_reduce.reducedError(vals, keep) <= tol * (1 + 1e-9)).all()
+
+# 直線上にハンドルを置いたBEZIER補間は、直線補間と一致すること
+def test_bezierValues_straightHandles():
+	rng = np.random.default_rng(1)
+	x = np.cumsum(rng.integers(1, 6, 10)).astype(np.float64)
+	y = rng.normal(0, 1, 10)
+	co = np.stack((x, y), axis=1)
+	d = np.diff(co, axis=0) / 3
+	handleRight = co.copy()
+	handleRight[:-1] += d
+	handleLeft = co.copy()
+	handleLeft[1:] -= d
+	frames = np.arange(x[0] - 3, x[-1] + 3)
+	vals = key_reduce.bezierValues(co, handleLeft, handleRight, frames)
+	assert np.allclose(vals, np.interp(frames, x, y), atol=1e-9)
+
+# 3次式のベジェ曲線の値と一致すること
+def test_bezierValues_cubic():
+	co = np.array([[0.0, 0.0], [3.0, 1.0]])
+	handleRight = np.array([[1.0, 1.0], [4.0, 1.0]])
+	handleLeft = np.array([[-1.0, 0.0], [2.0, -1.0]])
+	t = np.linspace(0, 1, 7)
+	expected = 3*(1-t)**2*t * 1.0 + 3*(1-t)*t*t * -1.0 + t**3
+	# X座標は t*3 になるので、フレームtで評価した値は t/3 のときの値
+	assert np.allclose(key_reduce.bezierValues(co, handleLeft, handleRight, t*3), expected, atol=1e-9)
+
+# キーが1つの場合は、全フレームでその値になること
+def test_bezierValues_singleKey():
+	co = np.array([[5.0, 2.0]])
+	assert np.array_equal(key_reduce.bezierValues(co, co, co, np.arange(10.0)), np.full(10, 2.0))
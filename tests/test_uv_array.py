@@ -0,0 +1,178 @@
+#
+# uv_arrayモジュールのテスト。
+#
+#	python -m pytest tests
+#
+
+import numpy as np
+
+from uv_array import UVSnapshot, UVConvMap, quantizeUVs, packRows, straightRelax
+
+
+#-------------------------------------------------------
+
+# 登録したUVが、線形探索と同じものに変換されること
+def test_uvConvMap_matchesLinearSearch():
+	rng = np.random.default_rng(0)
+	eps = 0.001
+	src = np.round(rng.random((200, 2)), 3)
+	dst = rng.random((200, 2))
+	uvs = np.concatenate((src, np.round(rng.random((500, 2)), 3)))
+
+	uvConvMap = UVConvMap(eps)
+	linear = {}
+	for s, d in zip(src.tolist(), dst.tolist()):
+		uvConvMap.add(s, d)
+		linear.setdefault(tuple(np.rint(np.array(s) / eps).astype(np.int64).tolist()), d)
+
+	idxs, convUVs = uvConvMap.remap(uvs)
+	expected = [
+		(i, linear[k]) for i, k in enumerate(map(tuple, np.rint(uvs / eps).astype(np.int64).tolist()))
+		if k in linear ]
+	assert idxs.tolist() == [i for i, _ in expected]
+	assert np.array_equal(convUVs, np.array([d for _, d in expected]))
+	for i, uv in enumerate(uvs.tolist()):
+		found = uvConvMap.find(uv)
+		assert (found is None) == (i not in set(idxs.tolist()))
+
+# 32bitを超えるバケット番号でも、別の座標と衝突しないこと
+def test_uvConvMap_largeBucket():
+	eps = 0.0000001
+	big = (1 << 32) * eps
+	uvConvMap = UVConvMap(eps)
+	uvConvMap.add((0.0, 0.0), (1.0, 1.0))
+	uvConvMap.add((big, 0.5), (2.0, 2.0))
+
+	idxs, convUVs = uvConvMap.remap(np.array([[big, 0.0], [0.0, 0.0], [big, 0.5], [0.0, 0.5]]))
+	assert idxs.tolist() == [1, 2]
+	assert convUVs.tolist() == [[1.0, 1.0], [2.0, 2.0]]
+	assert uvConvMap.find((big, 0.0)) is None
+
+# 巨大な座標でも、int64に収まる範囲に丸められること
+def test_quantizeUVs_clamp():
+	q = quantizeUVs(np.array([[1e30, -1e30]]), 0.0000001)
+	assert q.dtype == np.int64
+	assert q[0,0] > 0 and q[0,1] < 0
+
+# 値の範囲がint64に詰められないほど広くても、同じ行だけが同じ番号になること
+def test_packRows_wideRange():
+	lim = 1 << 62
+	rows = np.array([[-lim, -lim], [lim, lim], [-lim, -lim], [0, lim], [lim, 0]])
+	ids = packRows(rows)
+	assert ids[0] == ids[2]
+	assert len(set(ids.tolist())) == 4
+
+
+#-------------------------------------------------------
+
+# ランダムなメッシュのUVスナップショットを作る。
+# 頂点ごとにUVを1～2通り持たせ、面ごとにどちらかを使うことで、UVの分かれ目を作る
+def _randomSnapshot(rng):
+	vertCnt = int(rng.integers(4, 12))
+	faceCnt = int(rng.integers(1, 10))
+	vertUVs = np.round(rng.random((vertCnt, 2, 2)) * 8) / 8
+	vertCo = rng.random((vertCnt, 3))
+
+	faceTotal = rng.integers(3, 5, faceCnt)
+	loopVert = np.concatenate([rng.choice(vertCnt, n, replace=False) for n in faceTotal])
+	loopFace = np.repeat(np.arange(faceCnt), faceTotal)
+	uv = vertUVs[loopVert, (loopFace + loopVert) % 2 * (rng.random(len(loopVert)) < 0.5)]
+	select = rng.random(len(loopVert)) < 0.6
+	return UVSnapshot(
+		uv, select, loopVert, np.arange(len(loopVert)), np.zeros(len(loopVert), dtype=bool),
+		np.cumsum(faceTotal) - faceTotal, faceTotal, vertCo, [0, len(loopVert)] )
+
+# 選択中UVのチェーン分けが、Loop同士を1つずつ辿って連結したものと一致すること
+def test_selectedChains_matchesBruteForce():
+	rng = np.random.default_rng(3)
+	for _ in range(300):
+		snap = _randomSnapshot(rng)
+		sel = snap.selectedLoops().tolist()
+		nxt = snap.loopNext().tolist()
+
+		# 同じ頂点で同じUV座標のLoop同士、および選択中UVエッジの両端のLoop同士を連結する
+		links = {i: set() for i in sel}
+		for i in sel:
+			for j in sel:
+				if snap.loopVert[i] == snap.loopVert[j] and np.all(snap.uv[i] == snap.uv[j]): links[i].add(j)
+			if snap.select[nxt[i]]:
+				links[i].add(nxt[i])
+				links[nxt[i]].add(i)
+		expected = set()
+		remain = set(sel)
+		while remain:
+			stack = [remain.pop()]
+			chain = set(stack)
+			while stack:
+				for j in links[stack.pop()] - chain:
+					chain.add(j)
+					stack.append(j)
+			remain -= chain
+			expected.add(frozenset(chain))
+
+		assert {frozenset(i.tolist()) for i in snap.selectedChains()} == expected
+
+# 書き換えたUVのうち、値が変わったLoopのみが変更Loopとして列挙されること
+def test_changedLoops_onlyModified():
+	rng = np.random.default_rng(4)
+	snap = _randomSnapshot(rng)
+	loops = np.arange(snap.loopCount)
+	assert len(snap.changedLoops(loops)) == 0
+
+	moved = loops[::3]
+	snap.uv[moved] += 0.5
+	snap.uv[loops[1::3]] = snap.uv[loops[1::3]].copy()		# 同じ値の書き込み
+	assert np.array_equal(snap.changedLoops(loops), moved)
+	assert np.array_equal(snap.changedLoops(loops[::2]), np.intersect1d(moved, loops[::2]))
+
+# Straight Relaxの結果が、全ての点の組を調べて方向を求める元の実装と一致すること
+def test_straightRelax_matchesBruteForce():
+	rng = np.random.default_rng(4)
+	checked = 0
+	for _ in range(300):
+		n = int(rng.integers(2, 12))
+		# おおよそ一直線に並んだ点群にする
+		uvs = rng.random(2) + rng.random((n, 1)) * (rng.random(2) - 0.5) + rng.random((n, 2)) * 0.05
+		cos = rng.random((n, 3))
+		dup = rng.integers(0, n, int(rng.integers(0, 4)))
+		uvs = np.concatenate((uvs, uvs[dup]))
+		cos = np.concatenate((cos, cos[dup]))
+
+		# 重複を除いた (UV, 頂点座標) の組の、最初に出現した順のリスト
+		dct = []
+		for uv, co in zip(uvs.tolist(), cos.tolist()):
+			if (uv, co) not in dct: dct.append((uv, co))
+		if len(dct) <= 1:
+			assert straightRelax(uvs, cos) is None
+			continue
+
+		# 2点を直径とする円が他の全ての点を内包する、最初の2点の方向
+		pts = np.array([i[0] for i in dct])
+		dir = None
+		for i in range(len(pts)):
+			for j in range(i+1, len(pts)):
+				ctr = (pts[i] + pts[j]) / 2
+				rSqr = np.sum((pts[i] - ctr) ** 2)
+				if all(
+					np.sum((pts[k] - ctr) ** 2) <= rSqr for k in range(len(pts))
+					if not (np.all(pts[k] == pts[i]) or np.all(pts[k] == pts[j])) ):
+					dir = (pts[i] - pts[j]) / np.linalg.norm(pts[i] - pts[j])
+					break
+			if dir is not None: break
+		if dir is None: continue		# 主成分方向を使う場合は対象外
+
+		# 整列方向に沿ってソートし、頂点間距離の比率を維持して並べ直す
+		order = sorted(range(len(dct)), key=lambda i: float(pts[i] @ dir))
+		ofs = [0.0]
+		for a, b in zip(order[:-1], order[1:]):
+			ofs.append(ofs[-1] + float(np.linalg.norm(np.array(dct[b][1]) - np.array(dct[a][1]))))
+		if ofs[-1] <= 0:
+			assert straightRelax(uvs, cos) is None
+			continue
+		scl = np.linalg.norm(pts[order[-1]] - pts[order[0]]) / ofs[-1]
+		kpd = {k: pts[order[0]] + dir * o * scl for k, o in zip(order, ofs)}
+		expected = np.array([kpd[dct.index((uv, co))] for uv, co in zip(uvs.tolist(), cos.tolist())])
+
+		assert np.allclose(straightRelax(uvs, cos), expected, atol=1e-12)
+		checked += 1
+	assert 250 < checked
@@ -0,0 +1,90 @@
+#
+# uv_auditモジュールのテスト。
+#
+
+import numpy as np
+
+import uv_audit
+import uv_raster
+
+
+#-------------------------------------------------------
+
+# 距離がmaxDist未満の線分の組が、候補の組に全て含まれること
+def test_candidatePairs_coversNearPairs():
+	rng = np.random.default_rng(0)
+	for _ in range(100):
+		n = int(rng.integers(2, 40))
+		maxDist = float(rng.choice((0.5, 2.0, 4.0)))
+		p0 = rng.random((n, 2)) * 30
+		p1 = p0 + (rng.random((n, 2)) - 0.5) * rng.choice((1.0, 10.0, 40.0))
+		if rng.random() < 0.3: p1[:,0] = p0[:,0]		# 縦の線分
+		if rng.random() < 0.3: p1[:,1] = p0[:,1]		# 横の線分
+
+		found = set()
+		for a, b in uv_audit._candidatePairs(p0, p1, maxDist):
+			found.update(zip(np.minimum(a, b).tolist(), np.maximum(a, b).tolist()))
+
+		a, b = np.triu_indices(n, 1)
+		d = uv_audit.segmentDistances(p0[a], p1[a], p0[b], p1[b])
+		for i, j in zip(a[d < maxDist].tolist(), b[d < maxDist].tolist()):
+			assert (i, j) in found
+
+# 長い斜めの線分でも、登録するセル数が長さに比例すること
+def test_segmentCells_linearInLength():
+	for length in (100.0, 1000.0, 10000.0):
+		p0 = np.array([[0.0, 0.0]])
+		p1 = np.array([[length, length * 0.7]])
+		seg, cx, cy = uv_audit._segmentCells(p0, p1, 2.0, 1.0)
+		assert len(seg) < length * 2
+
+# ラベルの異なる線分同士の最小距離が、全ての組を比較したものと一致すること
+def test_minSegmentDistance_matchesBruteForce():
+	rng = np.random.default_rng(1)
+	for _ in range(100):
+		n = int(rng.integers(2, 30))
+		p0 = rng.random((n, 2)) * 50
+		p1 = p0 + (rng.random((n, 2)) - 0.5) * 20
+		labels = rng.integers(0, 3, n)
+		maxDist = 8.0
+
+		a, b = np.triu_indices(n, 1)
+		isOther = labels[a] != labels[b]
+		d = uv_audit.segmentDistances(p0[a], p1[a], p0[b], p1[b])[isOther]
+		expected = float(d.min()) if len(d) and d.min() < maxDist else None
+
+		dist, _ = uv_audit.minSegmentDistance(p0, p1, labels, maxDist)
+		if expected is None: assert dist is None
+		else: assert dist == expected
+
+# 滲みが起きる距離が、Island Previewでマージンが重なる距離と一致すること。
+# ピクセルとの位置関係で、1テクセル分の範囲では重なるかどうかが変わる
+def test_bleedDistance_matchesRaster():
+	size = 64
+	tris = np.array(((0,1,2), (0,2,3), (4,5,6), (4,6,7)))
+	lines = np.array(((0,1), (1,2), (2,3), (3,0), (4,5), (5,6), (6,7), (7,4)))
+	def isOverlap(mip, gap, ofs):
+		x0 = 10 + ofs
+		x1 = x0 + 8
+		x2 = x1 + gap
+		x3 = x2 + 8
+		uvs = np.array(((x0,10), (x1,10), (x1,30), (x0,30), (x2,10), (x3,10), (x3,30), (x2,30))) / size
+		img = uv_raster.rasterizeIslands(uvs, tris, lines, size, np.array((0,0,1,1)), np.repeat((0,1), 4))
+		return uv_raster.paddingReport(img, uv_raster.mipPaddingRadius(mip))["overlapPixels"] != 0
+
+	rng = np.random.default_rng(2)
+	for mip in (1, 2):
+		dist = uv_audit.bleedDistance(mip)
+		for ofs in rng.random(10):
+			assert not isOverlap(mip, dist, ofs)
+			assert not isOverlap(mip, dist + 0.3, ofs)
+			assert isOverlap(mip, dist - 1.01, ofs)
+			assert isOverlap(mip, dist - 1.5, ofs)
+
+# 初めて滲みが起きるミップレベルが、bleedDistanceの境界で切り替わること
+def test_bleedMipLevel_boundaries():
+	assert uv_audit.bleedMipLevel(0.0) == 0
+	for mip in range(5):
+		dist = uv_audit.bleedDistance(mip)
+		assert uv_audit.bleedMipLevel(dist - 1e-6) == mip
+		assert uv_audit.bleedMipLevel(dist) == mip + 1
@@ -0,0 +1,55 @@
+#
+# uv_rasterモジュールのテスト。
+#
+
+import numpy as np
+
+import uv_raster
+
+
+#-------------------------------------------------------
+
+# 膨張シェーダと同じ手順のJump Floodingが、正方形範囲の膨張と一致すること
+def test_jumpFloodMask_matchesDilateMask():
+	rng = np.random.default_rng(0)
+	for _ in range(300):
+		h, w = rng.integers(4, 80, size=2)
+		radius = int(rng.integers(0, 70))
+		mask = rng.random((h, w)) < rng.choice((0.002, 0.01, 0.05, 0.3))
+		assert np.array_equal(uv_raster.jumpFloodMask(mask, radius), uv_raster.dilateMask(mask, radius))
+
+# パス数が半径の対数に比例すること
+def test_jumpFloodSteps():
+	assert uv_raster.jumpFloodSteps(0) == [1]
+	assert uv_raster.jumpFloodSteps(1) == [1]
+	assert uv_raster.jumpFloodSteps(255) == [128, 64, 32, 16, 8, 4, 2, 1]
+	assert uv_raster.jumpFloodSteps(256) == [256, 128, 64, 32, 16, 8, 4, 2, 1]
+
+# ミップレベル0では、外周線の範囲より外側には膨張させないこと
+def test_mipPaddingRadius():
+	assert uv_raster.mipPaddingRadius(0) == 0
+	assert uv_raster.mipPaddingRadius(3) == 7
+
+# 外周線の範囲が、ピクセル中心から線分までのチェビシェフ距離がEDGE_BLEED_PIXELS以下のピクセルと一致すること
+def test_edgeBleedTriangles_coverage():
+	rng = np.random.default_rng(1)
+	size = 32
+	uvs = rng.random((5, 2)) * 0.8 + 0.1
+	lines = np.stack((np.arange(5), (np.arange(5) + 1) % 5), axis=1)
+	img = np.full((size, size), -1, dtype=np.int64)
+	verts, tris, lineIdx = uv_raster.edgeBleedTriangles(uvs, lines, uv_raster.EDGE_BLEED_PIXELS / size)
+	uv_raster.rasterizeTriangles(verts, tris, np.zeros(len(tris), dtype=np.int64), img)
+
+	# 線分上を細かくサンプルして、各ピクセル中心とのチェビシェフ距離の最小値を求める
+	t = np.linspace(0, 1, 4001)[:,None]
+	pts = np.concatenate([uvs[a] * (1-t) + uvs[b] * t for a, b in lines]) * size
+	ys, xs = np.mgrid[0:size, 0:size]
+	centers = np.stack((xs.ravel(), ys.ravel()), axis=1) + 0.5
+	dist = np.full(len(centers), np.inf)
+	for chunk in np.array_split(pts, 20):
+		dist = np.minimum(dist, np.abs(centers[:,None,:] - chunk[None]).max(axis=2).min(axis=1))
+	dist = dist.reshape(size, size)
+
+	covered = img >= 0
+	assert np.all(covered[dist < uv_raster.EDGE_BLEED_PIXELS - 0.001])
+	assert not np.any(covered[dist > uv_raster.EDGE_BLEED_PIXELS + 0.001])
@@ -0,0 +1,125 @@
+#
+# uv_rasterモジュールの、ラベル画像のゴールデンイメージテスト。
+#
+# 固定のUV配置から作成したアイランド画像と膨張結果を文字で表した画像にし、
+# tests/golden 以下に保存したものと比較する。画像は上がV=1側。
+#	.		: 塗られていないピクセル
+#	A,B,...	: アイランド本体（三角形と外周線の範囲）
+#	a,b,...	: 膨張で追加されたマージン
+#	#		: 複数アイランドのマージンが重なっているピクセル
+# 意図して結果を変えた場合は、環境変数 UPDATE_GOLDEN=1 を指定して実行すると保存し直す。
+#
+
+import os
+import numpy as np
+import pytest
+
+import uv_raster
+from uv_array import UVSnapshot
+
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "golden")
+
+
+#-------------------------------------------------------
+
+# 面ごとの頂点UVのリストから、UVスナップショットを作る。同じUV座標の頂点は同じ頂点とする
+def _makeSnapshot(faces):
+	uvs = np.array([uv for face in faces for uv in face], dtype=np.float64)
+	faceTotal = np.array([len(face) for face in faces])
+	faceStart = np.cumsum(faceTotal) - faceTotal
+	_, loopVert = np.unique(uvs, axis=0, return_inverse=True)
+	loopVert = loopVert.reshape(-1)
+	nxt = np.arange(len(uvs)) + 1
+	nxt[faceStart + faceTotal - 1] = faceStart
+	_, loopEdge = np.unique(np.sort(np.stack((loopVert, loopVert[nxt]), axis=1), axis=1), axis=0, return_inverse=True)
+	return UVSnapshot(
+		uvs, np.zeros(len(uvs), dtype=bool), loopVert, loopEdge.reshape(-1),
+		np.zeros(len(uvs), dtype=bool), faceStart, faceTotal,
+		np.zeros((len(uvs), 3)), [0, len(uvs)] )
+
+# UVスナップショットのアイランド画像と膨張結果を、文字で表した画像にする
+def _renderText(snap, size, radius):
+	faceIsland, _ = snap.faceIslands()
+	tris = snap.triangles()
+	lines = snap.faceLines()
+	img = uv_raster.rasterizeIslands(
+		snap.uv, tris, lines, size,
+		faceIsland[snap.loopFace[tris[:,0]]],
+		faceIsland[snap.loopFace[lines[:,0]]] )
+	imgMin, imgMax = uv_raster.dilateLabels(img, radius)
+
+	rows = []
+	for y in reversed(range(size)):
+		row = ""
+		for x in range(size):
+			if imgMax[y, x] < 0: row += "."
+			elif imgMin[y, x] != imgMax[y, x]: row += "#"
+			elif 0 <= img[y, x]: row += chr(ord("A") + int(img[y, x]))
+			else: row += chr(ord("a") + int(imgMax[y, x]))
+		rows.append(row)
+	return "\n".join(rows) + "\n"
+
+# テストケース一覧。 {名前: (面のUVのリスト, 画像サイズ, 膨張半径)}
+CASES = {
+	# ピクセル境界からずれた位置にある、1枚の四角形
+	"quad": (
+		[[(0.23, 0.27), (0.61, 0.27), (0.61, 0.58), (0.23, 0.58)]],
+		16, uv_raster.mipPaddingRadius(1) ),
+
+	# 隙間が2ピクセル弱しかない、2つのアイランド。マージンが重なる
+	"close_islands": (
+		[	[(0.10, 0.20), (0.40, 0.20), (0.40, 0.80), (0.10, 0.80)],
+			[(0.51, 0.15), (0.90, 0.30), (0.85, 0.75), (0.52, 0.70)] ],
+		20, uv_raster.mipPaddingRadius(2) ),
+
+	# 2つの三角形で1つのアイランドになる四角形と、ピクセル中心をほとんど含まない細長い三角形
+	"sliver": (
+		[	[(0.10, 0.10), (0.45, 0.10), (0.45, 0.45)],
+			[(0.10, 0.10), (0.45, 0.45), (0.10, 0.45)],
+			[(0.55, 0.12), (0.93, 0.88), (0.57, 0.16)] ],
+		16, uv_raster.mipPaddingRadius(1) ),
+
+	# 辺がピクセル中心をちょうど通る、三角形。辺上のピクセル中心は塗られる
+	"pixel_center_edges": (
+		[[(2.5/12, 2.5/12), (9.5/12, 2.5/12), (2.5/12, 9.5/12)]],
+		12, uv_raster.mipPaddingRadius(0) ),
+}
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_golden(name):
+	faces, size, radius = CASES[name]
+	text = _renderText(_makeSnapshot(faces), size, radius)
+
+	path = os.path.join(GOLDEN_DIR, "uv_raster_" + name + ".txt")
+	if os.environ.get("UPDATE_GOLDEN"):
+		os.makedirs(GOLDEN_DIR, exist_ok=True)
+		with open(path, "w", encoding="utf-8", newline="\n") as f: f.write(text)
+	with open(path, encoding="utf-8") as f:
+		assert text == f.read()
+
+# 三角形の塗りつぶしが、全ピクセル中心に対する素朴な内外判定と一致すること
+def test_rasterizeTriangles_matchesBruteForce():
+	rng = np.random.default_rng(2)
+	for k in range(200):
+		size = int(rng.integers(4, 40))
+		triNum = int(rng.integers(1, 20))
+		uvs = rng.random((triNum*3, 2)) * 1.2 - 0.1
+		if k % 2 == 0: uvs = (np.floor(uvs * size) + 0.5) / size		# 頂点をピクセル中心に置く
+		tris = np.arange(triNum*3).reshape(-1, 3)
+		img = np.full((size, size), -1, dtype=np.int64)
+		uv_raster.rasterizeTriangles(uvs, tris, np.arange(triNum), img)
+
+		expected = np.full((size, size), -1, dtype=np.int64)
+		ys, xs = np.mgrid[0:size, 0:size]
+		c = np.stack((xs, ys), axis=-1).astype(np.float64)
+		p = uvs * size - 0.5
+		for i, (a, b, d) in enumerate(p[tris]):
+			area = (b[0]-a[0]) * (d[1]-a[1]) - (b[1]-a[1]) * (d[0]-a[0])
+			if area == 0: continue
+			# 辺関数の丸め誤差で頂点の外側が内側と判定されることがあるので、頂点の範囲内に限る
+			inside = np.all((np.minimum(np.minimum(a, b), d) <= c) & (c <= np.maximum(np.maximum(a, b), d)), axis=-1)
+			for e0, e1 in ((a, b), (b, d), (d, a)):
+				inside &= ((e1[0]-e0[0]) * (c[...,1]-e0[1]) - (e1[1]-e0[1]) * (c[...,0]-e0[0])) * np.sign(area) >= 0
+			expected[inside] = i
+		assert np.array_equal(img, expected)